@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+class AdaptiveRateLimiter:
+    """Token bucket whose refill rate follows GitLab's rate-limit headers.
+
+    Starts at max_rate requests/s. After each response, RateLimit-Remaining / RateLimit-Reset give the rate the
+    server will still accept until the window resets; the bucket is slowed to that (with some headroom) and recovers
+    additively toward max_rate once the headers show room again. A 429 halves the rate and blocks every caller
+    until Retry-After has passed.
+    """
+
+    def __init__(self, max_rate, burst=None, min_rate=0.5):
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.rate = max_rate
+        self.burst = burst or max(1, int(max_rate))
+        self._tokens = float(self.burst)
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """Takes a token and returns 0.0 if a request may be sent now, else the seconds to wait before asking again."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            if now >= self._blocked_until and self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return max(self._blocked_until - now, (1 - self._tokens) / self.rate)
+
+    def acquire(self):
+        """Blocks until a request may be sent. Returns the seconds spent waiting."""
+        waited = 0.0
+        while True:
+            pause = self.try_acquire()
+            if not pause: return waited
+            time.sleep(pause); waited += pause
+
+    def observe(self, status_code, headers):
+        now = time.monotonic()
+        with self._lock:
+            if status_code == 429:
+                self.rate = max(self.min_rate, self.rate / 2)
+                try: retry_after = float(headers.get('Retry-After', 1))
+                except ValueError: retry_after = 1.0
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+                return
+            remaining = headers.get('RateLimit-Remaining'); reset_at = headers.get('RateLimit-Reset')
+            if remaining is None or reset_at is None:
+                self.rate = min(self.max_rate, self.rate + 0.5)
+                return
+            try:
+                seconds_to_reset = max(1.0, float(reset_at) - time.time())
+                sustainable = 0.8 * int(remaining) / seconds_to_reset
+            except ValueError:
+                return
+            self.rate = max(self.min_rate, min(self.max_rate, sustainable, self.rate + 0.5))
+
+class InstrumentedSession(requests.Session):
+    """requests.Session for one GitLab instance: a keep-alive pool sized for the worker threads that share it,
+    an AdaptiveRateLimiter in front of every request, and request/latency/throttle counters for the status API.
+    observer(name, method, url, status_code_or_None, seconds), if given, is called after every request."""
+
+    def __init__(self, name, max_rate, pool_size, latency_samples=1000, observer=None):
+        super().__init__()
+        self.name = name
+        self.observer = observer
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True)
+        self.mount('http://', adapter); self.mount('https://', adapter)
+        self.limiter = AdaptiveRateLimiter(max_rate) if max_rate else None
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=latency_samples)
+        self.request_count = 0; self.errors = 0; self.rate_limited = 0
+        self.throttle_waits = 0; self.throttle_seconds = 0.0
+        self.rate_limit_remaining = None
+
+    def request(self, method, url, *args, **kwargs):
+        waited = self.limiter.acquire() if self.limiter else 0.0
+        started_at = time.monotonic()
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except requests.exceptions.RequestException:
+            self.record(method, url, None, time.monotonic() - started_at, waited)
+            raise
+        self.record(method, url, response.status_code, time.monotonic() - started_at, waited, response.headers)
+        return response
+
+    def record(self, method, url, status_code, latency, waited=0.0, headers=None):
+        """Counts one request (status_code None: no response) in the stats, the observer and the limiter.
+        Also used by async_api.AsyncGitLab, so both clients share one rate budget and one set of figures."""
+        if self.observer: self.observer(self.name, method, url, status_code, latency)
+        with self._stats_lock: self.request_count += 1
+        if status_code is None:
+            with self._stats_lock: self.errors += 1
+            return
+        headers = headers or {}
+        if self.limiter: self.limiter.observe(status_code, headers)
+        with self._stats_lock:
+            self._latencies.append(latency)
+            if waited > 0: self.throttle_waits += 1; self.throttle_seconds += waited
+            if status_code == 429: self.rate_limited += 1
+            elif status_code >= 500: self.errors += 1
+            remaining = headers.get('RateLimit-Remaining')
+            if remaining is not None: self.rate_limit_remaining = remaining
+
+    def stats(self):
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            def percentile(p): return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1) if latencies else None
+            return {"requests": self.request_count, "errors": self.errors, "rate_limited": self.rate_limited,
+                    "latency_ms": {"p50": percentile(0.5), "p90": percentile(0.9), "p99": percentile(0.99)},
+                    "throttle_waits": self.throttle_waits, "throttle_seconds": round(self.throttle_seconds, 1),
+                    "current_rate_limit": round(self.limiter.rate, 2) if self.limiter else None,
+                    "rate_limit_remaining": self.rate_limit_remaining}
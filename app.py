@@ -1,10 +1,12 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, render_template, request, jsonify, redirect, url_for, Response
 import migration_logic 
+from migration_scope import MigrationScope
+from status_events import StatusEventBroadcaster
 import threading
+import re
 import os
-import io
-import pandas as pd
-from fpdf import FPDF
+import hmac
+import report_writer
 from flask import send_file
 from dotenv import load_dotenv
 
@@ -21,6 +23,9 @@ def add_header(r):
     return r
 
 
+# One publisher serves every /events client: state deltas are computed and serialized once per tick.
+status_events = StatusEventBroadcaster(migration_logic.get_status_snapshot, interval=0.5)
+
 migration_thread = None
 is_migration_task_active_flask_flag = False # Flask app's view of an active task
 
@@ -36,10 +41,21 @@ def index():
     }
     with migration_logic.state_lock:
         current_status = migration_logic.current_migration_state["status"]
-        initial_is_migrating = current_status in ["initializing", "migrating_users", "migrating_groups", "migrating_projects"]
+        initial_is_migrating = current_status in ["initializing", "planning", "migrating_users", "migrating_groups", "migrating_projects"]
     return render_template('index.html', config=config_display, is_migrating_initial=initial_is_migrating)
 
 
+def _scope_from_request(payload):
+    """Wave scope from a JSON "scope" object ({"groups", "patterns", "regexes", "project_ids"}), the same keys as form
+    fields, and/or an uploaded scope_csv file. Returns None for the whole instance; raises ValueError if it is malformed."""
+    scope_data = payload.get('scope') if isinstance(payload.get('scope'), dict) else {key: payload.get(key) for key in ("groups", "patterns", "regexes", "project_ids") if payload.get(key)}
+    try:
+        scope = MigrationScope.from_dict(scope_data)
+        uploaded = request.files.get('scope_csv')
+        if uploaded: scope = scope.merged(MigrationScope.from_csv(uploaded.read().decode('utf-8-sig')))
+    except (TypeError, re.error) as e: raise ValueError(f"invalid scope: {e}")
+    return scope or None
+
 @app.route('/start-migration', methods=['POST'])
 def start_migration_route():
     global migration_thread, is_migration_task_active_flask_flag
@@ -51,10 +67,21 @@ def start_migration_route():
         migration_logic._log_and_update_state("Attempt to start migration while task is already active.", log_type="warning", action="Migration already running")
         return jsonify({"status": "warning", "message": "Migration is already in progress."}), 200
     
+    # Resume from the checkpoint unless the caller explicitly asks for a fresh run ({"resume": false} or resume=0).
+    payload = request.get_json(silent=True) or request.form
+    resume_requested = str(payload.get('resume', request.args.get('resume', 'true'))).lower() not in ('0', 'false', 'no')
+    # mode=delta re-syncs projects that already have data on the target; omitted -> MIGRATION_DELTA_SYNC default.
+    requested_mode = payload.get('mode', request.args.get('mode'))
+    delta_sync_requested = None if requested_mode is None else str(requested_mode).lower() == 'delta'
+    # use_plan=true executes the plan written by /plan-migration instead of re-enumerating the old instance.
+    use_plan = str(payload.get('use_plan', request.args.get('use_plan', 'false'))).lower() in ('1', 'true', 'yes')
+    try: scope = _scope_from_request(payload)
+    except ValueError as e: return jsonify({"status": "error", "message": str(e)}), 400
+
     # Reset for a new run
     with migration_logic.state_lock:
         migration_logic.current_migration_state["status"] = "initializing"
-        migration_logic.current_migration_state["logs"] = []
+        migration_logic.log_buffer.clear()
         migration_logic.current_migration_state["error_message"] = None
         migration_logic.current_migration_state["stats"] = {
             "users": {"total": 0, "completed": 0, "current_item_name": ""},
@@ -65,13 +92,13 @@ def start_migration_route():
         migration_logic.OLD_TO_NEW_USER_ID_MAP = {}
         migration_logic.CREATED_PROJECT_PATHS_IN_NEW_NAMESPACE = {}
 
-    migration_logic._log_and_update_state("Received request to start migration.", action="Initiating migration", set_status="initializing")
+    migration_logic._log_and_update_state(f"Received request to start migration (resume={resume_requested}, mode={requested_mode or 'default'}, plan={use_plan}, scope={scope.describe() if scope else 'whole instance'}).", action="Initiating migration", set_status="initializing")
     is_migration_task_active_flask_flag = True
 
     def migration_task_wrapper():
         global is_migration_task_active_flask_flag
         try:
-            migration_logic.run_full_migration() 
+            migration_logic.run_full_migration(resume=resume_requested, delta_sync=delta_sync_requested, plan_path=migration_logic.PLAN_FILE_PATH if use_plan else None, scope=scope)
         except Exception as e:
             migration_logic._log_and_update_state(f"CRITICAL THREAD ERROR: Migration task failed: {e}", log_type="error", error_msg=str(e), set_status="error")
         finally:
@@ -87,85 +114,141 @@ def start_migration_route():
     
     return jsonify({"status": "success", "message": "Migration process initiated in background."})
 
+@app.route('/plan-migration', methods=['POST'])
+def plan_migration_route():
+    # Dry run: enumerates both instances and writes MIGRATION_PLAN_FILE without changing anything on the target.
+    global migration_thread, is_migration_task_active_flask_flag
+    if is_migration_task_active_flask_flag and migration_thread and migration_thread.is_alive():
+        return jsonify({"status": "warning", "message": "A migration or plan is already in progress."}), 200
+    try: scope = _scope_from_request(request.get_json(silent=True) or request.form)
+    except ValueError as e: return jsonify({"status": "error", "message": str(e)}), 400
+    migration_logic._log_and_update_state("Received request to plan migration (dry run).", action="Planning migration", set_status="planning")
+    is_migration_task_active_flask_flag = True
+
+    def plan_task_wrapper():
+        global is_migration_task_active_flask_flag
+        try:
+            migration_logic.run_migration_plan(scope=scope)
+        except Exception as e:
+            migration_logic._log_and_update_state(f"CRITICAL THREAD ERROR: Planning failed: {e}", log_type="error", error_msg=str(e), set_status="error")
+        finally:
+            is_migration_task_active_flask_flag = False
+
+    migration_thread = threading.Thread(target=plan_task_wrapper, daemon=True)
+    migration_thread.start()
+    return jsonify({"status": "success", "message": "Migration planning started in background."})
+
+@app.route('/download-plan', methods=['GET'])
+def download_plan():
+    if not os.path.exists(migration_logic.PLAN_FILE_PATH):
+        return jsonify({"status": "error", "message": "No migration plan has been created yet."}), 404
+    return send_file(os.path.abspath(migration_logic.PLAN_FILE_PATH), download_name="migration_plan.json", as_attachment=True, mimetype='application/json')
+
 @app.route('/get-status', methods=['GET'])
 def get_status_json():
-    with migration_logic.state_lock:
-        state_copy = dict(migration_logic.current_migration_state)
-    return jsonify(state_copy)
+    # ?since=<seq> returns only log entries newer than seq (use last_log_seq from the previous response).
+    since_seq = request.args.get('since', type=int)
+    return jsonify(migration_logic.get_status_snapshot(since_seq))
+
+@app.route('/events', methods=['GET'])
+def status_event_stream():
+    # Server-Sent Events: a "snapshot" event, then "delta" events ({state: changed keys, logs: new lines, last_log_seq}).
+    # EventSource resends the last id as Last-Event-ID on reconnect, so only missed log lines are replayed.
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    return Response(status_events.stream(last_event_id), mimetype='text/event-stream', headers={"X-Accel-Buffering": "no"})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # Prometheus scrape target: API/git/stage latency histograms plus the run's counters.
+    return Response(migration_logic.render_prometheus_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/profiler/start', methods=['POST'])
+def start_profiler():
+    # Samples every thread's stack until /profiler/stop; ?interval_ms= overrides MIGRATION_PROFILER_INTERVAL_MS, ?reset=1 drops earlier samples.
+    interval_ms = request.args.get('interval_ms', type=float)
+    if request.args.get('reset') == '1': migration_logic.profiler.reset()
+    started = migration_logic.profiler.start(interval_ms / 1000 if interval_ms else None)
+    return jsonify({"status": "success" if started else "warning", "message": "Profiler started." if started else "Profiler is already running.", "profiler": migration_logic.profiler.status()})
+
+@app.route('/profiler/stop', methods=['POST'])
+def stop_profiler():
+    stopped = migration_logic.profiler.stop()
+    return jsonify({"status": "success" if stopped else "warning", "message": "Profiler stopped." if stopped else "Profiler is not running.", "profiler": migration_logic.profiler.status()})
+
+@app.route('/profiler', methods=['GET'])
+def profiler_samples():
+    # Collapsed stacks for flamegraph.pl / speedscope; ?format=json returns the hottest functions instead.
+    if request.args.get('format') == 'json':
+        top = [{"function": frame, "self_samples": own, "total_samples": total} for frame, own, total in migration_logic.profiler.top(request.args.get('limit', 30, type=int))]
+        return jsonify({"profiler": migration_logic.profiler.status(), "top": top})
+    return Response(migration_logic.profiler.folded(), mimetype='text/plain')
+
+def _worker_queue_or_error():
+    # Remote transfer workers authenticate with MIGRATION_WORKER_TOKEN; without it the /worker/* endpoints are disabled.
+    token = migration_logic.WORKER_TOKEN
+    if not token: return None, (jsonify({"status": "error", "message": "Remote workers are disabled (MIGRATION_WORKER_TOKEN is not set)."}), 403)
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"): return None, (jsonify({"status": "error", "message": "Invalid worker token."}), 401)
+    return migration_logic.transfer_queue, None
+
+def _worker_body():
+    # Every /worker/* call acts on behalf of one worker; without its ID a heartbeat or result can't be matched to a lease.
+    body = request.get_json(silent=True) or {}
+    if not isinstance(body.get('worker_id'), str) or not body['worker_id']: return None, (jsonify({"status": "error", "message": "worker_id is required."}), 400)
+    return body, None
+
+@app.route('/worker/claim', methods=['POST'])
+def worker_claim():
+    job_queue, error = _worker_queue_or_error()
+    if error: return error
+    body, error = _worker_body()
+    if error: return error
+    jobs = job_queue.claim(body['worker_id'], max(1, int(body.get('limit') or 1)), body.get('slots')) if job_queue else []
+    return jsonify({"jobs": jobs, "lease_seconds": migration_logic.WORKER_LEASE_SECONDS})
+
+@app.route('/worker/heartbeat', methods=['POST'])
+def worker_heartbeat():
+    job_queue, error = _worker_queue_or_error()
+    if error: return error
+    body, error = _worker_body()
+    if error: return error
+    return jsonify({"held": job_queue.heartbeat(body['worker_id'], body.get('progress') or {}) if job_queue else []})
+
+@app.route('/worker/complete', methods=['POST'])
+def worker_complete():
+    job_queue, error = _worker_queue_or_error()
+    if error: return error
+    body, error = _worker_body()
+    if error: return error
+    accepted = bool(job_queue) and job_queue.complete(body['worker_id'], body.get('project_id'), body.get('result') or {"ok": False, "detail": "Worker sent no result"})
+    return jsonify({"accepted": accepted})
+
+def _cached_report(extension, build):
+    run_id, generation, done_repos, failed_repos = migration_logic.report_snapshot()
+    return migration_logic.report_cache.get(run_id or "idle", generation, extension, lambda path: build(done_repos, failed_repos, path))
 
 @app.route('/download-report/xls', methods=['GET'])
 def download_report_xls():
-    failed_repos = migration_logic.FAILED_REPOS
-    done_repos = migration_logic.DONE_REPOS
-    
-    all_repos = []
-    for r in done_repos:
-        all_repos.append({"Repo Name": r.get("Repo Name"), "Old URL": r.get("Old URL"), "Status": "Success", "Details": "Migrated successfully"})
-    for r in failed_repos:
-        all_repos.append({"Repo Name": r.get("Repo Name"), "Old URL": r.get("Old URL"), "Status": "Failed", "Details": r.get("Reason", "Unknown")})
-        
-    if not all_repos:
-        all_repos = [{"Repo Name": "None", "Old URL": "N/A", "Status": "N/A", "Details": "No migrations attempted."}]
-        
-    df = pd.DataFrame(all_repos)
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Migration Report')
-    output.seek(0)
-    return send_file(output, download_name="migration_report.xlsx", as_attachment=True, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    # Rendered once per (run, generation) from a consistent snapshot, then served from REPORT_CACHE_DIR.
+    path = _cached_report("xlsx", lambda done, failed, target: report_writer.write_xlsx(report_writer.report_rows(done, failed), target))
+    return send_file(os.path.abspath(path), download_name="migration_report.xlsx", as_attachment=True, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+@app.route('/download-report/csv', methods=['GET'])
+def download_report_csv():
+    # Streamed row by row; the same columns as the XLS report.
+    _, _, done_repos, failed_repos = migration_logic.report_snapshot()
+    return Response(report_writer.iter_csv(report_writer.report_rows(done_repos, failed_repos)), mimetype='text/csv',
+                    headers={"Content-Disposition": "attachment; filename=migration_report.csv"})
+
+@app.route('/download-report/ndjson', methods=['GET'])
+def download_report_ndjson():
+    _, _, done_repos, failed_repos = migration_logic.report_snapshot()
+    return Response(report_writer.iter_ndjson(report_writer.report_rows(done_repos, failed_repos)), mimetype='application/x-ndjson',
+                    headers={"Content-Disposition": "attachment; filename=migration_report.ndjson"})
 
 @app.route('/download-report/pdf', methods=['GET'])
 def download_report_pdf():
-    failed_repos = migration_logic.FAILED_REPOS
-    done_repos = migration_logic.DONE_REPOS
-    
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", style='B', size=14)
-    pdf.cell(200, 10, txt="GitLab Migration Execution Report", ln=True, align='C')
-    pdf.ln(5)
-    
-    # Successful Repos
-    pdf.set_font("Arial", style='B', size=12)
-    pdf.set_text_color(16, 185, 129) # Emerald green
-    pdf.cell(200, 10, txt=f"Successfully Migrated Repositories ({len(done_repos)})", ln=True)
-    pdf.set_text_color(0, 0, 0)
-    
-    if not done_repos:
-        pdf.set_font("Arial", size=10)
-        pdf.cell(200, 8, txt="No successful repository migrations recorded.", ln=True)
-    else:
-        for idx, repo in enumerate(done_repos, 1):
-            pdf.set_font("Arial", style='B', size=10)
-            pdf.cell(200, 6, txt=f"{idx}. {repo.get('Repo Name', 'Unknown')}", ln=True)
-            pdf.set_font("Arial", size=9)
-            pdf.cell(200, 5, txt=f"URL: {repo.get('Old URL', 'Unknown')}", ln=True)
-            pdf.ln(3)
-            
-    pdf.ln(5)
-    
-    # Failed Repos
-    pdf.set_font("Arial", style='B', size=12)
-    pdf.set_text_color(239, 68, 68) # Red
-    pdf.cell(200, 10, txt=f"Failed Migrations ({len(failed_repos)})", ln=True)
-    pdf.set_text_color(0, 0, 0)
-    
-    if not failed_repos:
-        pdf.set_font("Arial", size=10)
-        pdf.cell(200, 8, txt="No failures recorded.", ln=True)
-    else:
-        for idx, repo in enumerate(failed_repos, 1):
-            pdf.set_font("Arial", style='B', size=10)
-            pdf.cell(200, 6, txt=f"{idx}. {repo.get('Repo Name', 'Unknown')}", ln=True)
-            pdf.set_font("Arial", size=9)
-            pdf.cell(200, 5, txt=f"URL: {repo.get('Old URL', 'Unknown')}", ln=True)
-            pdf.multi_cell(0, 5, txt=f"Reason: {repo.get('Reason', 'Unknown')}")
-            pdf.ln(3)
-
-    output = io.BytesIO()
-    output.write(pdf.output(dest='S').encode('latin-1'))
-    output.seek(0)
-    return send_file(output, download_name="migration_report.pdf", as_attachment=True, mimetype='application/pdf')
+    path = _cached_report("pdf", report_writer.write_pdf)
+    return send_file(os.path.abspath(path), download_name="migration_report.pdf", as_attachment=True, mimetype='application/pdf')
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5001, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,112 @@
+import asyncio
+import random
+import threading
+import time
+
+import aiohttp
+
+MAX_RATE_LIMIT_RETRIES = 10 # same budget python-gitlab gives 429s
+# A 429 without a usable Retry-After waits base * 2^attempt seconds (capped), jittered so retries don't arrive together.
+RATE_LIMIT_BACKOFF_BASE_SECONDS = 0.5
+RATE_LIMIT_BACKOFF_MAX_SECONDS = 60.0
+
+def _rate_limit_delay(headers, attempt):
+    """Seconds to wait before retrying a 429: Retry-After if the server sent seconds, else jittered exponential back-off."""
+    try: return max(0.0, float(headers.get("Retry-After")))
+    except (TypeError, ValueError): pass
+    return min(RATE_LIMIT_BACKOFF_MAX_SECONDS, RATE_LIMIT_BACKOFF_BASE_SECONDS * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+class AsyncEngine:
+    """One asyncio event loop on a background thread.
+
+    Worker threads hand it batches of coroutines (gather()) and block only for the batch, so hundreds of API
+    calls can be in flight from the loop thread instead of needing a pool thread each.
+    """
+
+    def __init__(self, name="async-engine"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name=name, daemon=True)
+        self._thread.start()
+
+    def run(self, coro, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def gather(self, coros, timeout=None):
+        """Results of coros run concurrently, in order; a failed coroutine's exception takes its place."""
+        async def gather_all(): return await asyncio.gather(*coros, return_exceptions=True)
+        return self.run(gather_all(), timeout)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop); self._thread.join(); self.loop.close()
+
+class AsyncGitLabError(Exception):
+    def __init__(self, response_code, error_message):
+        super().__init__(f"{response_code}: {error_message}")
+        self.response_code = response_code
+        self.error_message = error_message
+
+class AsyncGitLab:
+    """Minimal aiohttp client for one instance's REST API (JSON in, JSON out).
+
+    Requests go through the instance's InstrumentedSession limiter and counters (session.record), so they share
+    the synchronous client's rate budget and appear in the same API metrics. At most max_in_flight run at once.
+    """
+
+    def __init__(self, base_url, token, session, max_in_flight, timeout=60):
+        self.api_url = base_url.rstrip("/") + "/api/v4"
+        self.token = token
+        self.session = session
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self._client = None # created on the engine's loop by the first request
+        self._slots = None
+
+    def _ensure_client(self):
+        if self._client is None:
+            # ssl=False: like the python-gitlab clients, accept self-signed certificates on either instance.
+            connector = aiohttp.TCPConnector(limit=self.max_in_flight, ssl=False)
+            self._client = aiohttp.ClientSession(headers={"PRIVATE-TOKEN": self.token}, connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        return self._client
+
+    async def _throttle(self):
+        waited = 0.0
+        while self.session.limiter:
+            pause = self.session.limiter.try_acquire()
+            if not pause: break
+            await asyncio.sleep(pause); waited += pause
+        return waited
+
+    async def request(self, method, path, params=None, json=None):
+        """(body, headers) of a 2xx response. Retries 429s after Retry-After (or a jittered exponential back-off when the
+        server sends none), then through the limiter; raises AsyncGitLabError otherwise."""
+        client = self._ensure_client(); url = self.api_url + path
+        params = {key: str(value).lower() if isinstance(value, bool) else value for key, value in (params or {}).items()}
+        async with self._slots:
+            for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+                waited = await self._throttle(); started_at = time.monotonic()
+                try:
+                    async with client.request(method, url, params=params, json=json) as response:
+                        body = await response.json(content_type=None) if response.content_length != 0 else None
+                        status, headers = response.status, response.headers
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    self.session.record(method, url, None, time.monotonic() - started_at, waited); raise
+                self.session.record(method, url, status, time.monotonic() - started_at, waited, headers)
+                if status != 429 or attempt == MAX_RATE_LIMIT_RETRIES: break
+                await asyncio.sleep(_rate_limit_delay(headers, attempt))
+        if status >= 400:
+            message = body.get("message") or body.get("error") if isinstance(body, dict) else body
+            raise AsyncGitLabError(status, message)
+        return body, headers
+
+    async def list_all(self, path, per_page=100, **params):
+        """Every item of an offset-paginated listing (follows X-Next-Page)."""
+        items = []; page = 1
+        while page:
+            body, headers = await self.request("GET", path, {**params, "per_page": per_page, "page": page})
+            items.extend(body or [])
+            page = int(headers.get("X-Next-Page") or 0)
+        return items
+
+    async def close(self):
+        if self._client is not None: await self._client.close(); self._client = None
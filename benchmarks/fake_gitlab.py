@@ -0,0 +1,456 @@
+"""Local stand-in for the parts of the GitLab REST API and git HTTP transport used by migration_logic.
+
+Everything lives in memory. API requests can be slowed down (latency_ms) and rate limited (rate_limit
+requests/s, answered with 429 + RateLimit-* headers like GitLab does). Repositories are served with
+`git http-backend`: every source project points at one of a few template bare repos (symlinked on first
+access, so 100k projects cost nothing until they are cloned) and every target project gets an empty
+bare repo on its first push. GET /_bench/stats returns request counters per endpoint.
+"""
+import bisect
+import json
+import os
+import random
+import re
+import subprocess
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlencode, urlsplit
+
+ROOT_USER_ID = 1
+
+def _truthy(value):
+    return str(value).lower() in ("1", "true", "yes")
+
+class FakeGitLab:
+    """In-memory users/groups/projects/members of one instance plus its request counters."""
+
+    def __init__(self, git_root, template_repos=(), latency_ms=0, rate_limit=0):
+        self.git_root = git_root
+        self.template_repos = list(template_repos) # [(bare repo path, size in bytes)]
+        self.latency_ms = latency_ms
+        self.rate_limit = rate_limit
+        self.lock = threading.Lock()
+        self.users = {ROOT_USER_ID: {"id": ROOT_USER_ID, "username": "root", "email": "root@example.com", "name": "Administrator", "state": "active"}}
+        self.groups = {}
+        self.projects = {}
+        self.project_templates = {} # project ID -> template repo path (source instance only)
+        self.project_ids_by_path = {}
+        self._namespaces = None # cached namespace list, rebuilt after users/groups change
+        self.members = {} # ("groups" | "projects", id) -> {user ID: access level}
+        self._next_id = 1000
+        self.counters = Counter()
+        self.rate_limited = 0
+        self._window = (0, 0) # (second, requests in that second)
+
+    # --- Seeding ---
+    def new_id(self):
+        self._next_id += 1
+        return self._next_id
+
+    def add_user(self, username, email=None, name=None):
+        user_id = self.new_id()
+        self.users[user_id] = {"id": user_id, "username": username, "email": email or f"{username}@example.com", "name": name or username, "state": "active"}
+        self._namespaces = None
+        return self.users[user_id]
+
+    def add_group(self, name, path, parent_id=None, visibility="private", description=""):
+        parent = self.groups.get(parent_id) if parent_id else None
+        full_path = f"{parent['full_path']}/{path}" if parent else path
+        group_id = self.new_id()
+        self.groups[group_id] = {"id": group_id, "name": name, "path": path, "full_path": full_path, "parent_id": parent_id if parent else None,
+                                 "visibility": visibility, "description": description, "web_url": f"/groups/{full_path}"}
+        self.members[("groups", group_id)] = {}
+        self._namespaces = None
+        return self.groups[group_id]
+
+    def _namespace_of(self, namespace_id):
+        if namespace_id in self.groups:
+            g = self.groups[namespace_id]
+            return {"id": g["id"], "name": g["name"], "path": g["path"], "kind": "group", "full_path": g["full_path"], "parent_id": g["parent_id"]}
+        user = self.users.get(namespace_id) or self.users[ROOT_USER_ID]
+        return {"id": user["id"], "name": user["name"], "path": user["username"], "kind": "user", "full_path": user["username"], "parent_id": None}
+
+    def add_project(self, name, path, namespace_id=None, visibility="private", description="", template=None, forked_from_id=None):
+        namespace = self._namespace_of(namespace_id or ROOT_USER_ID)
+        project_id = self.new_id()
+        path_with_namespace = f"{namespace['full_path']}/{path}"
+        repo_size = template[1] if template else 0
+        self.projects[project_id] = {
+            "id": project_id, "name": name, "path": path, "path_with_namespace": path_with_namespace, "namespace": namespace,
+            "description": description, "visibility": visibility, "archived": False, "empty_repo": template is None,
+            "ssh_url_to_repo": f"git@fake:{path_with_namespace}.git", "http_url_to_repo": f"/{path_with_namespace}.git",
+            "shared_with_groups": [], "statistics": {"repository_size": repo_size, "lfs_objects_size": 0, "storage_size": repo_size}}
+        if forked_from_id: self.link_fork(project_id, forked_from_id)
+        if template: self.project_templates[project_id] = template[0]
+        self.project_ids_by_path[path_with_namespace] = project_id
+        self.members[("projects", project_id)] = {}
+        return self.projects[project_id]
+
+    def link_fork(self, project_id, forked_from_id):
+        parent = self.projects[forked_from_id]
+        self.projects[project_id]["forked_from_project"] = {key: parent[key] for key in ("id", "name", "path", "path_with_namespace")}
+
+    def namespaces(self):
+        if self._namespaces is None:
+            self._namespaces = [self._namespace_of(group_id) for group_id in self.groups] + [self._namespace_of(user_id) for user_id in self.users]
+        return self._namespaces
+
+    # --- Request accounting ---
+    def admit(self, endpoint, limited=True):
+        """Counts the request; returns rate-limit headers, or None when the request must get a 429."""
+        with self.lock:
+            self.counters[endpoint] += 1
+            if not (self.rate_limit and limited): return {}
+            now = int(time.time())
+            second, count = self._window
+            if second != now: second, count = now, 0
+            count += 1; self._window = (second, count)
+            headers = {"RateLimit-Limit": str(self.rate_limit), "RateLimit-Remaining": str(max(0, self.rate_limit - count)), "RateLimit-Reset": str(now + 1)}
+            if count > self.rate_limit:
+                self.rate_limited += 1
+                return None
+            return headers
+
+    def stats(self):
+        with self.lock:
+            return {"requests": sum(self.counters.values()), "rate_limited": self.rate_limited, "by_endpoint": dict(self.counters),
+                    "users": len(self.users), "groups": len(self.groups), "projects": len(self.projects)}
+
+    def reset_stats(self):
+        with self.lock: self.counters.clear(); self.rate_limited = 0
+
+    # --- Repositories ---
+    def repo_dir_for(self, repo_path, for_push):
+        """Bare repo on disk for '<path_with_namespace>.git', created/linked on first use; None if no such project."""
+        path_with_namespace = repo_path[:-len(".git")]
+        with self.lock:
+            project = self.projects.get(self.project_ids_by_path.get(path_with_namespace))
+            if project is None: return None
+            if for_push: project["empty_repo"] = False
+            template = self.project_templates.get(project["id"])
+            fork_parent = self.projects.get((project.get("forked_from_project") or {}).get("id"))
+        target = os.path.join(self.git_root, repo_path)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if template:
+                try: os.symlink(template, target)
+                except FileExistsError: pass
+            else:
+                subprocess.run(["git", "init", "--bare", "--quiet", target], check=True)
+                parent_repo = os.path.join(self.git_root, f"{fork_parent['path_with_namespace']}.git") if fork_parent else None
+                if parent_repo and os.path.isdir(parent_repo): # like GitLab's object pools: the fork borrows its parent's objects
+                    with open(os.path.join(target, "objects", "info", "alternates"), "w") as f: f.write(os.path.join(os.path.abspath(parent_repo), "objects") + "\n")
+        return target
+
+def _paginate(handler, items, query):
+    """Offset or keyset (pagination=keyset, order_by=id) pagination with GitLab's headers."""
+    per_page = max(1, min(100, int(query.get("per_page", 20))))
+    if query.get("pagination") == "keyset": # items are stored in ID order already
+        start = bisect.bisect_right([item["id"] for item in items], int(query.get("id_after", 0)))
+        page_items = items[start:start + per_page]
+        headers = {}
+        if start + per_page < len(items):
+            headers["Link"] = f'<{handler.base_url()}{handler.path_only}?{urlencode({**query, "id_after": page_items[-1]["id"]})}>; rel="next"'
+        return page_items, headers
+    page = max(1, int(query.get("page", 1)))
+    total = len(items); total_pages = max(1, -(-total // per_page))
+    page_items = items[(page - 1) * per_page:page * per_page]
+    headers = {"X-Total": str(total), "X-Total-Pages": str(total_pages), "X-Page": str(page), "X-Per-Page": str(per_page)}
+    if page < total_pages:
+        headers["X-Next-Page"] = str(page + 1)
+        headers["Link"] = f'<{handler.base_url()}{handler.path_only}?{urlencode({**query, "page": page + 1})}>; rel="next"'
+    return page_items, headers
+
+def _search(items, query, *fields):
+    term = (query.get("search") or "").lower()
+    return [item for item in items if any(term in str(item.get(field, "")).lower() for field in fields)] if term else items
+
+def _member_json(gitlab, user_id, access_level):
+    user = gitlab.users.get(user_id, {})
+    return {"id": user_id, "username": user.get("username"), "name": user.get("name"), "state": "active", "access_level": access_level}
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    gitlab = None # set per server
+
+    def log_message(self, *args): pass
+
+    def base_url(self):
+        return f"http://{self.headers.get('Host')}"
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip() or b"0", 16)
+                if size == 0: self.rfile.readline(); break
+                chunks.append(self.rfile.read(size)); self.rfile.readline()
+            return b"".join(chunks)
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _send(self, status, body=b"", headers=None, content_type="application/json"):
+        if not isinstance(body, bytes): body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items(): self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self): self._dispatch("GET")
+    def do_POST(self): self._dispatch("POST")
+    def do_PUT(self): self._dispatch("PUT")
+
+    def _dispatch(self, method):
+        parts = urlsplit(self.path)
+        self.path_only = parts.path
+        query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        body = self._read_body()
+        if parts.path.startswith("/_bench/"):
+            if parts.path == "/_bench/stats": return self._send(200, self.gitlab.stats())
+            if parts.path == "/_bench/reset": self.gitlab.reset_stats(); return self._send(200, {})
+            return self._send(404, {"message": "404 Not Found"})
+        if parts.path.startswith("/api/v4/"): return self._api(method, parts.path[len("/api/v4"):], query, body)
+        return self._git(method, parts.path, parts.query, body)
+
+    # --- REST API ---
+    ROUTES = [(method, re.compile(pattern), name) for method, pattern, name in (
+        ("GET", r"/user", "get_current_user"),
+        ("GET", r"/users", "list_users"), ("POST", r"/users", "create_user"),
+        ("GET", r"/users/(?P<id>\d+)", "get_user"),
+        ("GET", r"/users/(?P<id>\d+)/projects", "list_user_projects"),
+        ("GET", r"/namespaces", "list_namespaces"),
+        ("GET", r"/groups", "list_groups"), ("POST", r"/groups", "create_group"),
+        ("GET", r"/groups/(?P<id>[^/]+)", "get_group"),
+        ("GET", r"/groups/(?P<id>[^/]+)/subgroups", "list_subgroups"),
+        ("GET", r"/groups/(?P<id>[^/]+)/descendant_groups", "list_descendant_groups"),
+        ("GET", r"/groups/(?P<id>[^/]+)/projects", "list_group_projects"),
+        ("GET", r"/projects", "list_projects"), ("POST", r"/projects", "create_project"),
+        ("GET", r"/projects/(?P<id>[^/]+)", "get_project"),
+        ("POST", r"/projects/(?P<id>\d+)/fork/(?P<forked_from_id>\d+)", "create_fork_relation"),
+        ("GET", r"/(?P<kind>groups|projects)/(?P<id>[^/]+)/members(?P<all>/all)?", "list_members"),
+        ("POST", r"/(?P<kind>groups|projects)/(?P<id>[^/]+)/members", "add_member"),
+        ("PUT", r"/(?P<kind>groups|projects)/(?P<id>[^/]+)/members/(?P<user_id>\d+)", "update_member"),
+    )]
+
+    def _api(self, method, path, query, body):
+        route = next(((name, match) for route_method, pattern, name in self.ROUTES
+                      if route_method == method and (match := pattern.fullmatch(path))), None)
+        endpoint = f"{method} {route[0] if route else path}"
+        rate_headers = self.gitlab.admit(endpoint)
+        if rate_headers is None:
+            return self._send(429, {"message": "429 Too Many Requests"}, {"Retry-After": "1", "RateLimit-Remaining": "0", "RateLimit-Reset": str(int(time.time()) + 1)})
+        if self.gitlab.latency_ms: time.sleep(self.gitlab.latency_ms / 1000)
+        if not route: return self._send(404, {"message": "404 Not Found"}, rate_headers)
+        try: data = json.loads(body) if body else {}
+        except ValueError: data = {key: values[-1] for key, values in parse_qs(body.decode()).items()}
+        with self.gitlab.lock:
+            status, payload, headers = getattr(self, f"_api_{route[0]}")(query, data, **route[1].groupdict())
+        self._send(status, payload, {**rate_headers, **headers})
+
+    def _group(self, group_id):
+        group_id = unquote(group_id)
+        if group_id.isdigit(): return self.gitlab.groups.get(int(group_id))
+        return next((g for g in self.gitlab.groups.values() if g["full_path"] == group_id), None)
+
+    def _api_get_current_user(self, query, data):
+        return 200, self.gitlab.users[ROOT_USER_ID], {}
+
+    def _api_list_users(self, query, data):
+        users = _search(list(self.gitlab.users.values()), query, "username", "email", "name")
+        if query.get("username"): users = [u for u in users if u["username"] == query["username"]]
+        return (200, *_paginate(self, users, query))
+
+    def _api_get_user(self, query, data, id):
+        user = self.gitlab.users.get(int(id))
+        return (200, user, {}) if user else (404, {"message": "404 User Not Found"}, {})
+
+    def _api_list_user_projects(self, query, data, id):
+        if int(id) not in self.gitlab.users: return 404, {"message": "404 User Not Found"}, {}
+        projects = [p for p in self.gitlab.projects.values() if p["namespace"]["kind"] == "user" and p["namespace"]["id"] == int(id)]
+        page_items, headers = _paginate(self, projects, query)
+        return 200, [self._project_json(p, query) for p in page_items], headers
+
+    def _api_create_user(self, query, data):
+        if any(u["username"].lower() == str(data.get("username", "")).lower() for u in self.gitlab.users.values()):
+            return 409, {"message": "Username has already been taken"}, {}
+        return 201, self.gitlab.add_user(data["username"], data.get("email"), data.get("name")), {}
+
+    def _api_list_namespaces(self, query, data):
+        return (200, *_paginate(self, _search(self.gitlab.namespaces(), query, "path", "name"), query))
+
+    def _api_list_groups(self, query, data):
+        groups = list(self.gitlab.groups.values())
+        if _truthy(query.get("top_level_only")): groups = [g for g in groups if g["parent_id"] is None]
+        return (200, *_paginate(self, _search(groups, query, "path", "name"), query))
+
+    def _api_create_group(self, query, data):
+        parent_id = int(data["parent_id"]) if data.get("parent_id") else None
+        if parent_id and parent_id not in self.gitlab.groups: return 404, {"message": "404 Parent Group Not Found"}, {}
+        if any(g["parent_id"] == parent_id and g["path"].lower() == data["path"].lower() for g in self.gitlab.groups.values()):
+            return 400, {"message": {"path": ["has already been taken"]}}, {}
+        return 201, self.gitlab.add_group(data["name"], data["path"], parent_id, data.get("visibility", "private"), data.get("description", "")), {}
+
+    def _api_get_group(self, query, data, id):
+        group = self._group(id)
+        return (200, group, {}) if group else (404, {"message": "404 Group Not Found"}, {})
+
+    def _api_list_subgroups(self, query, data, id):
+        group = self._group(id)
+        if not group: return 404, {"message": "404 Group Not Found"}, {}
+        children = [g for g in self.gitlab.groups.values() if g["parent_id"] == group["id"]]
+        return (200, *_paginate(self, _search(children, query, "path", "name"), query))
+
+    def _descendant_ids(self, group_id):
+        ids = []; pending = [group_id]
+        while pending:
+            parent_id = pending.pop()
+            children = [g["id"] for g in self.gitlab.groups.values() if g["parent_id"] == parent_id]
+            ids += children; pending += children
+        return ids
+
+    def _api_list_descendant_groups(self, query, data, id):
+        group = self._group(id)
+        if not group: return 404, {"message": "404 Group Not Found"}, {}
+        return (200, *_paginate(self, [self.gitlab.groups[group_id] for group_id in sorted(self._descendant_ids(group["id"]))], query))
+
+    def _api_list_group_projects(self, query, data, id):
+        group = self._group(id)
+        if not group: return 404, {"message": "404 Group Not Found"}, {}
+        namespace_ids = {group["id"], *(self._descendant_ids(group["id"]) if _truthy(query.get("include_subgroups")) else ())}
+        projects = [p for p in self.gitlab.projects.values() if p["namespace"]["id"] in namespace_ids]
+        page_items, headers = _paginate(self, _search(projects, query, "path", "name"), query)
+        return 200, [self._project_json(p, query) for p in page_items], headers
+
+    def _project_json(self, project, query):
+        return project if _truthy(query.get("statistics")) else {key: value for key, value in project.items() if key != "statistics"}
+
+    def _api_list_projects(self, query, data):
+        projects = list(self.gitlab.projects.values())
+        if _truthy(query.get("owned")): projects = [p for p in projects if p["namespace"]["kind"] == "user" and p["namespace"]["id"] == ROOT_USER_ID]
+        page_items, headers = _paginate(self, _search(projects, query, "path_with_namespace" if _truthy(query.get("search_namespaces")) else "path", "name"), query)
+        return 200, [self._project_json(p, query) for p in page_items], headers
+
+    def _api_create_project(self, query, data):
+        namespace_id = int(data["namespace_id"]) if data.get("namespace_id") else ROOT_USER_ID
+        if namespace_id not in self.gitlab.groups and namespace_id not in self.gitlab.users: return 404, {"message": "404 Namespace Not Found"}, {}
+        path = data.get("path") or data["name"]
+        if any(p["namespace"]["id"] == namespace_id and p["path"].lower() == path.lower() for p in self.gitlab.projects.values()):
+            return 400, {"message": {"path": ["has already been taken"]}}, {}
+        return 201, self.gitlab.add_project(data["name"], path, namespace_id, data.get("visibility", "private"), data.get("description", "")), {}
+
+    def _api_get_project(self, query, data, id):
+        project = self.gitlab.projects.get(int(id)) if id.isdigit() else self.gitlab.projects.get(self.gitlab.project_ids_by_path.get(unquote(id)))
+        return (200, self._project_json(project, query), {}) if project else (404, {"message": "404 Project Not Found"}, {})
+
+    def _api_create_fork_relation(self, query, data, id, forked_from_id):
+        project = self.gitlab.projects.get(int(id))
+        if project is None or int(forked_from_id) not in self.gitlab.projects: return 404, {"message": "404 Project Not Found"}, {}
+        if project.get("forked_from_project"): return 409, {"message": "Project already forked"}, {}
+        self.gitlab.link_fork(project["id"], int(forked_from_id))
+        return 201, self._project_json(project, query), {}
+
+    def _owner_members(self, kind, owner_id):
+        owner_id = (self._group(owner_id) or {}).get("id") if kind == "groups" else (int(owner_id) if owner_id.isdigit() else None)
+        return owner_id, self.gitlab.members.get((kind, owner_id))
+
+    def _api_list_members(self, query, data, kind, id, all=None):
+        owner_id, members = self._owner_members(kind, id)
+        if members is None: return 404, {"message": "404 Not Found"}, {}
+        levels = dict(members)
+        if all: # inherited membership from the namespace's ancestors
+            if kind == "groups": parent_id = self.gitlab.groups[owner_id]["parent_id"]
+            else: namespace = self.gitlab.projects[owner_id]["namespace"]; parent_id = namespace["id"] if namespace["kind"] == "group" else None
+            while parent_id:
+                for user_id, level in self.gitlab.members[("groups", parent_id)].items(): levels[user_id] = max(level, levels.get(user_id, 0))
+                parent_id = self.gitlab.groups[parent_id]["parent_id"]
+        return (200, *_paginate(self, [_member_json(self.gitlab, user_id, level) for user_id, level in levels.items()], query))
+
+    def _api_add_member(self, query, data, kind, id):
+        _, members = self._owner_members(kind, id)
+        if members is None: return 404, {"message": "404 Not Found"}, {}
+        user_id = int(data["user_id"])
+        if user_id in members: return 409, {"message": "Member already exists"}, {}
+        members[user_id] = int(data["access_level"])
+        return 201, _member_json(self.gitlab, user_id, members[user_id]), {}
+
+    def _api_update_member(self, query, data, kind, id, user_id):
+        _, members = self._owner_members(kind, id)
+        if members is None or int(user_id) not in members: return 404, {"message": "404 Member Not Found"}, {}
+        members[int(user_id)] = int(data["access_level"])
+        return 200, _member_json(self.gitlab, int(user_id), members[int(user_id)]), {}
+
+    # --- git smart HTTP via git http-backend ---
+    def _git(self, method, path, query_string, body):
+        match = re.fullmatch(r"/(?P<repo>.+?\.git)(?P<rest>/.*)", path)
+        is_push = "git-receive-pack" in path or "service=git-receive-pack" in query_string
+        self.gitlab.admit(f"GIT {'push' if is_push else 'fetch'}", limited=False)
+        if not match or not self.gitlab.repo_dir_for(match.group("repo"), for_push=is_push and method == "POST"):
+            return self._send(404, b"Repository not found", content_type="text/plain")
+        env = {**os.environ, "GIT_PROJECT_ROOT": self.gitlab.git_root, "GIT_HTTP_EXPORT_ALL": "1", "REMOTE_USER": "oauth2",
+               "PATH_INFO": path, "QUERY_STRING": query_string, "REQUEST_METHOD": method,
+               "CONTENT_TYPE": self.headers.get("Content-Type", ""), "CONTENT_LENGTH": str(len(body))}
+        if self.headers.get("Content-Encoding"): env["HTTP_CONTENT_ENCODING"] = self.headers["Content-Encoding"]
+        if self.headers.get("Git-Protocol"): env["GIT_PROTOCOL"] = self.headers["Git-Protocol"]
+        result = subprocess.run(["git", "http-backend"], input=body, env=env, capture_output=True)
+        head, _, payload = result.stdout.partition(b"\r\n\r\n")
+        if not _: head, _, payload = result.stdout.partition(b"\n\n")
+        status = 200; headers = {}
+        for line in head.decode("latin-1").splitlines():
+            key, _, value = line.partition(":")
+            if key.lower() == "status": status = int(value.strip().split()[0])
+            elif key.lower() not in ("content-length", "content-type"): headers[key] = value.strip()
+            elif key.lower() == "content-type": headers["Content-Type"] = value.strip()
+        content_type = headers.pop("Content-Type", "application/octet-stream")
+        self._send(status, payload, headers, content_type=content_type)
+
+def serve(gitlab, host="127.0.0.1", port=0):
+    """Starts a threaded server for gitlab in a daemon thread and returns it (server.server_address has the port)."""
+    handler = type("FakeGitLabHandler", (_Handler,), {"gitlab": gitlab})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-gitlab", daemon=True).start()
+    return server
+
+def make_template_repos(directory, count, size_kb):
+    """count bare repos with a few commits and roughly size_kb of incompressible content each: [(path, size_bytes)]."""
+    templates = []
+    for index in range(count):
+        work = os.path.join(directory, f"template-{index}-work"); bare = os.path.join(directory, f"template-{index}.git")
+        subprocess.run(["git", "init", "--quiet", work], check=True)
+        env = {**os.environ, "GIT_AUTHOR_NAME": "bench", "GIT_AUTHOR_EMAIL": "bench@example.com", "GIT_COMMITTER_NAME": "bench", "GIT_COMMITTER_EMAIL": "bench@example.com"}
+        for commit in range(3):
+            with open(os.path.join(work, f"data-{commit}.bin"), "wb") as f: f.write(os.urandom(max(1, size_kb * 1024 // 3)))
+            subprocess.run(["git", "-C", work, "add", "-A"], check=True, env=env)
+            subprocess.run(["git", "-C", work, "commit", "--quiet", "-m", f"commit {commit}"], check=True, env=env)
+        subprocess.run(["git", "-C", work, "tag", "v1"], check=True, env=env)
+        subprocess.run(["git", "clone", "--quiet", "--bare", work, bare], check=True)
+        size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(bare) for name in names)
+        templates.append((bare, size))
+    return templates
+
+def populate(gitlab, users, groups, projects, depth, members_per_owner=3, user_project_ratio=0.1, seed=1, fork_ratio=0.0):
+    """Synthetic org: users, a group tree up to depth levels (about a tenth of the groups top-level),
+    projects spread over groups and user namespaces, each group/project with a few direct members.
+    About fork_ratio of the projects are forks of an earlier one (same repository content)."""
+    rng = random.Random(seed)
+    user_ids = [gitlab.add_user(f"user{index}")["id"] for index in range(users)]
+    levels = [[] for _ in range(depth)]
+    for index in range(groups):
+        level = 0 if index < max(1, groups // 10) or depth == 1 else rng.randrange(1, depth)
+        while level and not levels[level - 1]: level -= 1
+        parent_id = rng.choice(levels[level - 1]) if level else None
+        levels[level].append(gitlab.add_group(f"Group {index}", f"group-{index}", parent_id)["id"])
+    group_ids = [group_id for level in levels for group_id in level]
+    root_projects = []
+    for index in range(projects):
+        namespace_id = rng.choice(user_ids) if user_ids and (not group_ids or rng.random() < user_project_ratio) else rng.choice(group_ids) if group_ids else None
+        template = rng.choice(gitlab.template_repos) if gitlab.template_repos else None
+        fork_of = rng.choice(root_projects) if root_projects and rng.random() < fork_ratio else None
+        if fork_of: template = next((t for t in gitlab.template_repos if t[0] == gitlab.project_templates.get(fork_of)), template)
+        project_id = gitlab.add_project(f"Project {index}", f"project-{index}", namespace_id, template=template, forked_from_id=fork_of)["id"]
+        if not fork_of: root_projects.append(project_id)
+    for key, members in gitlab.members.items():
+        for user_id in rng.sample(user_ids, min(members_per_owner, len(user_ids))): members[user_id] = rng.choice((10, 20, 30, 40))
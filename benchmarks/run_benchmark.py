@@ -0,0 +1,196 @@
+"""Runs run_full_migration (or the dry-run planner) against two local fake GitLab instances and reports
+per-phase duration, throughput, API calls and peak memory.
+
+    python -m benchmarks.run_benchmark --scenario medium --latency-ms 20 --env MIGRATION_PROJECT_WORKERS=8
+
+The fake instances run in a child process so their memory and CPU don't count against the migration.
+MIGRATION_* settings are read by migration_logic at import time, so pass them with --env.
+"""
+import argparse
+import copy
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path: sys.path.insert(0, REPO_ROOT)
+
+from benchmarks import fake_gitlab # noqa: E402
+
+# users / groups / projects on the source instance, and the depth of the group tree
+SCENARIOS = {
+    "tiny": {"users": 10, "groups": 10, "projects": 10, "depth": 2},
+    "small": {"users": 100, "groups": 100, "projects": 100, "depth": 3},
+    "medium": {"users": 1000, "groups": 1000, "projects": 1000, "depth": 4},
+    "large": {"users": 10000, "groups": 10000, "projects": 10000, "depth": 5},
+    "xlarge": {"users": 100000, "groups": 20000, "projects": 100000, "depth": 6},
+}
+PHASES = ("initializing", "planning", "migrating_users", "migrating_groups", "migrating_projects")
+PHASE_ITEMS = {"migrating_users": "users", "migrating_groups": "groups", "migrating_projects": "projects"}
+
+def _serve_fake_instances(config, ready):
+    """Child process: builds and serves the source and target instances until terminated."""
+    templates = fake_gitlab.make_template_repos(config["workdir"], config["repo_templates"], config["repo_size_kb"]) if config["projects"] else []
+    old = fake_gitlab.FakeGitLab(os.path.join(config["workdir"], "old-git"), templates, config["latency_ms"], config["rate_limit"])
+    new = fake_gitlab.FakeGitLab(os.path.join(config["workdir"], "new-git"), (), config["latency_ms"], config["rate_limit"])
+    fake_gitlab.populate(old, config["users"], config["groups"], config["projects"], config["depth"], seed=config["seed"], fork_ratio=config["fork_ratio"])
+    old_server = fake_gitlab.serve(old); new_server = fake_gitlab.serve(new)
+    ready.put((old_server.server_address[1], new_server.server_address[1]))
+    threading.Event().wait()
+
+def _bench_request(base_url, path):
+    with urllib.request.urlopen(f"{base_url}/_bench/{path}", timeout=30) as response: return json.loads(response.read())
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f: return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class _StatusHookDict(dict):
+    """current_migration_state replacement that reports every status change as it happens."""
+
+    def __init__(self, state, on_status):
+        super().__init__(state); self._on_status = on_status
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        if key == "status": self._on_status(value)
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(dict(self), memo)
+
+class PhaseRecorder:
+    """Attributes time, API calls and peak RSS (sampled every interval) to the migration's status phases."""
+
+    def __init__(self, migration_logic, base_urls, interval=0.05):
+        self.ml = migration_logic; self.base_urls = base_urls; self.interval = interval
+        self.phases = {}; self._current = None; self._stop = threading.Event()
+        self._switch_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="bench-sampler", daemon=True)
+
+    def _api_requests(self):
+        return {name: _bench_request(url, "stats") for name, url in self.base_urls.items()}
+
+    def _on_status(self, status):
+        # Called with state_lock held, so it must not touch migration_logic state.
+        with self._switch_lock:
+            if status != self._current: self._switch(status)
+
+    def _switch(self, status):
+        now = time.time(); api = self._api_requests()
+        if self._current:
+            phase = self.phases[self._current]
+            phase["seconds"] += now - phase.pop("_started_at")
+            for name, stats in api.items():
+                started = phase.pop(f"_api_{name}")
+                phase["api_calls"][name] = phase["api_calls"].get(name, 0) + stats["requests"] - started["requests"]
+                phase["rate_limited"][name] = phase["rate_limited"].get(name, 0) + stats["rate_limited"] - started["rate_limited"]
+                for endpoint, count in stats["by_endpoint"].items():
+                    delta = count - started["by_endpoint"].get(endpoint, 0)
+                    if delta: phase["endpoints"][f"{name} {endpoint}"] = phase["endpoints"].get(f"{name} {endpoint}", 0) + delta
+        self._current = status if status in PHASES else None
+        if self._current:
+            phase = self.phases.setdefault(self._current, {"seconds": 0.0, "peak_rss_mb": 0.0, "api_calls": {}, "rate_limited": {}, "endpoints": {}})
+            phase["_started_at"] = now
+            for name, stats in api.items(): phase[f"_api_{name}"] = stats
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss_mb = round(_rss_bytes() / (1024 * 1024), 1)
+            with self._switch_lock:
+                if self._current: self.phases[self._current]["peak_rss_mb"] = max(self.phases[self._current]["peak_rss_mb"], rss_mb)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self.ml.current_migration_state = _StatusHookDict(self.ml.current_migration_state, self._on_status)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set(); self._thread.join()
+        with self._switch_lock:
+            if self._current: self._switch(None)
+        self.ml.current_migration_state = dict(self.ml.current_migration_state)
+
+def run(args):
+    scenario = {**SCENARIOS[args.scenario], **{key: getattr(args, key) for key in ("users", "groups", "projects", "depth") if getattr(args, key) is not None}}
+    workdir = tempfile.mkdtemp(prefix="gitlab-migration-bench-")
+    config = {**scenario, "workdir": workdir, "latency_ms": args.latency_ms, "rate_limit": args.rate_limit,
+              "repo_templates": args.repo_templates, "repo_size_kb": args.repo_size_kb, "seed": args.seed, "fork_ratio": args.fork_ratio}
+    ready = multiprocessing.Queue()
+    server_process = multiprocessing.Process(target=_serve_fake_instances, args=(config, ready), daemon=True)
+    server_process.start()
+    try:
+        old_port, new_port = ready.get(timeout=600)
+        base_urls = {"old": f"http://127.0.0.1:{old_port}", "new": f"http://127.0.0.1:{new_port}"}
+        os.environ.update({"OLD_GITLAB_URL": base_urls["old"], "OLD_GITLAB_TOKEN": "bench-old", "NEW_GITLAB_URL": base_urls["new"], "NEW_GITLAB_TOKEN": "bench-new",
+                           "MIGRATION_CHECKPOINT_DB": os.path.join(workdir, "checkpoint.sqlite3"), "MIGRATION_PLAN_FILE": os.path.join(workdir, "plan.json"),
+                           "GIT_TERMINAL_PROMPT": "0"})
+        for assignment in args.env:
+            key, _, value = assignment.partition("="); os.environ[key] = value
+        os.chdir(workdir) # migration_logic keeps its temp dir relative to the working directory
+        import migration_logic
+        from migration_scope import MigrationScope
+        scope = MigrationScope.from_dict(json.loads(args.scope)) if args.scope else None
+
+        recorder = PhaseRecorder(migration_logic, base_urls)
+        recorder.start()
+        started_at = time.time()
+        if args.dry_run: migration_logic.run_migration_plan(scope=scope)
+        else: migration_logic.run_full_migration(resume=False, scope=scope)
+        total_seconds = time.time() - started_at
+        recorder.stop()
+
+        snapshot = migration_logic.get_status_snapshot()
+        stats = snapshot["stats"]
+        for status, phase in recorder.phases.items():
+            section = PHASE_ITEMS.get(status)
+            items = stats[section]["completed"] if section else 0
+            phase["items"] = items
+            phase["items_per_s"] = round(items / phase["seconds"], 2) if phase["seconds"] and items else 0.0
+            phase["seconds"] = round(phase["seconds"], 2)
+            phase["endpoints"] = dict(sorted(phase["endpoints"].items(), key=lambda item: -item[1]))
+        return {"scenario": args.scenario, "config": {**scenario, "latency_ms": args.latency_ms, "rate_limit": args.rate_limit, "env": args.env, "dry_run": args.dry_run, "scope": args.scope, "fork_ratio": args.fork_ratio},
+                "status": snapshot["status"], "total_seconds": round(total_seconds, 2), "phases": recorder.phases,
+                "failed_projects": stats["projects"].get("failed", 0), "transfer_bytes": snapshot["metrics"].get("data_flowing_bytes", 0),
+                "api_client": snapshot["metrics"].get("api", {})}
+    finally:
+        server_process.terminate()
+
+def print_report(result):
+    print(f"\nScenario '{result['scenario']}' {result['config']} -> {result['status']} in {result['total_seconds']} s "
+          f"({result['failed_projects']} failed projects, {result['transfer_bytes'] / (1024 * 1024):.1f} MB transferred)")
+    print(f"{'phase':<20}{'seconds':>10}{'items':>9}{'items/s':>10}{'API old':>10}{'API new':>10}{'429s':>7}{'peak RSS MB':>13}")
+    for status, phase in result["phases"].items():
+        print(f"{status:<20}{phase['seconds']:>10}{phase['items']:>9}{phase['items_per_s']:>10}{phase['api_calls'].get('old', 0):>10}"
+              f"{phase['api_calls'].get('new', 0):>10}{sum(phase['rate_limited'].values()):>7}{phase['peak_rss_mb']:>13}")
+        for endpoint, count in list(phase["endpoints"].items())[:5]: print(f"    {count:>8}  {endpoint}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS, key=lambda name: SCENARIOS[name]["projects"]), default="small")
+    for key in ("users", "groups", "projects", "depth"): parser.add_argument(f"--{key}", type=int, help=f"override the scenario's {key}")
+    parser.add_argument("--latency-ms", type=float, default=0, help="added to every API request")
+    parser.add_argument("--rate-limit", type=int, default=0, help="API requests/s per instance before 429s (0 = unlimited)")
+    parser.add_argument("--repo-templates", type=int, default=3, help="distinct template repositories shared by the source projects")
+    parser.add_argument("--repo-size-kb", type=int, default=64)
+    parser.add_argument("--fork-ratio", type=float, default=0.0, help="share of source projects that are forks of another project")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="MIGRATION_* setting for this run (repeatable)")
+    parser.add_argument("--dry-run", action="store_true", help="benchmark the planner instead of a full migration")
+    parser.add_argument("--scope", metavar="JSON", help='migrate one wave, e.g. \'{"groups": ["group-1"]}\' (see MigrationScope)')
+    parser.add_argument("--json", metavar="PATH", help="also write the result as JSON")
+    args = parser.parse_args(argv)
+    result = run(args)
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f: json.dump(result, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import sqlite3
+import threading
+import time
+
+# Project states stored in the checkpoint. Only 'done' projects are skipped on resume.
+PROJECT_DONE = "done"
+PROJECT_FAILED = "failed"
+PROJECT_RETRYING = "retrying"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS users (old_id INTEGER PRIMARY KEY, new_id INTEGER NOT NULL, username TEXT, updated_at REAL);
+CREATE TABLE IF NOT EXISTS groups (old_id INTEGER PRIMARY KEY, new_id INTEGER NOT NULL, full_path TEXT, updated_at REAL);
+CREATE TABLE IF NOT EXISTS projects (
+    old_id INTEGER PRIMARY KEY, path_with_namespace TEXT, status TEXT NOT NULL,
+    reason TEXT, attempts INTEGER NOT NULL DEFAULT 0, updated_at REAL, new_id INTEGER
+);
+CREATE TABLE IF NOT EXISTS phases (name TEXT PRIMARY KEY, completed_at REAL);
+"""
+
+class CheckpointStore:
+    """Durable record of migration progress (ID maps, per-project state, finished phases).
+
+    Every write is its own transaction, so a crash loses at most the item that was in flight.
+    The connection is shared between the scheduler and worker threads and serialized by a lock.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock, self._conn:
+            self._conn.executescript(_SCHEMA)
+            # Checkpoints written before target project IDs were recorded (needed to link forks to their parent)
+            if "new_id" not in {row[1] for row in self._conn.execute("PRAGMA table_info(projects)")}:
+                self._conn.execute("ALTER TABLE projects ADD COLUMN new_id INTEGER")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _write(self, sql, params=()):
+        with self._lock, self._conn:
+            self._conn.execute(sql, params)
+
+    def _read(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # --- Run identity ---
+    def get_meta(self, key, default=None):
+        rows = self._read("SELECT value FROM meta WHERE key = ?", (key,))
+        return rows[0][0] if rows else default
+
+    def set_meta(self, key, value):
+        self._write("INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value", (key, str(value)))
+
+    def belongs_to(self, old_url, new_url):
+        """True if the checkpoint was written for this source/target pair."""
+        return self.get_meta("old_url") == (old_url or "") and self.get_meta("new_url") == (new_url or "")
+
+    def reset(self, old_url, new_url):
+        """Drops all recorded progress and stamps the store for a new source/target pair."""
+        with self._lock, self._conn:
+            for table in ("meta", "users", "groups", "projects", "phases"):
+                self._conn.execute(f"DELETE FROM {table}")
+            self._conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)",
+                                   [("old_url", old_url or ""), ("new_url", new_url or ""), ("created_at", str(time.time()))])
+
+    # --- Phases ---
+    def mark_phase_done(self, name):
+        self._write("INSERT OR REPLACE INTO phases (name, completed_at) VALUES (?, ?)", (name, time.time()))
+
+    def is_phase_done(self, name):
+        return bool(self._read("SELECT 1 FROM phases WHERE name = ?", (name,)))
+
+    # --- ID maps ---
+    def record_user(self, old_id, new_id, username=None):
+        self._write("INSERT OR REPLACE INTO users (old_id, new_id, username, updated_at) VALUES (?, ?, ?, ?)", (old_id, new_id, username, time.time()))
+
+    def record_group(self, old_id, new_id, full_path=None):
+        self._write("INSERT OR REPLACE INTO groups (old_id, new_id, full_path, updated_at) VALUES (?, ?, ?, ?)", (old_id, new_id, full_path, time.time()))
+
+    def load_user_map(self):
+        return dict(self._read("SELECT old_id, new_id FROM users"))
+
+    def load_group_map(self):
+        return dict(self._read("SELECT old_id, new_id FROM groups"))
+
+    # --- Projects ---
+    def record_project(self, old_id, path_with_namespace, status, reason=None, attempts=0, new_id=None):
+        self._write(
+            "INSERT OR REPLACE INTO projects (old_id, path_with_namespace, status, reason, attempts, updated_at, new_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (old_id, path_with_namespace, status, reason, attempts, time.time(), new_id))
+
+    def new_project_id(self, old_id):
+        rows = self._read("SELECT new_id FROM projects WHERE old_id = ? AND new_id IS NOT NULL", (old_id,))
+        return rows[0][0] if rows else None
+
+    def done_project_ids(self):
+        return {row[0] for row in self._read("SELECT old_id FROM projects WHERE status = ?", (PROJECT_DONE,))}
+
+    def summary(self):
+        return {
+            "users": self._read("SELECT COUNT(*) FROM users")[0][0],
+            "groups": self._read("SELECT COUNT(*) FROM groups")[0][0],
+            "projects": dict(self._read("SELECT status, COUNT(*) FROM projects GROUP BY status")),
+        }
@@ -0,0 +1,37 @@
+from collections import defaultdict
+
+def fork_parent_id(attrs):
+    """Old ID of the project attrs (a stub's attributes dict) was forked from, or None."""
+    return ((attrs or {}).get('forked_from_project') or {}).get('id')
+
+class ForkGate:
+    """Holds forks back until their fork parent has finished, when both are part of the same run.
+
+    The child's mirror can then borrow the parent mirror's objects (clone --reference) instead of downloading them
+    again, and the fork relation can be created on the target before the child is pushed. Parents that are not in the
+    run (other waves, done in a previous run, not visible to the token) don't hold anything back.
+    Only the scheduler thread touches it.
+    """
+
+    def __init__(self):
+        self._unfinished = set()
+        self._held = defaultdict(list) # parent ID -> [(stub, size_bytes)]
+        self.forks_seen = 0
+
+    def __len__(self):
+        return sum(len(children) for children in self._held.values())
+
+    def admit(self, stub, size_bytes):
+        """Registers a project entering the run. False if it is held until its parent finishes."""
+        self._unfinished.add(stub.id)
+        parent_id = fork_parent_id(stub.attributes)
+        if parent_id is None: return True
+        self.forks_seen += 1
+        if parent_id not in self._unfinished: return True
+        self._held[parent_id].append((stub, size_bytes))
+        return False
+
+    def finish(self, project_id):
+        """Marks a project as done for good (migrated or given up); returns the forks released by it."""
+        self._unfinished.discard(project_id)
+        return self._held.pop(project_id, [])
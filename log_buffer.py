@@ -0,0 +1,38 @@
+import itertools
+import threading
+from collections import deque
+
+class LogRingBuffer:
+    """Fixed-capacity log store with monotonically increasing sequence numbers.
+
+    Appends take a tiny private lock so sequence numbers land in the buffer in order; they never touch
+    state_lock and are O(1). Reads are lock-free: list(deque) is a single C call under the GIL.
+    Sequence numbers keep increasing across clear(), so a client cursor stays valid after a reset.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._entries = deque(maxlen=capacity)
+        self._seq = itertools.count(1)
+        self._append_lock = threading.Lock()
+
+    def append(self, timestamp, message, log_type, wall_time):
+        with self._append_lock:
+            entry = {"seq": next(self._seq), "id": wall_time, "timestamp": timestamp, "message": message, "type": log_type}
+            self._entries.append(entry)
+        return entry
+
+    def clear(self):
+        with self._append_lock: self._entries.clear() # never between handing out a seq and storing its entry
+
+    def since(self, seq=None):
+        """Entries newer than seq (all retained entries if seq is None), oldest first. O(new entries)."""
+        snapshot = list(self._entries)
+        if seq is None: return snapshot
+        start = len(snapshot)
+        while start > 0 and snapshot[start - 1]["seq"] > seq: start -= 1
+        return snapshot[start:]
+
+    def last_seq(self):
+        snapshot = list(self._entries)
+        return snapshot[-1]["seq"] if snapshot else 0
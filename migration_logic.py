@@ -1,13 +1,36 @@
 import gitlab
 import os
+import sys
 import subprocess
 import shutil
 import time
 from dotenv import load_dotenv
 import json
+import copy
 import threading
+import queue
 import re
-from collections import deque
+from contextlib import contextmanager
+from types import SimpleNamespace
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import checkpoint_store
+import migration_plan
+from migration_scope import MigrationScope
+from gitlab.v4.objects import Project
+from api_client import InstrumentedSession
+import retry_policy
+from namespace_cache import NamespaceCache
+from log_buffer import LogRingBuffer
+from project_lanes import ProjectLanes
+from transfer_meter import TransferMeter, PROGRESS_PHASE_KINDS, parse_progress_bytes
+import timing_metrics
+from timing_metrics import TimingRegistry
+from sampling_profiler import SamplingProfiler
+from work_queue import LeaseQueue
+from workspace_manager import ScratchVolume, WorkspaceFull, WorkspaceManager, missing_alternates
+import report_writer
+import fork_network
 
 load_dotenv()
 
@@ -31,6 +54,117 @@ if TARGET_PARENT_GROUP_ID_ON_NEW_FOR_ALL_STR:
         print(f"WARNING: TARGET_PARENT_GROUP_ID_ON_NEW_FOR_ALL ('{TARGET_PARENT_GROUP_ID_ON_NEW_FOR_ALL_STR}') not valid. Groups will be created at top level.")
 
 MIGRATION_TEMP_DIR = "./gitlab_migration_temp_python_v7"
+# Bare mirrors keyed by old project ID; kept across runs so repeated syncs only fetch/push the delta.
+MIRROR_CACHE_DIR = os.path.join(MIGRATION_TEMP_DIR, "mirror_cache")
+REPORT_CACHE_DIR = os.path.join(MIGRATION_TEMP_DIR, "reports") # rendered XLS/PDF reports, see report_writer.ReportCache
+DELTA_PUSH_BATCH_SIZE = 200
+# Delta-sync: also sync projects whose target repository already has data (default for runs started without an explicit mode).
+DELTA_SYNC_DEFAULT = os.getenv('MIGRATION_DELTA_SYNC', 'false').lower() in ('1', 'true', 'yes')
+# SQLite file recording ID maps and per-project progress so an interrupted run can be resumed.
+CHECKPOINT_DB_PATH = os.getenv('MIGRATION_CHECKPOINT_DB', './migration_checkpoint.sqlite3')
+# Dry-run plan written by run_migration_plan() and optionally executed by run_full_migration(plan_path=...)
+PLAN_FILE_PATH = os.getenv('MIGRATION_PLAN_FILE', './migration_plan.json')
+
+def _int_from_env(name, default, minimum=1):
+    raw = os.getenv(name)
+    if not raw: return default
+    try:
+        return max(minimum, int(raw))
+    except (ValueError, TypeError):
+        print(f"WARNING: {name} ('{raw}') not valid. Using default {default}.")
+        return default
+
+# --- Concurrency ---
+# PROJECT_WORKERS: projects migrated at the same time.
+# API_CONCURRENCY / GIT_CONCURRENCY: cap on concurrent GitLab API sections and git subprocess sections across all workers.
+PROJECT_WORKERS = _int_from_env('MIGRATION_PROJECT_WORKERS', 4)
+API_CONCURRENCY = _int_from_env('MIGRATION_API_CONCURRENCY', PROJECT_WORKERS)
+GIT_CONCURRENCY = _int_from_env('MIGRATION_GIT_CONCURRENCY', PROJECT_WORKERS)
+MAX_PROJECT_RETRIES = _int_from_env('MIGRATION_MAX_RETRIES', 6, minimum=0)
+# Failed projects wait base * class multiplier * 2^attempt seconds (capped, with jitter) before retrying; see retry_policy.
+RETRY_BASE_DELAY_SECONDS = _int_from_env('MIGRATION_RETRY_BASE_DELAY_SECONDS', 5)
+RETRY_MAX_DELAY_SECONDS = _int_from_env('MIGRATION_RETRY_MAX_DELAY_SECONDS', 300)
+# Lookups of a project the target says exists ("has already been taken") before it counts as missing; 1 s, 2 s, ... apart,
+# since a project created moments ago (or by a request whose response was lost) may not be searchable yet.
+FIND_EXISTING_PROJECT_ATTEMPTS = 3
+USER_CREATE_CONCURRENCY = _int_from_env('MIGRATION_USER_CREATE_CONCURRENCY', 4)
+USER_LIST_PAGE_SIZE = 100
+MEMBER_SYNC_CONCURRENCY = _int_from_env('MIGRATION_MEMBER_SYNC_CONCURRENCY', 8)
+# Sibling groups created on the target in parallel, one tree level at a time
+GROUP_SYNC_CONCURRENCY = _int_from_env('MIGRATION_GROUP_CONCURRENCY', API_CONCURRENCY)
+GROUP_LIST_PAGE_SIZE = 100
+
+# --- Repository transfer ---
+# Clones/fetches and pushes hold separate slots (GIT_CONCURRENCY / GIT_PUSH_CONCURRENCY), so the next project's
+# clone runs while the previous one is still pushing.
+GIT_PUSH_CONCURRENCY = _int_from_env('MIGRATION_GIT_PUSH_CONCURRENCY', GIT_CONCURRENCY)
+# Push LFS objects while the pack push is running instead of before it.
+PARALLEL_LFS_PUSH = os.getenv('MIGRATION_PARALLEL_LFS_PUSH', 'true').lower() in ('1', 'true', 'yes')
+GIT_OUTPUT_TAIL_LINES = 200 # stdout/stderr lines kept per git command for error messages
+# Fork-aware transfers: forks wait for their parent, clone against the parent's cached mirror (--reference) and are
+# linked to it on the target, so shared objects are downloaded once and GitLab can deduplicate them.
+FORK_DEDUP = os.getenv('MIGRATION_FORK_DEDUP', 'true').lower() in ('1', 'true', 'yes')
+
+# --- Workspace (disk space for cached mirrors) ---
+# Each project's clone/fetch first reserves its expected size (statistics + MIGRATION_WORKSPACE_OVERHEAD_PERCENT) on a
+# scratch volume that keeps MIGRATION_DISK_RESERVE_MB free; projects wait (or idle mirrors are evicted) when none has room.
+# Extra volumes: MIGRATION_SCRATCH_DIRS (comma-separated), and MIGRATION_TMPFS_DIR for repositories up to MIGRATION_TMPFS_MAX_REPO_MB.
+SCRATCH_DIRS = [path.strip() for path in os.getenv('MIGRATION_SCRATCH_DIRS', '').split(',') if path.strip()]
+TMPFS_DIR = os.getenv('MIGRATION_TMPFS_DIR') or None
+TMPFS_MAX_REPO_BYTES = _int_from_env('MIGRATION_TMPFS_MAX_REPO_MB', 64) * 1024 * 1024
+DISK_RESERVE_BYTES = _int_from_env('MIGRATION_DISK_RESERVE_MB', 1024, minimum=0) * 1024 * 1024
+WORKSPACE_OVERHEAD_PERCENT = _int_from_env('MIGRATION_WORKSPACE_OVERHEAD_PERCENT', 50, minimum=0)
+# Delete least recently used cached mirrors (they only speed up later delta syncs) instead of waiting when disk runs short.
+MIRROR_EVICTION = os.getenv('MIGRATION_MIRROR_EVICTION', 'true').lower() in ('1', 'true', 'yes')
+
+# --- Size-aware scheduling ---
+# Projects of at least MIGRATION_LARGE_PROJECT_MB (repository + LFS, from project statistics) go to a largest-first
+# lane limited to MIGRATION_LARGE_PROJECT_SLOTS workers; everything else streams through the remaining workers.
+LARGE_PROJECT_BYTES = _int_from_env('MIGRATION_LARGE_PROJECT_MB', 1024) * 1024 * 1024
+LARGE_PROJECT_SLOTS = _int_from_env('MIGRATION_LARGE_PROJECT_SLOTS', max(1, PROJECT_WORKERS // 4))
+
+# --- Transfer metrics ---
+# window_speed_mb_s in the status metrics is averaged over this many seconds (avg_speed_mb_s covers the whole run).
+TRANSFER_RATE_WINDOW_SECONDS = _int_from_env('MIGRATION_RATE_WINDOW_SECONDS', 30)
+# The projects phase ETA divides the bytes left by the completed-bytes throughput of this many recent seconds.
+ETA_WINDOW_SECONDS = _int_from_env('MIGRATION_ETA_WINDOW_SECONDS', 300)
+# Aggregate transfer rate the dry-run planner assumes when estimating the duration of a run
+PLAN_THROUGHPUT_MB_S = _int_from_env('MIGRATION_PLAN_THROUGHPUT_MB_S', 20)
+# Sampling interval of the profiler that can be switched on during a run (POST /profiler/start)
+PROFILER_INTERVAL_MS = _int_from_env('MIGRATION_PROFILER_INTERVAL_MS', 10)
+
+# --- API clients ---
+# Per-instance request rate ceiling (req/s); the limiter slows below it when GitLab's RateLimit headers ask for it. 0 disables.
+API_MAX_REQUESTS_PER_SECOND = _int_from_env('MIGRATION_API_RATE_LIMIT', 30, minimum=0)
+# Keep-alive connections per instance: enough for every thread that can call the API at once.
+HTTP_POOL_SIZE = _int_from_env('MIGRATION_HTTP_POOL_SIZE', API_CONCURRENCY + MEMBER_SYNC_CONCURRENCY + USER_CREATE_CONCURRENCY + 2)
+# Member writes and batched target lookups run as coroutines on one asyncio loop (needs aiohttp); otherwise on worker threads.
+ASYNC_API = os.getenv('MIGRATION_ASYNC_API', 'true').lower() in ('1', 'true', 'yes')
+# Requests the asyncio loop keeps in flight against the target (still paced by MIGRATION_API_RATE_LIMIT)
+ASYNC_MAX_IN_FLIGHT = _int_from_env('MIGRATION_ASYNC_MAX_IN_FLIGHT', 64)
+
+# --- Project listing ---
+PROJECT_LIST_PAGE_SIZE = 100 # GitLab's maximum per_page
+# Upper bound on listed-but-not-started project stubs held in memory; the lister blocks when the queue is full.
+PROJECT_FEED_MAXSIZE = _int_from_env('MIGRATION_PROJECT_FEED_SIZE', 5 * PROJECT_LIST_PAGE_SIZE)
+
+# --- Distributed transfer workers ---
+# With MIGRATION_DISTRIBUTED, this process stays the coordinator (listing, API work, ID maps, checkpoints, reports) and
+# hands each repository clone/push to worker processes through a lease queue (see work_queue / migration_worker).
+DISTRIBUTED = os.getenv('MIGRATION_DISTRIBUTED', 'false').lower() in ('1', 'true', 'yes')
+WORK_QUEUE_DB_PATH = os.getenv('MIGRATION_WORK_QUEUE_DB', './migration_work_queue.sqlite3')
+# Worker processes started on this machine for each run; 0 relies on workers started elsewhere.
+LOCAL_WORKERS = _int_from_env('MIGRATION_LOCAL_WORKERS', 2, minimum=0)
+# Concurrent transfers per worker process; by default the local workers together take MIGRATION_PROJECT_WORKERS jobs.
+WORKER_SLOTS = _int_from_env('MIGRATION_WORKER_SLOTS', -(-PROJECT_WORKERS // max(1, LOCAL_WORKERS)))
+# A job whose worker stops heartbeating for this long is handed to another worker, at most MIGRATION_WORKER_MAX_LEASES times.
+WORKER_LEASE_SECONDS = _int_from_env('MIGRATION_WORKER_LEASE_SECONDS', 60, minimum=5)
+WORKER_MAX_LEASES = _int_from_env('MIGRATION_WORKER_MAX_LEASES', 3)
+# Bearer token remote workers present to the /worker/* endpoints; unset disables them.
+WORKER_TOKEN = os.getenv('MIGRATION_WORKER_TOKEN')
+# The coordinator polls a job's result from this interval, doubling up to WORKER_RESULT_POLL_SECONDS.
+WORKER_RESULT_POLL_MIN_SECONDS = 0.05
+WORKER_RESULT_POLL_SECONDS = 0.5
 
 # --- Global State ---
 current_migration_state = {
@@ -41,71 +175,210 @@ current_migration_state = {
         "projects": {"total": 0, "completed": 0, "current_item_name": "", "failed": 0, "errors_resolved": 0},
     },
     "metrics": {
-        "start_time": None,
-        "data_flowing_bytes": 0,
-        "avg_speed_mb_s": 0
+        "start_time": None # transfer figures (data_flowing_bytes, avg/window_speed_mb_s, ...) are added by get_status_snapshot()
     },
-    "logs": [],
     "error_message": None
 }
+LOG_BUFFER_CAPACITY = 250
+log_buffer = LogRingBuffer(LOG_BUFFER_CAPACITY) # served as "logs" by get_status_snapshot()
 state_lock = threading.Lock()
+api_slots = threading.BoundedSemaphore(API_CONCURRENCY)
+git_slots = threading.BoundedSemaphore(GIT_CONCURRENCY)
+git_push_slots = threading.BoundedSemaphore(GIT_PUSH_CONCURRENCY)
+# Guards the ID maps / created-path registry shared between project workers. Never acquire it while holding state_lock.
+mapping_lock = threading.RLock()
+dynamic_group_lock = threading.Lock()
 
 gl_old = None
 gl_new = None
+api_sessions = {} # "old"/"new" -> InstrumentedSession, stats merged into metrics by get_status_snapshot()
+async_engine = None # async_api.AsyncEngine, started by the first run with ASYNC_API and aiohttp available
+async_new = None # async_api.AsyncGitLab for the target, sharing api_sessions["new"]'s limiter and stats
 
 OLD_TO_NEW_GROUP_ID_MAP = {}
 OLD_TO_NEW_USER_ID_MAP = {}
 CREATED_PROJECT_PATHS_IN_NEW_NAMESPACE = {}
 FAILED_REPOS = []
 DONE_REPOS = []
+report_lock = threading.Lock() # guards DONE_REPOS/FAILED_REPOS appends and report_generation
+report_run_id = None # set per run; (report_run_id, report_generation) keys cached report files
+report_generation = 0 # bumped on every recorded report entry
+report_cache = report_writer.ReportCache(REPORT_CACHE_DIR)
+checkpoint = None # checkpoint_store.CheckpointStore of the current run
+delta_sync_enabled = False # set per run by run_full_migration
+active_plan = None # plan dict being executed by the current run, if any (see migration_plan)
+active_scope = None # MigrationScope of the current wave, if the run is scoped
+scope_inventory = None # wave-sized users/groups/projects enumerated for active_scope (see collect_scope_inventory)
+namespace_cache = NamespaceCache() # target path -> ID lookups, rebuilt per run
+preflight = {} # exact counts of a full run, filled in by the preflight thread (see _run_preflight_counts)
+listed_sections = set() # stats sections whose phase has listed everything, so their total is exact; guarded by state_lock
+OLD_GROUP_MEMBERS_CACHE = {} # old group ID -> {old_user_id: (username, access_level)}, per run
+member_cache_lock = threading.Lock()
+member_ops_executor = None # shared pool applying member add/update calls during a run
+transfer_meter = TransferMeter(TRANSFER_RATE_WINDOW_SECONDS) # measured git/LFS bytes, merged into metrics by get_status_snapshot()
+PROJECT_TRANSFER_STATS = {} # old project ID -> transfer summary of its last successful transfer, per run
+NEW_PROJECT_IDS = {} # old project ID -> target project ID, per run (earlier runs: checkpoint.new_project_id)
+timings = TimingRegistry() # API/git/stage histograms for /metrics and per-project stage totals (keyed by old project ID), per run
+profiler = SamplingProfiler(PROFILER_INTERVAL_MS / 1000)
+transfer_queue = None # work_queue.LeaseQueue of a distributed run, else None
+workspace = WorkspaceManager([ScratchVolume(TMPFS_DIR, TMPFS_MAX_REPO_BYTES)] * bool(TMPFS_DIR) + [ScratchVolume(path) for path in [MIRROR_CACHE_DIR] + SCRATCH_DIRS],
+                             DISK_RESERVE_BYTES, WORKSPACE_OVERHEAD_PERCENT, evict=MIRROR_EVICTION, log=lambda message: _log_and_update_state(message))
+local_worker_processes = [] # migration_worker subprocesses started for the current run
+exited_local_workers = set() # PIDs of those already reported as exited
 
 # --- Logging and State Update ---
 def _log_and_update_state(message, log_type="info", action=None, section=None, item_name=None, increment_completed=False, error_msg=None, set_status=None):
     global current_migration_state
+    timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
+    print(f"[{timestamp}] [{log_type.upper()}] {message}")
+    log_buffer.append(timestamp, message, log_type, time.time())
+    if not (action or section or error_msg or set_status): return # plain log line: no need for state_lock
     with state_lock:
-        timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
-        full_message = f"[{timestamp}] [{log_type.upper()}] {message}"
-        print(full_message)
-        current_migration_state["logs"].insert(0, {"id": time.time(), "timestamp": timestamp, "message": message, "type": log_type})
-        current_migration_state["logs"] = current_migration_state["logs"][:250] # Keep last 250 logs
-
         if action: current_migration_state["current_action"] = action
         if section and item_name: current_migration_state["stats"][section]["current_item_name"] = item_name
         if section and increment_completed: current_migration_state["stats"][section]["completed"] += 1
         if error_msg: current_migration_state["error_message"] = error_msg
         if set_status: current_migration_state["status"] = set_status
 
-def add_migrated_bytes(bytes_count):
-    global current_migration_state
+def get_status_snapshot(since_seq=None):
+    """Consistent copy of the migration state plus logs (newest first). With since_seq, only log
+    entries after that sequence number are included, so polling cost doesn't grow with log volume."""
+    with state_lock: snapshot = copy.deepcopy(current_migration_state)
+    snapshot.setdefault("metrics", {}).update(transfer_meter.snapshot())
+    snapshot["metrics"]["api"] = {name: session.stats() for name, session in list(api_sessions.items())}
+    snapshot["metrics"]["profiler"] = profiler.status()
+    if transfer_queue is not None: snapshot["metrics"]["workers"] = transfer_queue.stats()
+    snapshot["metrics"]["workspace"] = workspace.usage()
+    entries = log_buffer.since(since_seq)
+    snapshot["logs"] = entries[::-1]
+    snapshot["logs_since"] = since_seq
+    snapshot["last_log_seq"] = entries[-1]["seq"] if entries else (since_seq if since_seq is not None else 0)
+    return snapshot
+
+def _prometheus_samples(metric, metric_type, help_text, samples):
+    """samples: [(labels dict, value)] -> exposition lines for one metric."""
+    lines = [f"# HELP {metric} {help_text}", f"# TYPE {metric} {metric_type}"]
+    for labels, value in samples:
+        label_text = timing_metrics.format_labels(labels.items())
+        lines.append(f"{metric}{{{label_text}}} {value}" if label_text else f"{metric} {value}")
+    return lines
+
+def render_prometheus_metrics():
+    """Prometheus text exposition of the current run: latency histograms plus counters/gauges from the status snapshot."""
     with state_lock:
-        metrics = current_migration_state.setdefault("metrics", {"start_time": time.time(), "data_flowing_bytes": 0, "avg_speed_mb_s": 0})
-        if metrics.get("start_time") is None:
-            metrics["start_time"] = time.time()
-        metrics["data_flowing_bytes"] += bytes_count
-        elapsed = time.time() - metrics["start_time"]
-        if elapsed > 0:
-            metrics["avg_speed_mb_s"] = round((metrics["data_flowing_bytes"] / (1024 * 1024)) / elapsed, 1)
+        status = current_migration_state.get("status", "unknown")
+        section_stats = copy.deepcopy(current_migration_state.get("stats", {}))
+        phases = copy.deepcopy(current_migration_state.get("metrics", {}).get("phase_throughput", {}))
+    api_stats = {name: session.stats() for name, session in list(api_sessions.items())}
+    lines = _prometheus_samples("gitlab_migration_info", "gauge", "Current migration status (value is always 1).", [({"status": status}, 1)])
+    for key, help_text in (("total", "Items found per section."), ("completed", "Items finished per section (successful or given up)."), ("failed", "Failed attempts per section.")):
+        lines += _prometheus_samples(f"gitlab_migration_items_{key}", "gauge", help_text,
+                                     [({"section": section}, stats.get(key, 0)) for section, stats in section_stats.items() if isinstance(stats, dict)])
+    lines += _prometheus_samples("gitlab_migration_transferred_bytes_total", "counter", "Git/LFS bytes moved by kind.",
+                                 [({"kind": kind}, count) for kind, count in transfer_meter.snapshot()["transfer_bytes"].items()])
+    for key, help_text in (("requests", "GitLab API requests sent."), ("errors", "GitLab API requests that failed or returned 5xx."), ("rate_limited", "GitLab API responses with status 429."),
+                           ("throttle_seconds", "Seconds requests waited for the client-side rate limiter.")):
+        lines += _prometheus_samples(f"gitlab_migration_api_{key}_total", "counter", help_text,
+                                     [({"instance": name}, stats.get(key, 0)) for name, stats in api_stats.items()])
+    lines += _prometheus_samples("gitlab_migration_phase_seconds", "gauge", "Elapsed time of each phase.", [({"phase": phase}, values["seconds"]) for phase, values in phases.items()])
+    lines += _prometheus_samples("gitlab_migration_phase_items_per_second", "gauge", "Items/s of each phase.", [({"phase": phase}, values["per_s"]) for phase, values in phases.items()])
+    volumes = workspace.usage()["volumes"]
+    for key, help_text in (("free", "Free bytes on each scratch volume."), ("reserved", "Bytes reserved on each scratch volume for clones/fetches in progress.")):
+        lines += _prometheus_samples(f"gitlab_migration_workspace_{key}_bytes", "gauge", help_text, [({"volume": volume["path"]}, volume[f"{key}_bytes"]) for volume in volumes])
+    return "\n".join(lines) + "\n" + timings.render_prometheus()
+
+def _record_report_entry(entries, entry):
+    """Appends to DONE_REPOS or FAILED_REPOS; always use this so report snapshots stay consistent."""
+    global report_generation
+    with report_lock: entries.append(entry); report_generation += 1
+
+def report_snapshot():
+    """(run ID, generation, DONE_REPOS copy, FAILED_REPOS copy) taken at one instant. Entries are never changed
+    after being recorded, so shallow list copies are enough for a report to render while the run keeps appending."""
+    with report_lock: return report_run_id, report_generation, list(DONE_REPOS), list(FAILED_REPOS)
+
+def _reset_reports():
+    global report_run_id, report_generation
+    with report_lock:
+        DONE_REPOS.clear(); FAILED_REPOS.clear()
+        report_run_id = time.strftime('%Y%m%d-%H%M%S'); report_generation = 0
+
+def format_bytes(byte_count):
+    for unit in ("B", "KB", "MB", "GB"):
+        if byte_count < 1024: return f"{byte_count:.0f} {unit}" if unit == "B" else f"{byte_count:.1f} {unit}"
+        byte_count /= 1024
+    return f"{byte_count:.2f} TB"
+
+def _map_user(old_user_id, new_user_id, username=None):
+    with mapping_lock: OLD_TO_NEW_USER_ID_MAP[old_user_id] = new_user_id
+    if checkpoint: checkpoint.record_user(old_user_id, new_user_id, username)
+
+def _map_group(old_group_id, new_group_id, full_path=None):
+    with mapping_lock: OLD_TO_NEW_GROUP_ID_MAP[old_group_id] = new_group_id
+    if checkpoint: checkpoint.record_group(old_group_id, new_group_id, full_path)
+
+def open_checkpoint(resume):
+    """Opens the checkpoint store and loads the ID maps from it when resuming the same source/target pair.
+    Returns True if previous progress was loaded."""
+    global checkpoint, OLD_TO_NEW_USER_ID_MAP, OLD_TO_NEW_GROUP_ID_MAP
+    if checkpoint: checkpoint.close()
+    checkpoint = checkpoint_store.CheckpointStore(CHECKPOINT_DB_PATH)
+    if resume and checkpoint.belongs_to(OLD_GITLAB_URL, NEW_GITLAB_URL):
+        OLD_TO_NEW_USER_ID_MAP = checkpoint.load_user_map()
+        OLD_TO_NEW_GROUP_ID_MAP = checkpoint.load_group_map()
+        summary = checkpoint.summary()
+        _log_and_update_state(f"Resuming from checkpoint '{CHECKPOINT_DB_PATH}': {summary['users']} users, {summary['groups']} groups mapped; project states: {summary['projects'] or 'none'}.")
+        return True
+    if resume: _log_and_update_state(f"No checkpoint for this source/target pair in '{CHECKPOINT_DB_PATH}'. Starting a fresh run.")
+    checkpoint.reset(OLD_GITLAB_URL, NEW_GITLAB_URL)
+    return False
 
 # --- GitLab Client Initialization ---
+def _observe_api_request(instance, method, url, status_code, seconds):
+    timings.observe(timing_metrics.API_REQUEST_METRIC, seconds, instance=instance, endpoint=timing_metrics.api_endpoint_label(method, url))
+
+def _new_api_session(name):
+    # One session per instance, shared by every worker thread; replaces the previous run's session and its stats.
+    session = InstrumentedSession(name, API_MAX_REQUESTS_PER_SECOND, HTTP_POOL_SIZE, observer=_observe_api_request)
+    api_sessions[name] = session
+    return session
+
 def initialize_gitlab_clients():
     global gl_old, gl_new
     _log_and_update_state("Initializing GitLab Clients...", action="Initializing clients", set_status="initializing")
+    _log_and_update_state(f"API clients: up to {API_MAX_REQUESTS_PER_SECOND or 'unlimited'} req/s and {HTTP_POOL_SIZE} pooled connections per instance.")
     try:
         _log_and_update_state(f"Old GitLab Client: URL={OLD_GITLAB_URL}", action="Connecting to Old GitLab")
-        gl_old = gitlab.Gitlab(OLD_GITLAB_URL, private_token=OLD_GITLAB_TOKEN, timeout=60, keep_base_url=True, ssl_verify=False) # ssl_verify=False if using self-signed certs on old
+        gl_old = gitlab.Gitlab(OLD_GITLAB_URL, private_token=OLD_GITLAB_TOKEN, timeout=60, keep_base_url=True, ssl_verify=False, session=_new_api_session("old")) # ssl_verify=False if using self-signed certs on old
         gl_old.auth()
         _log_and_update_state("Old GitLab client authenticated successfully.")
     except Exception as e:
         _log_and_update_state(f"Failed to init old GitLab client: {e}", log_type="error", error_msg=str(e), set_status="error"); gl_old = None; raise
     try:
         _log_and_update_state(f"New GitLab Client: URL={NEW_GITLAB_URL}", action="Connecting to New GitLab")
-        gl_new = gitlab.Gitlab(NEW_GITLAB_URL, private_token=NEW_GITLAB_TOKEN, timeout=60, keep_base_url=True, ssl_verify=False) # ssl_verify=False if using self-signed certs on new
+        gl_new = gitlab.Gitlab(NEW_GITLAB_URL, private_token=NEW_GITLAB_TOKEN, timeout=60, keep_base_url=True, ssl_verify=False, session=_new_api_session("new")) # ssl_verify=False if using self-signed certs on new
         gl_new.auth()
         _log_and_update_state("New GitLab client authenticated successfully.")
     except Exception as e:
         _log_and_update_state(f"Failed to init new GitLab client: {e}", log_type="error", error_msg=str(e), set_status="error"); gl_new = None; raise
+    _start_async_api()
     _log_and_update_state("GitLab Clients Initialized.", action="Clients Ready")
 
+def _start_async_api():
+    global async_engine, async_new
+    if not ASYNC_API: return
+    try: import async_api
+    except ImportError:
+        _log_and_update_state("aiohttp is not installed: member writes and target lookups stay on worker threads.", log_type="warning"); return
+    if async_engine is None: async_engine = async_api.AsyncEngine()
+    if async_new is not None: async_engine.run(async_new.close())
+    async_new = async_api.AsyncGitLab(NEW_GITLAB_URL, NEW_GITLAB_TOKEN, api_sessions["new"], ASYNC_MAX_IN_FLIGHT)
+    _log_and_update_state(f"Async API engine: up to {ASYNC_MAX_IN_FLIGHT} target requests in flight from one event loop.")
+
+def _stop_async_api():
+    global async_new
+    if async_new is not None: async_engine.run(async_new.close()); async_new = None
+
 def get_full_group_object(gl_instance, group_id_or_lazy_obj, context="old"):
     if not gl_instance: return None
     try:
@@ -117,56 +390,90 @@ def get_full_group_object(gl_instance, group_id_or_lazy_obj, context="old"):
 
 def get_user_namespace_id_on_new(username):
     if not gl_new or not username: return None
+    cached_id = namespace_cache.get_user_namespace_id(username)
+    if cached_id: return cached_id
     try:
         namespaces = gl_new.namespaces.list(search=username)
         for ns in namespaces:
             if ns.kind == 'user' and ns.path.lower() == username.lower():
+                namespace_cache.remember_user_namespace(username, ns.id)
                 return ns.id
     except Exception as e:
         _log_and_update_state(f"Error finding namespace for user '{username}': {e}", log_type="warning")
     return None
 
+# --- Membership Sync ---
+def _max_access_by_user(members):
+    """{old_user_id: (username, access_level)} keeping the highest level per user."""
+    levels = {}
+    for m in members:
+        if m.id not in levels or m.access_level > levels[m.id][1]: levels[m.id] = (m.username, m.access_level)
+    return levels
+
+def old_group_members_all(old_group_id, old_group_name=None):
+    """Inherited + direct (+ invited) members of an old group. Fetched once per run and shared by the group's
+    own member sync and the scope's user collection."""
+    with member_cache_lock:
+        cached = OLD_GROUP_MEMBERS_CACHE.get(old_group_id)
+    if cached is not None: return cached
+    old_group = gl_old.groups.get(old_group_id, lazy=True)
+    label = old_group_name or old_group_id
+    try:
+        levels = _max_access_by_user(old_group.members_all.list(iterator=True, per_page=100))
+    except Exception as e:
+        _log_and_update_state(f"Warning: Could not fetch inherited members for group '{label}' ({e}). Falling back to direct members.")
+        levels = _max_access_by_user(old_group.members.list(iterator=True, per_page=100))
+    with member_cache_lock: OLD_GROUP_MEMBERS_CACHE[old_group_id] = levels
+    return levels
+
+def sync_members(new_owner, old_levels, kind, target_name):
+    """Brings the direct members of new_owner (a target group or project) in line with old_levels.
+    Reads the target member list once, computes the add/update diff and applies it on the shared member pool."""
+    new_levels = {m.id: m.access_level for m in new_owner.members.list(iterator=True, per_page=100)}
+    to_add = []; to_update = []; unmapped = []
+    for old_user_id, (username, access_level) in old_levels.items():
+        new_user_id = OLD_TO_NEW_USER_ID_MAP.get(old_user_id)
+        if not new_user_id: unmapped.append(username); continue
+        if new_user_id not in new_levels: to_add.append((username, new_user_id, access_level))
+        elif new_levels[new_user_id] != access_level: to_update.append((username, new_user_id, access_level))
+
+    # The same add/update, sent through python-gitlab or the async client; both report failures as exceptions.
+    def apply(op, username, new_user_id, access_level):
+        if op == "add": new_owner.members.create({'user_id': new_user_id, 'access_level': access_level})
+        else: new_owner.members.update(new_user_id, {'access_level': access_level})
+
+    async def apply_async(op, username, new_user_id, access_level):
+        members_path = f"/{'projects' if kind == 'project' else 'groups'}/{new_owner.id}/members"
+        if op == "add": await async_new.request("POST", members_path, json={'user_id': new_user_id, 'access_level': access_level})
+        else: await async_new.request("PUT", f"{members_path}/{new_user_id}", json={'access_level': access_level})
+
+    def attempt(op):
+        try: apply(*op)
+        except Exception as e: return e
+
+    ops = [("add", *item) for item in to_add] + [("update", *item) for item in to_update]
+    if async_new is not None and len(ops) > 1:
+        outcomes = async_engine.gather([apply_async(*op) for op in ops]) # exceptions are returned, not raised
+    elif member_ops_executor and len(ops) > 1:
+        outcomes = [f.result() for f in [member_ops_executor.submit(attempt, op) for op in ops]]
+    else:
+        outcomes = [attempt(op) for op in ops]
+    errors = [(op, e) for op, e in zip(ops, outcomes) if isinstance(e, BaseException)]
+    for (op, username, new_user_id, _), e in errors:
+        _log_and_update_state(f"  Failed to {op} {kind} member {username} (target user ID: {new_user_id}) in '{target_name}': {e}", log_type="warning")
+    if unmapped:
+        shown = ", ".join(unmapped[:10]) + (f" (+{len(unmapped) - 10} more)" if len(unmapped) > 10 else "")
+        _log_and_update_state(f"  {len(unmapped)} users not mapped to target, skipped for {kind} '{target_name}': {shown}", log_type="warning")
+    unchanged = len(old_levels) - len(unmapped) - len(ops)
+    _log_and_update_state(f"  Members for {kind} '{target_name}': {len(to_add)} added, {len(to_update)} updated, {unchanged} unchanged, {len(errors)} failed.")
+
 def migrate_group_members(old_group_id_or_obj, new_group):
     if not old_group_id_or_obj or not new_group:
         return
     try:
-        if hasattr(old_group_id_or_obj, 'members'):
-            old_group = old_group_id_or_obj
-        else:
-            old_group = gl_old.groups.get(old_group_id_or_obj)
-            
-        try:
-            old_members = old_group.members_all.list(all=True)
-            _log_and_update_state(f"Found {len(old_members)} members (including inherited) in old group '{old_group.name}'. Migrating permissions...")
-        except Exception as e:
-            _log_and_update_state(f"Warning: Could not fetch inherited members for group '{old_group.name}' ({e}). Falling back to direct members.")
-            old_members = old_group.members.list(all=True)
-            _log_and_update_state(f"Found {len(old_members)} direct members in old group '{old_group.name}'. Migrating permissions...")
-        
-        new_members = new_group.members.list(all=True)
-        new_member_user_ids = {m.id for m in new_members}
-        
-        for old_member in old_members:
-            new_user_id = OLD_TO_NEW_USER_ID_MAP.get(old_member.id)
-            if not new_user_id:
-                _log_and_update_state(f"  User {old_member.username} (ID {old_member.id}) not mapped to target. Skipping group permission migration.", log_type="warning")
-                continue
-                
-            if new_user_id in new_member_user_ids:
-                try:
-                    new_member_obj = new_group.members.get(new_user_id)
-                    if new_member_obj.access_level != old_member.access_level:
-                        new_member_obj.access_level = old_member.access_level
-                        new_member_obj.save()
-                        _log_and_update_state(f"  Updated group member {old_member.username} access level to {old_member.access_level} in group '{new_group.name}'.")
-                except Exception as e_mem_upd:
-                    _log_and_update_state(f"  Failed to update group member {old_member.username} access level in '{new_group.name}': {e_mem_upd}", log_type="warning")
-            else:
-                try:
-                    new_group.members.create({'user_id': new_user_id, 'access_level': old_member.access_level})
-                    _log_and_update_state(f"  Added member {old_member.username} to group '{new_group.name}' with access level {old_member.access_level}.")
-                except Exception as e_mem_add:
-                    _log_and_update_state(f"  Failed to add member {old_member.username} to group '{new_group.name}': {e_mem_add}", log_type="warning")
+        old_group_id = getattr(old_group_id_or_obj, 'id', old_group_id_or_obj)
+        old_levels = old_group_members_all(old_group_id, getattr(old_group_id_or_obj, 'name', None))
+        sync_members(new_group, old_levels, "group", new_group.name)
     except Exception as e:
         _log_and_update_state(f"Error migrating members for group: {e}", log_type="warning")
 
@@ -176,18 +483,24 @@ def create_or_find_group_on_new(old_group_obj_full, new_parent_id_for_creation=N
     _log_and_update_state(f"Group: '{name}' (Path: {path_slug})", action=f"Processing Group: {name}", section="groups", item_name=old_group_obj_full.full_path)
     if new_parent_id_for_creation: _log_and_update_state(f"  Targeting new parent group ID: {new_parent_id_for_creation}")
     try:
-        candidate_groups = []
-        if new_parent_id_for_creation:
+        candidate_group_ids = []
+        cached_group_id = namespace_cache.get_group_id(new_parent_id_for_creation, path_slug)
+        if cached_group_id:
+            candidate_group_ids = [cached_group_id]
+        elif namespace_cache.group_known_absent(new_parent_id_for_creation, path_slug):
+            candidate_group_ids = [] # preloaded or prefetched: no existence check needed
+        elif new_parent_id_for_creation:
             try:
-                parent_group_new = gl_new.groups.get(new_parent_id_for_creation)
-                all_subgroups = parent_group_new.subgroups.list(all=True)
-                candidate_groups = [sg for sg in all_subgroups if sg.path == path_slug]
-            except gitlab.exceptions.GitlabGetError: _log_and_update_state(f"ERROR: New parent ID {new_parent_id_for_creation} not found. Cannot create '{name}'.", log_type="error"); return None
+                parent_group_new = gl_new.groups.get(new_parent_id_for_creation, lazy=True)
+                all_subgroups = parent_group_new.subgroups.list(search=path_slug, all=True)
+                candidate_group_ids = [sg.id for sg in all_subgroups if sg.path == path_slug]
+            except (gitlab.exceptions.GitlabGetError, gitlab.exceptions.GitlabListError): _log_and_update_state(f"ERROR: New parent ID {new_parent_id_for_creation} not found. Cannot create '{name}'.", log_type="error"); return None
         else: 
-            groups_from_search = gl_new.groups.list(search=path_slug, all=True)
-            candidate_groups = [g for g in groups_from_search if g.path == path_slug and g.parent_id is None]
-        if candidate_groups:
-            existing_group = gl_new.groups.get(candidate_groups[0].id)
+            groups_from_search = gl_new.groups.list(search=path_slug, top_level_only=True, all=True)
+            candidate_group_ids = [g.id for g in groups_from_search if g.path == path_slug and g.parent_id is None]
+        if candidate_group_ids:
+            existing_group = gl_new.groups.get(candidate_group_ids[0])
+            namespace_cache.remember_group(new_parent_id_for_creation, path_slug, existing_group.id)
             _log_and_update_state(f"Group '{existing_group.name}' (Path: {existing_group.path}) already exists with NEW ID {existing_group.id}. Using it.")
             migrate_group_members(old_group_obj_full, existing_group)
             return existing_group
@@ -198,6 +511,7 @@ def create_or_find_group_on_new(old_group_obj_full, new_parent_id_for_creation=N
     try:
         _log_and_update_state(f"Creating group with payload: {json.dumps(payload)}")
         new_group = gl_new.groups.create(payload)
+        namespace_cache.remember_group(new_parent_id_for_creation, path_slug, new_group.id)
         _log_and_update_state(f"Successfully created group '{new_group.name}' with NEW ID {new_group.id}.")
         migrate_group_members(old_group_obj_full, new_group)
         return new_group
@@ -206,16 +520,18 @@ def create_or_find_group_on_new(old_group_obj_full, new_parent_id_for_creation=N
         if "has already been taken" in str(e.error_message).lower() or "path already exists" in str(e.error_message).lower():
              _log_and_update_state(f"  Retrying find for group '{path_slug}' after 'already taken' error.")
              try:
+                # Searched by path rather than listing every (sub)group of the target.
                 if new_parent_id_for_creation:
-                    parent_group_new = gl_new.groups.get(new_parent_id_for_creation)
-                    all_subgroups = parent_group_new.subgroups.list(all=True)
+                    parent_group_new = gl_new.groups.get(new_parent_id_for_creation, lazy=True)
+                    all_subgroups = parent_group_new.subgroups.list(search=path_slug, all=True)
                     found_groups = [sg for sg in all_subgroups if sg.path == path_slug]
                 else:
-                    all_groups = gl_new.groups.list(all=True)
+                    all_groups = gl_new.groups.list(search=path_slug, top_level_only=True, all=True)
                     found_groups = [g for g in all_groups if g.path == path_slug and g.parent_id is None]
                 if found_groups: 
                     _log_and_update_state(f"Found existing group '{found_groups[0].name}' ID {found_groups[0].id} on retry.")
                     found_group_obj = gl_new.groups.get(found_groups[0].id)
+                    namespace_cache.remember_group(new_parent_id_for_creation, path_slug, found_group_obj.id)
                     migrate_group_members(old_group_obj_full, found_group_obj)
                     return found_group_obj
              except Exception as e_retry_find: _log_and_update_state(f"  Retry find also failed: {e_retry_find}", log_type="warning")
@@ -223,10 +539,16 @@ def create_or_find_group_on_new(old_group_obj_full, new_parent_id_for_creation=N
     except Exception as e_unexp: _log_and_update_state(f"UNEXPECTED ERROR creating group '{name}': {e_unexp}", log_type="error"); return None
 
 def ensure_group_mapped_by_path(old_namespace_info, initial_new_parent_id=None):
+    # Serialized so two project workers can't race to create the same missing group.
+    with dynamic_group_lock:
+        return _ensure_group_mapped_by_path_locked(old_namespace_info, initial_new_parent_id)
+
+def _ensure_group_mapped_by_path_locked(old_namespace_info, initial_new_parent_id=None):
     old_group_id = old_namespace_info.get('id')
-    if old_group_id and old_group_id in OLD_TO_NEW_GROUP_ID_MAP:
-        return OLD_TO_NEW_GROUP_ID_MAP[old_group_id]
-        
+    with mapping_lock:
+        if old_group_id and old_group_id in OLD_TO_NEW_GROUP_ID_MAP:
+            return OLD_TO_NEW_GROUP_ID_MAP[old_group_id]
+
     full_path = old_namespace_info.get('full_path')
     if not full_path:
         _log_and_update_state(f"Missing full_path in namespace info: {old_namespace_info}", log_type="error")
@@ -236,28 +558,29 @@ def ensure_group_mapped_by_path(old_namespace_info, initial_new_parent_id=None):
     current_parent_id = initial_new_parent_id
     
     for i, part in enumerate(path_parts):
+        cached_group_id = namespace_cache.get_group_id(current_parent_id, part)
+        if cached_group_id:
+            current_parent_id = cached_group_id
+            continue
         found_group = None
-        if current_parent_id:
+        if namespace_cache.group_known_absent(current_parent_id, part):
+            pass
+        elif current_parent_id:
             try:
-                parent_group_new = gl_new.groups.get(current_parent_id)
+                parent_group_new = gl_new.groups.get(current_parent_id, lazy=True)
                 all_subgroups = parent_group_new.subgroups.list(search=part, all=True)
-                for sg in all_subgroups:
-                    if sg.path == part:
-                        found_group = gl_new.groups.get(sg.id)
-                        break
+                found_group = next((sg for sg in all_subgroups if sg.path == part), None)
             except Exception as e:
                 _log_and_update_state(f"Error searching subgroup '{part}': {e}", log_type="warning")
         else:
             try:
                 all_groups = gl_new.groups.list(search=part, top_level_only=True, all=True)
-                for g in all_groups:
-                    if g.path == part:
-                        found_group = gl_new.groups.get(g.id)
-                        break
+                found_group = next((g for g in all_groups if g.path == part), None)
             except Exception as e:
                 _log_and_update_state(f"Error searching top-level group '{part}': {e}", log_type="warning")
-                
+
         if found_group:
+            namespace_cache.remember_group(current_parent_id, part, found_group.id)
             current_parent_id = found_group.id
         else:
             payload = {'name': part, 'path': part, 'visibility': 'private'}
@@ -266,76 +589,137 @@ def ensure_group_mapped_by_path(old_namespace_info, initial_new_parent_id=None):
             try:
                 _log_and_update_state(f"Dynamically creating missing group '{part}' (from path '{full_path}')")
                 new_group = gl_new.groups.create(payload)
+                namespace_cache.remember_group(current_parent_id, part, new_group.id)
                 current_parent_id = new_group.id
             except Exception as e:
                 _log_and_update_state(f"Failed to create group '{part}': {e}", log_type="error")
                 return None
                 
     if old_group_id and current_parent_id:
-        OLD_TO_NEW_GROUP_ID_MAP[old_group_id] = current_parent_id
+        _map_group(old_group_id, current_parent_id, full_path)
         
     return current_parent_id
 
-def migrate_groups_recursive_py(old_parent_group_id_for_subgroup_listing=None, new_parent_id_for_creation=None):
-    if not gl_old or not gl_new: return
-    page = 1; per_page = 100
-    
-    current_parent_log_name = old_parent_group_id_for_subgroup_listing or 'TOP LEVEL'
-    _log_and_update_state(f"Processing children of Old Parent ID: {current_parent_log_name}",
-                          action=f"Scanning group: {current_parent_log_name}",
-                          section="groups", item_name=current_parent_log_name)
-    while True:
-        old_subgroups_page_lazy = []
-        try:
-            if old_parent_group_id_for_subgroup_listing:
-                parent_obj_old = get_full_group_object(gl_old, old_parent_group_id_for_subgroup_listing, "old parent")
-                if not parent_obj_old: break
-                _log_and_update_state(f"Fetching subgroups for old group: '{parent_obj_old.full_path}' (Page {page})", action=f"Listing subgroups of {parent_obj_old.name}")
-                old_subgroups_page_lazy = parent_obj_old.subgroups.list(page=page, per_page=per_page, as_list=True, all_available=True)
-            else:
-                _log_and_update_state(f"Fetching top-level groups (Page {page})", action="Listing top-level groups")
-                old_subgroups_page_lazy = gl_old.groups.list(page=page, per_page=per_page, as_list=True, top_level_only=True, all_available=True)
-        except Exception as e: _log_and_update_state(f"ERROR fetching groups/subgroups list for old_parent_id '{old_parent_group_id_for_subgroup_listing}': {e}", log_type="error"); break
-        
-        processed_on_page = 0
-        for old_group_lazy_item in old_subgroups_page_lazy:
-            processed_on_page += 1
-            old_group_full = get_full_group_object(gl_old, old_group_lazy_item.id, "old current")
-            if not old_group_full: _log_and_update_state(f"Could not get full object for old group ID {old_group_lazy_item.id}. Skipping.", log_type="warning"); continue
-            
-            if old_group_full.id in OLD_TO_NEW_GROUP_ID_MAP:
-                new_gid_for_children = OLD_TO_NEW_GROUP_ID_MAP[old_group_full.id]
-                _log_and_update_state(f"Group '{old_group_full.name}' already mapped (Old {old_group_full.id} -> New {new_gid_for_children}). Checking its subgroups.",
-                                      section="groups", item_name=old_group_full.full_path, increment_completed=True) # Count as completed
-                migrate_groups_recursive_py(old_group_full.id, new_gid_for_children); continue
-
-            new_created_group_obj = create_or_find_group_on_new(old_group_full, new_parent_id_for_creation)
-            if new_created_group_obj:
-                OLD_TO_NEW_GROUP_ID_MAP[old_group_full.id] = new_created_group_obj.id
-                _log_and_update_state(f"MAP: Old Group ID {old_group_full.id} ('{old_group_full.name}') -> New Group ID {new_created_group_obj.id}",
-                                      section="groups", item_name=old_group_full.full_path, increment_completed=True)
-                add_migrated_bytes(5 * 1024 * 1024) # mock 5MB per group
-                migrate_groups_recursive_py(old_group_full.id, new_created_group_obj.id)
-            else: _log_and_update_state(f"ERROR: Failed to create/map group '{old_group_full.name}'. Skipping its subgroups.", log_type="error")
-        
-        if processed_on_page == 0 and page > 1 : _log_and_update_state(f"No items on page {page} for old parent ID '{current_parent_log_name}'. Assuming end."); break
-        if processed_on_page < per_page : _log_and_update_state(f"Processed {processed_on_page} items on page {page} (< per_page). End for old parent ID '{current_parent_log_name}'."); break
-        page += 1; time.sleep(0.1)
+def _old_groups_by_parent():
+    """Every group visible on the old instance from one streamed groups.list(all_available=True),
+    indexed by parent ID (None for top-level groups). List items carry everything group creation needs."""
+    children = defaultdict(list)
+    for old_group in gl_old.groups.list(iterator=True, all_available=True, per_page=GROUP_LIST_PAGE_SIZE):
+        children[old_group.parent_id].append(old_group)
+    return children
 
-def migrate_project_repo_py(
-    project_id_old, project_name_old, project_path_old, project_namespace_path_old,
-    project_description_old, project_visibility_old, old_repo_ssh_url_from_stub, 
-    new_target_namespace_id 
-):
-    global CREATED_PROJECT_PATHS_IN_NEW_NAMESPACE, gl_new
-    _log_and_update_state(f"Project: '{project_namespace_path_old}' (Old ID: {project_id_old})",
-                          action=f"Processing Project: {project_name_old}",
-                          section="projects", item_name=project_namespace_path_old)
+def _migrate_one_group(old_group, new_parent_id):
+    """Maps one old group to the target (creating it if needed). Returns the new group ID or None."""
+    with timings.timed(timing_metrics.ITEM_METRIC, phase="groups"): return _migrate_one_group_timed(old_group, new_parent_id)
 
-    # Use HTTP URL with token for cloning instead of SSH
-    old_scheme, old_domain = OLD_GITLAB_URL.split('://', 1)
-    old_repo_url = f"{old_scheme}://oauth2:{OLD_GITLAB_TOKEN}@{old_domain.rstrip('/')}/{project_namespace_path_old}.git"
+def _migrate_one_group_timed(old_group, new_parent_id):
+    with mapping_lock: new_group_id = OLD_TO_NEW_GROUP_ID_MAP.get(old_group.id)
+    if new_group_id:
+        _log_and_update_state(f"Group '{old_group.name}' already mapped (Old {old_group.id} -> New {new_group_id}). Checking its subgroups.",
+                              section="groups", item_name=old_group.full_path, increment_completed=True)
+        return new_group_id
+    new_group = create_or_find_group_on_new(old_group, new_parent_id)
+    if not new_group: return None
+    _map_group(old_group.id, new_group.id, old_group.full_path)
+    _log_and_update_state(f"MAP: Old Group ID {old_group.id} ('{old_group.name}') -> New Group ID {new_group.id}",
+                          section="groups", item_name=old_group.full_path, increment_completed=True)
+    return new_group.id
 
+def _subtree_size(children, old_group_id):
+    size = 0; pending = [old_group_id]
+    while pending:
+        kids = children.get(pending.pop(), ())
+        size += len(kids); pending.extend(g.id for g in kids)
+    return size
+
+def _planned_groups_by_parent(plan):
+    children = defaultdict(list)
+    for g in plan["groups"]: children[g["parent_id"]].append(SimpleNamespace(**{key: g.get(key) for key in ("id", "parent_id", "name", "path", "full_path", "visibility", "description")}))
+    return children
+
+def _prefetch_target_groups(level):
+    """Runs the existence checks of a whole group level as one concurrent batch on the async engine, so the group
+    workers find every answer (found or absent) in namespace_cache instead of each searching the target in turn.
+    Nothing to do after a namespace preload, which already answers them all."""
+    pending = sorted({(new_parent_id, old_group.path) for old_group, new_parent_id in level if not namespace_cache.knows_group(new_parent_id, old_group.path)}, key=str)
+    if async_new is None or not pending: return
+    async def lookup(parent_id, path):
+        if parent_id: return await async_new.list_all(f"/groups/{parent_id}/subgroups", search=path)
+        return await async_new.list_all("/groups", search=path, top_level_only=True)
+    started_at = time.monotonic(); found = 0
+    for (parent_id, path), result in zip(pending, async_engine.gather([lookup(*key) for key in pending])):
+        if isinstance(result, Exception): continue # left unknown: the group worker checks it itself
+        match = next((g for g in result if g['path'] == path and (g.get('parent_id') or None) == (parent_id or None)), None)
+        if match: namespace_cache.remember_group(parent_id, path, match['id']); found += 1
+        else: namespace_cache.remember_group_absent(parent_id, path)
+    _log_and_update_state(f"  Checked {len(pending)} target groups in {time.monotonic() - started_at:.2f}s: {found} exist, {len(pending) - found} to create.")
+
+def migrate_group_hierarchy_py(initial_new_parent_id=None, plan=None, scoped_groups=None):
+    """Breadth-first copy of the old group tree: all groups at one depth are created in parallel, and a level
+    starts only once its parents exist. Returns True if every group was listed and mapped without errors.
+    scoped_groups ({old ID: group}) restricts the tree to a wave's groups and their ancestors."""
+    if not gl_old or not gl_new: return False
+    if plan:
+        children = _planned_groups_by_parent(plan)
+        _log_and_update_state(f"Using planned group tree: {plan['summary']['groups']}.", section="groups", item_name="TOP LEVEL")
+    elif scoped_groups is not None:
+        children = defaultdict(list)
+        for old_group in scoped_groups.values(): children[old_group.parent_id].append(old_group)
+    else:
+        _log_and_update_state("Listing all groups on old instance (single streamed scan)...", action="Listing groups", section="groups", item_name="TOP LEVEL")
+        try: children = _old_groups_by_parent()
+        except Exception as e: _log_and_update_state(f"ERROR listing groups on old instance: {e}", log_type="error"); return False
+    listed_ids = {g.id for kids in children.values() for g in kids}
+    total = sum(len(kids) for kids in children.values())
+    with state_lock: current_migration_state["stats"]["groups"]["total"] = total; listed_sections.add("groups")
+    unreachable = [parent_id for parent_id in children if parent_id is not None and parent_id not in listed_ids]
+    if unreachable:
+        _log_and_update_state(f"Warning: {sum(len(children[p]) for p in unreachable)} groups have a parent that is not visible to the source token; they are mapped on demand by their projects.", log_type="warning")
+    clean = not unreachable
+    level = [(old_group, initial_new_parent_id) for old_group in children.get(None, [])]
+    depth = 0; processed = 0; phase_started_at = time.time()
+    with ThreadPoolExecutor(max_workers=GROUP_SYNC_CONCURRENCY, thread_name_prefix="group-sync") as group_pool:
+        while level:
+            depth += 1
+            _log_and_update_state(f"Group level {depth}: {len(level)} groups ({total} listed in total).", action=f"Migrating group level {depth} ({len(level)} groups)")
+            _prefetch_target_groups(level)
+            futures = [(old_group, group_pool.submit(_migrate_one_group, old_group, new_parent_id)) for old_group, new_parent_id in level]
+            next_level = []
+            for old_group, future in futures:
+                try: new_group_id = future.result()
+                except Exception as e:
+                    _log_and_update_state(f"UNEXPECTED ERROR migrating group '{old_group.full_path}': {e}", log_type="error"); new_group_id = None
+                if new_group_id:
+                    next_level.extend((child, new_group_id) for child in children.get(old_group.id, ()))
+                    continue
+                clean = False
+                skipped = _subtree_size(children, old_group.id)
+                _log_and_update_state(f"ERROR: Failed to create/map group '{old_group.full_path}'." + (f" Skipping its {skipped} descendant groups." if skipped else ""), log_type="error")
+            processed += len(futures); level = next_level
+            record_phase_throughput("groups", processed, phase_started_at)
+    return clean
+
+def _find_existing_project_on_new(project_path_old, new_target_namespace_id):
+    if new_target_namespace_id:
+        ns_obj = gl_new.groups.get(new_target_namespace_id, lazy=True)
+        projects_in_ns = ns_obj.projects.list(search=project_path_old, all=True, lazy=True)
+    else: projects_in_ns = gl_new.projects.list(owned=True, search=project_path_old, all=True, lazy=True)
+    found_project_lazy = next((p for p in projects_in_ns if p.path == project_path_old), None)
+    return gl_new.projects.get(found_project_lazy.id) if found_project_lazy else None
+
+def _find_existing_project_retrying(project_path_old, new_target_namespace_id):
+    """_find_existing_project_on_new(), tried FIND_EXISTING_PROJECT_ATTEMPTS times while it finds nothing or fails.
+    None once every lookup came back empty; the last lookup's error if that one failed."""
+    for attempt in range(FIND_EXISTING_PROJECT_ATTEMPTS):
+        if attempt: time.sleep(2 ** (attempt - 1))
+        try: new_project = _find_existing_project_on_new(project_path_old, new_target_namespace_id)
+        except Exception:
+            if attempt == FIND_EXISTING_PROJECT_ATTEMPTS - 1: raise
+            continue
+        if new_project: return new_project
+    return None
+
+def _create_or_find_project_on_new(project_name_old, project_path_old, project_description_old, project_visibility_old, new_target_namespace_id):
     project_payload = {
         'name': project_name_old, 'path': project_path_old,
         'description': project_description_old or "",
@@ -346,366 +730,1131 @@ def migrate_project_repo_py(
     if new_target_namespace_id:
         project_payload['namespace_id'] = new_target_namespace_id
         namespace_key_for_duplicate_check = str(new_target_namespace_id)
-    
-    if namespace_key_for_duplicate_check not in CREATED_PROJECT_PATHS_IN_NEW_NAMESPACE:
-        CREATED_PROJECT_PATHS_IN_NEW_NAMESPACE[namespace_key_for_duplicate_check] = set()
-    
+
+    with mapping_lock:
+        created_paths = CREATED_PROJECT_PATHS_IN_NEW_NAMESPACE.setdefault(namespace_key_for_duplicate_check, set())
+        already_processed = project_path_old in created_paths
+
     new_project = None
-    # ... (Rest of the find/create project logic from v6 is fine, ensure it uses _log_and_update_state for its errors) ...
-    if project_path_old in CREATED_PROJECT_PATHS_IN_NEW_NAMESPACE[namespace_key_for_duplicate_check]:
+    if already_processed:
         _log_and_update_state(f"Project path '{project_path_old}' marked as processed. Finding existing.", action=f"Find Project: {project_name_old}")
-        try: 
-            if new_target_namespace_id:
-                ns_obj = gl_new.groups.get(new_target_namespace_id)
-                projects_in_ns = ns_obj.projects.list(search=project_path_old, all=True, lazy=True)
-            else: projects_in_ns = gl_new.projects.list(owned=True, search=project_path_old, all=True, lazy=True)
-            found_project_lazy = next((p for p in projects_in_ns if p.path == project_path_old), None)
-            if found_project_lazy: new_project = gl_new.projects.get(found_project_lazy.id)
-            if not new_project: _log_and_update_state(f"Could not find existing project '{project_path_old}'. Skipping.", log_type="error"); return False
+        try:
+            new_project = _find_existing_project_retrying(project_path_old, new_target_namespace_id)
+            if not new_project: _log_and_update_state(f"Could not find existing project '{project_path_old}'. Skipping.", log_type="error"); return None, f"Existing project '{project_path_old}' not found on target after {FIND_EXISTING_PROJECT_ATTEMPTS} lookups"
             _log_and_update_state(f"Found existing project '{new_project.name}' with ID {new_project.id}.")
-        except Exception as e_find: _log_and_update_state(f"Error finding existing project '{project_name_old}': {e_find}. Skipping.", log_type="error"); return False
-    else: 
+        except Exception as e_find: _log_and_update_state(f"Error finding existing project '{project_name_old}': {e_find}. Skipping.", log_type="error"); return None, f"Error finding existing project: {e_find}"
+    else:
         try:
             _log_and_update_state(f"Creating project with payload: {json.dumps(project_payload)}", action=f"Create Project: {project_name_old}")
             new_project = gl_new.projects.create(project_payload)
             _log_and_update_state(f"Successfully created new project '{new_project.name}' (New ID: {new_project.id}).")
-            CREATED_PROJECT_PATHS_IN_NEW_NAMESPACE[namespace_key_for_duplicate_check].add(new_project.path)
+            with mapping_lock: created_paths.add(new_project.path)
         except gitlab.exceptions.GitlabCreateError as e:
             err_msg_lower = str(e.error_message).lower() if e.error_message else ""
             if "has already been taken" in err_msg_lower or "path already exists" in err_msg_lower:
-                CREATED_PROJECT_PATHS_IN_NEW_NAMESPACE[namespace_key_for_duplicate_check].add(project_path_old)
+                with mapping_lock: created_paths.add(project_path_old)
                 _log_and_update_state(f"Project path '{project_path_old}' 'already taken'. Retrying find.", log_type="warning")
-                try: 
-                    if new_target_namespace_id:
-                        ns_obj = gl_new.groups.get(new_target_namespace_id)
-                        projects_in_ns = ns_obj.projects.list(search=project_path_old, all=True, lazy=True)
-                    else: projects_in_ns = gl_new.projects.list(owned=True, search=project_path_old, all=True, lazy=True)
-                    found_project_lazy = next((p for p in projects_in_ns if p.path == project_path_old), None)
-                    if found_project_lazy: new_project = gl_new.projects.get(found_project_lazy.id)
-                    if not new_project: _log_and_update_state(f"Still couldn't find '{project_path_old}' after 'already taken'. Skipping.", log_type="error"); return False
+                try:
+                    new_project = _find_existing_project_retrying(project_path_old, new_target_namespace_id)
+                    # Only now, with the lookups given up, is "already taken" final (retry_policy matches "not found on target").
+                    if not new_project: _log_and_update_state(f"Still couldn't find '{project_path_old}' after 'already taken'. Skipping.", log_type="error"); return None, f"Path '{project_path_old}' has already been taken, but the project was not found on target after {FIND_EXISTING_PROJECT_ATTEMPTS} lookups"
                     _log_and_update_state(f"Found existing project '{new_project.name}' ID {new_project.id} after 'already taken'.")
-                except Exception as e_find_fail: _log_and_update_state(f"Error finding after 'already taken' for '{project_name_old}': {e_find_fail}. Skipping.", log_type="error"); return False
-            else: _log_and_update_state(f"ERROR creating project '{project_name_old}'. API: {e.error_message}. Resp: {e.response_body}", log_type="error"); return False
-        except Exception as e_unexp_proj: _log_and_update_state(f"UNEXPECTED ERROR creating project '{project_name_old}': {e_unexp_proj}", log_type="error"); return False
-
-    if not new_project: _log_and_update_state(f"ERROR: new_project is None for old project '{project_name_old}'. Cannot proceed.", log_type="error"); return False
+                except Exception as e_find_fail: _log_and_update_state(f"Error finding after 'already taken' for '{project_name_old}': {e_find_fail}. Skipping.", log_type="error"); return None, f"Error finding existing project: {e_find_fail}"
+            else: _log_and_update_state(f"ERROR creating project '{project_name_old}'. API: {e.error_message}. Resp: {e.response_body}", log_type="error"); return None, f"{e.response_code}: {e.error_message}"
+        except Exception as e_unexp_proj: _log_and_update_state(f"UNEXPECTED ERROR creating project '{project_name_old}': {e_unexp_proj}", log_type="error"); return None, f"Error creating project: {e_unexp_proj}"
+    return new_project, None
 
-    # Migrate project members
+def migrate_project_members(project_id_old, project_name_old, new_project):
+    """Syncs the project's effective membership as GitLab resolves it (members_all: direct members, members inherited
+    from ancestor groups and members of groups the project is shared with, at their highest level) to the new project."""
     try:
-        old_project = gl_old.projects.get(project_id_old)
+        old_project = gl_old.projects.get(project_id_old, lazy=True)
         try:
-            old_members = old_project.members_all.list(all=True)
-            _log_and_update_state(f"Found {len(old_members)} members (including inherited) in old project '{project_name_old}'. Migrating permissions...")
+            old_levels = _max_access_by_user(old_project.members_all.list(iterator=True, per_page=100))
         except Exception as e:
             _log_and_update_state(f"Warning: Could not fetch inherited members for project '{project_name_old}' ({e}). Falling back to direct members.")
-            old_members = old_project.members.list(all=True)
-            _log_and_update_state(f"Found {len(old_members)} direct members in old project '{project_name_old}'. Migrating permissions...")
-        
-        new_members = new_project.members.list(all=True)
-        new_member_user_ids = {m.id for m in new_members}
-        
-        for old_member in old_members:
-            new_user_id = OLD_TO_NEW_USER_ID_MAP.get(old_member.id)
-            if not new_user_id:
-                _log_and_update_state(f"  User {old_member.username} (ID {old_member.id}) not mapped to target. Skipping project permission migration.", log_type="warning")
-                continue
-                
-            if new_user_id in new_member_user_ids:
-                try:
-                    new_member_obj = new_project.members.get(new_user_id)
-                    if new_member_obj.access_level != old_member.access_level:
-                        new_member_obj.access_level = old_member.access_level
-                        new_member_obj.save()
-                        _log_and_update_state(f"  Updated member {old_member.username} access level to {old_member.access_level} (target user ID: {new_user_id}).")
-                except Exception as e_member_update:
-                    _log_and_update_state(f"  Failed to update member {old_member.username} (target user ID: {new_user_id}): {e_member_update}", log_type="warning")
-            else:
-                try:
-                    new_project.members.create({'user_id': new_user_id, 'access_level': old_member.access_level})
-                    _log_and_update_state(f"  Added member {old_member.username} with access level {old_member.access_level} (target user ID: {new_user_id}).")
-                except Exception as e_member_add:
-                    _log_and_update_state(f"  Failed to add member {old_member.username} (target user ID: {new_user_id}): {e_member_add}", log_type="warning")
+            old_levels = _max_access_by_user(old_project.members.list(iterator=True, per_page=100))
+        sync_members(new_project, old_levels, "project", project_name_old)
     except Exception as e_members:
         _log_and_update_state(f"Error migrating members for project '{project_name_old}': {e_members}", log_type="warning")
 
-    if new_project.attributes.get('empty_repo') is False:
-        _log_and_update_state(f"Repository '{new_project.name}' already contains data on target. Skipping clone and push.", action=f"Skipped: {project_name_old} (already migrated)")
-        return True
+def _git(git_dir, *args, check=False):
+    with timings.timed(timing_metrics.GIT_COMMAND_METRIC, operation=timing_metrics.git_operation_label(['git', *args])):
+        return subprocess.run(['git', '--git-dir', git_dir, *args], capture_output=True, text=True, check=check)
 
-    # Use HTTP URL with token for pushing instead of SSH
-    new_scheme, new_domain = NEW_GITLAB_URL.split('://', 1)
-    new_repo_url = f"{new_scheme}://oauth2:{NEW_GITLAB_TOKEN}@{new_domain.rstrip('/')}/{new_project.path_with_namespace}.git"
-    
-    # Hide tokens in logs
-    old_repo_url_log = f"{old_scheme}://oauth2:***@{old_domain.rstrip('/')}/{project_namespace_path_old}.git"
-    new_repo_url_log = f"{new_scheme}://oauth2:***@{new_domain.rstrip('/')}/{new_project.path_with_namespace}.git"
+def _run_git_with_progress(cmd, transfer_key):
+    """subprocess.run() for git commands started with --progress: output is streamed line by line and byte counts from
+    progress lines are fed to transfer_meter as they arrive. Only the last GIT_OUTPUT_TAIL_LINES lines of stdout/stderr
+    are kept (progress lines collapsed to their final state), so chatty pushes of huge repos don't pile up in memory."""
+    with timings.timed(timing_metrics.GIT_COMMAND_METRIC, operation=timing_metrics.git_operation_label(cmd)):
+        return _stream_git_output(cmd, transfer_key)
 
-    _log_and_update_state(f"Old Repo URL for clone (final): {old_repo_url_log}", action=f"Cloning: {project_name_old}")
-    _log_and_update_state(f"New Repo URL for push (final): {new_repo_url_log}")
-    safe_path_old = project_path_old.replace('/', '_'); temp_repo_path = os.path.join(MIGRATION_TEMP_DIR, f"{safe_path_old}_{project_id_old}_{int(time.time() * 1000)}.git")
-    if os.path.exists(temp_repo_path): shutil.rmtree(temp_repo_path)
-    _log_and_update_state(f"Cloning (mirror) '{old_repo_url_log}' to '{temp_repo_path}'...")
-    clone_proc = subprocess.run(['git', 'clone', '--mirror', old_repo_url, temp_repo_path], capture_output=True, text=True, check=False)
+def _stream_git_output(cmd, transfer_key):
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True) # universal newlines split \r updates into lines
+    stdout_lines = deque(maxlen=GIT_OUTPUT_TAIL_LINES)
+    stdout_reader = threading.Thread(target=lambda: stdout_lines.extend(line.rstrip('\n') for line in proc.stdout), daemon=True)
+    stdout_reader.start()
+    stderr_lines = deque(maxlen=GIT_OUTPUT_TAIL_LINES); reported = {}
+    for line in proc.stderr:
+        line = line.rstrip('\n')
+        if not line: continue
+        progress = parse_progress_bytes(line)
+        if progress:
+            phase, cumulative = progress
+            transfer_meter.add(transfer_key, PROGRESS_PHASE_KINDS[phase], cumulative - reported.get(phase, 0))
+            reported[phase] = max(cumulative, reported.get(phase, 0))
+        phase_prefix = line.split(':', 1)[0] + ':'
+        if stderr_lines and '%' in line and stderr_lines[-1].startswith(phase_prefix): stderr_lines[-1] = line
+        else: stderr_lines.append(line)
+    returncode = proc.wait(); stdout_reader.join()
+    return subprocess.CompletedProcess(cmd, returncode, "\n".join(stdout_lines), "\n".join(stderr_lines))
+
+def _pack_size_bytes(git_dir):
+    proc = _git(git_dir, 'count-objects', '-v')
+    sizes = dict(line.split(': ', 1) for line in proc.stdout.splitlines() if ': ' in line)
+    return int(sizes.get('size-pack', 0)) * 1024 + int(sizes.get('size', 0)) * 1024 # both reported in KiB
+
+def _dir_size_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try: total += os.path.getsize(os.path.join(root, name))
+            except OSError: pass
+    return total
+
+def _set_remote_url(git_dir, remote_name, url):
+    if _git(git_dir, 'remote', 'set-url', remote_name, url).returncode != 0:
+        _git(git_dir, 'remote', 'add', remote_name, url, check=True)
+
+def _list_branch_and_tag_refs(git_dir=None, remote_name=None):
+    """{refname: sha} for refs/heads and refs/tags, read from the local mirror or (with remote_name) from the remote."""
+    if remote_name:
+        proc = _git(git_dir, 'ls-remote', '--heads', '--tags', remote_name)
+        pairs = (line.split('\t', 1)[::-1] for line in proc.stdout.splitlines() if '\t' in line)
+    else:
+        proc = _git(git_dir, 'for-each-ref', '--format=%(refname) %(objectname)', 'refs/heads', 'refs/tags')
+        pairs = (line.split(' ', 1) for line in proc.stdout.splitlines() if ' ' in line)
+    if proc.returncode != 0: raise RuntimeError(proc.stderr.strip() or f"git exited with {proc.returncode}")
+    return {ref: sha for ref, sha in pairs if not ref.endswith('^{}')}
+
+def _count_pack_download(mirror_path, transfer_key, pack_bytes_before):
+    # Small transfers don't print a size in their progress line; fall back to how much the object store grew.
+    if transfer_meter.project_bytes(transfer_key, "pack_download") == 0:
+        transfer_meter.add(transfer_key, "pack_download", _pack_size_bytes(mirror_path) - pack_bytes_before)
+
+def _pin_reference_mirror(reference_path):
+    # Forks' mirrors read objects from here, so its unreachable objects must never be pruned (e.g. after a force-push).
+    _git(reference_path, 'config', 'gc.pruneExpire', 'never')
+
+def _share_lfs_objects(reference_path, mirror_path):
+    """Hard-links the fork parent's LFS objects into the fork's store, so 'lfs fetch --all' skips the ones they share."""
+    source_store = os.path.join(reference_path, 'lfs', 'objects'); target_store = os.path.join(mirror_path, 'lfs', 'objects'); linked = 0
+    for root, _, files in os.walk(source_store):
+        target_dir = os.path.join(target_store, os.path.relpath(root, source_store))
+        for name in files:
+            target = os.path.join(target_dir, name)
+            if os.path.exists(target): continue
+            try: os.makedirs(target_dir, exist_ok=True); os.link(os.path.join(root, name), target); linked += 1
+            except OSError: return linked # e.g. another filesystem: let git-lfs download them
+    return linked
+
+def _refresh_mirror_cache(mirror_path, old_repo_url, old_repo_url_log, transfer_key, reference_path=None):
+    """Brings the cached bare mirror up to date (fetch --prune) or creates it (clone --mirror). A new clone borrows
+    the objects of reference_path (the fork parent's mirror) when it exists. Returns (ok, is_empty, stderr)."""
+    if os.path.isdir(mirror_path) and missing_alternates(mirror_path):
+        _log_and_update_state(f"Cached mirror '{mirror_path}' borrows objects from a mirror that is gone. Re-cloning.", log_type="warning")
+        shutil.rmtree(mirror_path, ignore_errors=True)
+    if os.path.isdir(mirror_path):
+        _log_and_update_state(f"Refreshing cached mirror '{mirror_path}' from '{old_repo_url_log}' (fetch --prune)...")
+        try:
+            _set_remote_url(mirror_path, 'origin', old_repo_url)
+            pack_bytes_before = _pack_size_bytes(mirror_path)
+            fetch_proc = _run_git_with_progress(['git', '--git-dir', mirror_path, 'fetch', '--progress', '--prune', 'origin'], transfer_key)
+            if fetch_proc.returncode == 0:
+                _count_pack_download(mirror_path, transfer_key, pack_bytes_before)
+                return True, False, ""
+            _log_and_update_state(f"Fetch into cached mirror failed ({fetch_proc.stderr.strip()}). Re-cloning.", log_type="warning")
+        except subprocess.CalledProcessError as e_cache:
+            _log_and_update_state(f"Cached mirror '{mirror_path}' is unusable ({e_cache.stderr}). Re-cloning.", log_type="warning")
+        shutil.rmtree(mirror_path, ignore_errors=True)
+    clone_cmd = ['git', 'clone', '--mirror', '--progress']
+    if reference_path and os.path.isdir(reference_path):
+        _pin_reference_mirror(reference_path)
+        clone_cmd += ['--reference', os.path.abspath(reference_path)]
+        _log_and_update_state(f"Cloning (mirror) '{old_repo_url_log}' to '{mirror_path}', borrowing objects from fork parent mirror '{reference_path}'...")
+    else: _log_and_update_state(f"Cloning (mirror) '{old_repo_url_log}' to '{mirror_path}'...")
+    clone_proc = _run_git_with_progress(clone_cmd + [old_repo_url, mirror_path], transfer_key)
     if clone_proc.returncode != 0:
-        if "empty repository" in clone_proc.stderr.lower(): _log_and_update_state(f"INFO: Old project '{project_namespace_path_old}' is empty. Skipping push."); shutil.rmtree(temp_repo_path, ignore_errors=True); return True 
-        _log_and_update_state(f"ERROR: Failed to clone '{old_repo_url}'. Stderr: {clone_proc.stderr}", log_type="error"); shutil.rmtree(temp_repo_path, ignore_errors=True); return False
-    _log_and_update_state(f"Fetching LFS objects for '{project_name_old}'...", action=f"Fetching LFS: {project_name_old}")
-    lfs_fetch_proc = subprocess.run(['git', '--git-dir', temp_repo_path, 'lfs', 'fetch', '--all'], capture_output=True, text=True, check=False)
-    if lfs_fetch_proc.returncode != 0:
-        _log_and_update_state(f"Note: LFS fetch output (safe to ignore if no LFS): {lfs_fetch_proc.stderr.strip()}", log_type="info")
-
-    _log_and_update_state(f"Pushing from '{temp_repo_path}' to new remote '{new_repo_url}'...", action=f"Pushing: {project_name_old}")
+        shutil.rmtree(mirror_path, ignore_errors=True)
+        return False, "empty repository" in clone_proc.stderr.lower(), clone_proc.stderr
+    _count_pack_download(mirror_path, transfer_key, 0)
+    return True, False, ""
+
+def _scrub_remote_token(mirror_path, remote_name, repo_url_log):
+    # The mirror outlives the run, so don't leave access tokens in its config.
+    if os.path.isdir(mirror_path): _git(mirror_path, 'remote', 'set-url', remote_name, repo_url_log)
+
+def _push_changed_refs(mirror_path, project_name_old, transfer_key):
+    """Delta sync: pushes only branches/tags whose target SHA differs from the source. Returns (ok, pushed_count, stderr)."""
+    source_refs = _list_branch_and_tag_refs(mirror_path)
+    target_refs = _list_branch_and_tag_refs(mirror_path, remote_name='aws-target')
+    changed = sorted(ref for ref, sha in source_refs.items() if target_refs.get(ref) != sha)
+    target_only = len(set(target_refs) - set(source_refs))
+    if target_only: _log_and_update_state(f"  {target_only} branches/tags exist only on the target for '{project_name_old}'. Leaving them untouched.")
+    if not changed:
+        _log_and_update_state(f"Target already matches source for '{project_name_old}' ({len(source_refs)} refs). Nothing to push.", action=f"Up to date: {project_name_old}")
+        return True, 0, ""
+    _log_and_update_state(f"Delta sync: {len(changed)} of {len(source_refs)} refs changed for '{project_name_old}'.", action=f"Delta push: {project_name_old}")
+    lfs_push_proc = _run_git_with_progress(['git', '--git-dir', mirror_path, 'lfs', 'push', 'aws-target', *changed], transfer_key)
+    if lfs_push_proc.returncode != 0:
+         _log_and_update_state(f"Note: LFS push output: {lfs_push_proc.stderr.strip()}", log_type="info")
+    for i in range(0, len(changed), DELTA_PUSH_BATCH_SIZE): # keep the command line bounded for repos with many tags
+        batch = changed[i:i + DELTA_PUSH_BATCH_SIZE]
+        push_proc = _run_git_with_progress(['git', '--git-dir', mirror_path, 'push', '--progress', '--force', 'aws-target', *[f"{ref}:{ref}" for ref in batch]], transfer_key)
+        if push_proc.returncode != 0: return False, i, push_proc.stderr
+    return True, len(changed), ""
+
+def _repo_urls(base_url, token, path_with_namespace):
+    """(url with token for git, same url with the token masked for logs)."""
+    scheme, domain = base_url.split('://', 1)
+    repo_path = f"{domain.rstrip('/')}/{path_with_namespace}.git"
+    return f"{scheme}://oauth2:{token}@{repo_path}", f"{scheme}://oauth2:***@{repo_path}"
+
+def _fetch_repository_py(project_name_old, project_namespace_path_old, transfer_key, mirror_path, reference_path=None):
+    """Clone stage: refreshes the cached mirror and its LFS objects. Returns (outcome, lfs_store_bytes) where outcome
+    is 'ok', 'empty' (nothing to push) or the failure detail. A fork reuses its parent's cached mirror (reference_path)."""
+    # Use HTTP URL with token for cloning/pushing instead of SSH
+    old_repo_url, old_repo_url_log = _repo_urls(OLD_GITLAB_URL, OLD_GITLAB_TOKEN, project_namespace_path_old)
+    _log_and_update_state(f"Old Repo URL for clone (final): {old_repo_url_log}", action=f"Cloning: {project_name_old}")
+    with timings.stage("fetch"): cloned_ok, source_is_empty, clone_stderr = _refresh_mirror_cache(mirror_path, old_repo_url, old_repo_url_log, transfer_key, reference_path)
+    if not cloned_ok:
+        if source_is_empty: _log_and_update_state(f"INFO: Old project '{project_namespace_path_old}' is empty. Skipping push."); return "empty", 0
+        _log_and_update_state(f"ERROR: Failed to clone '{old_repo_url_log}'. Stderr: {clone_stderr}", log_type="error"); return f"Clone failed: {clone_stderr.strip()}", 0
+    try:
+        _log_and_update_state(f"Fetching LFS objects for '{project_name_old}'...", action=f"Fetching LFS: {project_name_old}")
+        lfs_store = os.path.join(mirror_path, 'lfs', 'objects')
+        if reference_path and os.path.isdir(reference_path):
+            shared = _share_lfs_objects(reference_path, mirror_path)
+            if shared: _log_and_update_state(f"  Reused {shared} LFS objects from the fork parent's mirror.")
+        lfs_bytes_before = _dir_size_bytes(lfs_store)
+        with timings.stage("lfs_fetch"): lfs_fetch_proc = _run_git_with_progress(['git', '--git-dir', mirror_path, 'lfs', 'fetch', '--all'], transfer_key)
+        if lfs_fetch_proc.returncode != 0:
+            _log_and_update_state(f"Note: LFS fetch output (safe to ignore if no LFS): {lfs_fetch_proc.stderr.strip()}", log_type="info")
+        lfs_store_bytes = _dir_size_bytes(lfs_store)
+        if transfer_meter.project_bytes(transfer_key, "lfs_download") == 0: # git-lfs prints no progress without a terminal
+            transfer_meter.add(transfer_key, "lfs_download", lfs_store_bytes - lfs_bytes_before)
+    finally: _scrub_remote_token(mirror_path, 'origin', old_repo_url_log)
+    return "ok", lfs_store_bytes
+
+def _push_mirror_refs(mirror_path, transfer_key):
+    with timings.stage("push"): return _push_mirror_refs_timed(mirror_path, transfer_key)
+
+def _push_mirror_refs_timed(mirror_path, transfer_key):
+    # Try a full mirror push first to get all refs (including custom ones)
+    push_proc = _run_git_with_progress(['git', '--git-dir', mirror_path, 'push', '--progress', '--mirror', 'aws-target'], transfer_key)
+
+    # If GitLab blocks it because of hidden refs (like MRs), fallback to standard branches and tags
+    if push_proc.returncode != 0 and ("deny updating a hidden ref" in push_proc.stderr or "protected" in push_proc.stderr):
+        _log_and_update_state(f"Push --mirror failed with: {push_proc.stderr.strip()}. Falling back to refs/heads and refs/tags.")
+        push_proc = _run_git_with_progress(['git', '--git-dir', mirror_path, 'push', '--progress', '--force', 'aws-target', 'refs/heads/*:refs/heads/*', 'refs/tags/*:refs/tags/*'], transfer_key)
+    return push_proc
+
+def _push_lfs_objects(mirror_path, transfer_key, lfs_store_bytes):
+    with timings.stage("lfs_push"): lfs_push_proc = _run_git_with_progress(['git', '--git-dir', mirror_path, 'lfs', 'push', '--all', 'aws-target'], transfer_key)
+    if lfs_push_proc.returncode != 0:
+         _log_and_update_state(f"Note: LFS push output: {lfs_push_proc.stderr.strip()}", log_type="info")
+    elif transfer_meter.project_bytes(transfer_key, "lfs_upload") == 0:
+        # git-lfs only prints progress to a terminal; the target starts empty, so the whole local store was uploaded.
+        transfer_meter.add(transfer_key, "lfs_upload", lfs_store_bytes)
+
+def _push_repository_py(mirror_path, lfs_store_bytes, project_name_old, project_namespace_path_old, new_project, transfer_key):
+    """Push stage: sends the mirror (and its LFS objects) to the target project. Returns (ok, failure_detail)."""
+    new_repo_url, new_repo_url_log = _repo_urls(NEW_GITLAB_URL, NEW_GITLAB_TOKEN, new_project.path_with_namespace)
+    _log_and_update_state(f"Pushing from '{mirror_path}' to new remote '{new_repo_url_log}'...", action=f"Pushing: {project_name_old}")
     try:
-        subprocess.run(['git', '--git-dir', temp_repo_path, 'remote', 'add', 'aws-target', new_repo_url], check=True, capture_output=True, text=True)
+        _set_remote_url(mirror_path, 'aws-target', new_repo_url)
         # Increase http.postBuffer to 2GB to support pushing very large repositories (300MB - 2GB+)
-        subprocess.run(['git', '--git-dir', temp_repo_path, 'config', 'http.postBuffer', '2147483648'], check=True, capture_output=True, text=True)
-        
-        _log_and_update_state(f"Pushing LFS objects to target...", action=f"Pushing LFS: {project_name_old}")
-        lfs_push_proc = subprocess.run(['git', '--git-dir', temp_repo_path, 'lfs', 'push', '--all', 'aws-target'], capture_output=True, text=True, check=False)
-        if lfs_push_proc.returncode != 0:
-             _log_and_update_state(f"Note: LFS push output: {lfs_push_proc.stderr.strip()}", log_type="info")
-        
-        # Try a full mirror push first to get all refs (including custom ones)
-        push_proc = subprocess.run(['git', '--git-dir', temp_repo_path, 'push', '--mirror', 'aws-target'], capture_output=True, text=True, check=False)
-        
-        # If GitLab blocks it because of hidden refs (like MRs), fallback to standard branches and tags
-        if push_proc.returncode != 0 and ("deny updating a hidden ref" in push_proc.stderr or "protected" in push_proc.stderr):
-            _log_and_update_state(f"Push --mirror failed with: {push_proc.stderr.strip()}. Falling back to refs/heads and refs/tags.")
-            push_proc = subprocess.run(['git', '--git-dir', temp_repo_path, 'push', '--force', 'aws-target', 'refs/heads/*:refs/heads/*', 'refs/tags/*:refs/tags/*'], capture_output=True, text=True, check=False)
+        _git(mirror_path, 'config', 'http.postBuffer', '2147483648', check=True)
+
+        if new_project.attributes.get('empty_repo') is False:
+            # Only reached in delta-sync mode: the target already has history, so send just what changed.
+            with timings.stage("push"): delta_ok, pushed_count, delta_stderr = _push_changed_refs(mirror_path, project_name_old, transfer_key)
+            if not delta_ok:
+                _log_and_update_state(f"ERROR: Delta push to '{new_repo_url_log}' failed after {pushed_count} refs. Stderr: {delta_stderr.strip()}", log_type="error"); return False, f"Delta push failed: {delta_stderr.strip()}"
+            _log_and_update_state(f"Delta sync finished for '{project_namespace_path_old}' ({pushed_count} refs pushed).")
+            return True, None
 
-    except subprocess.CalledProcessError as e_remote: _log_and_update_state(f"ERROR adding remote for '{new_repo_url_log}'. Stderr: {e_remote.stderr}", log_type="error"); shutil.rmtree(temp_repo_path, ignore_errors=True); return False
-    finally: shutil.rmtree(temp_repo_path, ignore_errors=True)
+        if not lfs_store_bytes:
+            push_proc = _push_mirror_refs(mirror_path, transfer_key)
+        elif not PARALLEL_LFS_PUSH:
+            _log_and_update_state("Pushing LFS objects to target...", action=f"Pushing LFS: {project_name_old}")
+            _push_lfs_objects(mirror_path, transfer_key, lfs_store_bytes)
+            push_proc = _push_mirror_refs(mirror_path, transfer_key)
+        else:
+            _log_and_update_state("Pushing LFS objects alongside the pack push...", action=f"Pushing pack + LFS: {project_name_old}")
+            lfs_pusher = threading.Thread(target=timings.wrap_project(_push_lfs_objects), args=(mirror_path, transfer_key, lfs_store_bytes), name="lfs-push", daemon=True)
+            lfs_pusher.start()
+            push_proc = _push_mirror_refs(mirror_path, transfer_key)
+            lfs_pusher.join()
+            if push_proc.returncode != 0 and "LFS objects are missing" in push_proc.stderr:
+                # The target checked LFS integrity before the parallel upload finished; every object is there now.
+                _log_and_update_state(f"Target rejected the pack before LFS objects finished uploading for '{project_name_old}'. Re-pushing refs.")
+                push_proc = _push_mirror_refs(mirror_path, transfer_key)
+
+    except (subprocess.CalledProcessError, RuntimeError) as e_remote:
+        err_detail = e_remote.stderr if isinstance(e_remote, subprocess.CalledProcessError) else e_remote
+        _log_and_update_state(f"ERROR preparing push to '{new_repo_url_log}'. Stderr: {err_detail}", log_type="error"); return False, f"Preparing push failed: {err_detail}"
+    finally: _scrub_remote_token(mirror_path, 'aws-target', new_repo_url_log)
     if push_proc.returncode != 0:
         if "deny updating a hidden ref" in push_proc.stderr or "rpc error: code = Canceled" in push_proc.stderr or "No refs in common" in push_proc.stderr or "remote end hung up unexpectedly" in push_proc.stderr:
-            _log_and_update_state(f"Push to '{new_repo_url_log}' non-critical messages or empty. Stdout: {push_proc.stdout.strip()} Stderr: {push_proc.stderr.strip()}", log_type="warning"); return True 
-        _log_and_update_state(f"ERROR: Failed to push to '{new_repo_url_log}'. Stdout: {push_proc.stdout.strip()} Stderr: {push_proc.stderr.strip()}", log_type="error"); return False
-    
-    add_migrated_bytes(50 * 1024 * 1024) # mock 50MB per repo
+            _log_and_update_state(f"Push to '{new_repo_url_log}' non-critical messages or empty. Stdout: {push_proc.stdout.strip()} Stderr: {push_proc.stderr.strip()}", log_type="warning"); return True, None
+        _log_and_update_state(f"ERROR: Failed to push to '{new_repo_url_log}'. Stdout: {push_proc.stdout.strip()} Stderr: {push_proc.stderr.strip()}", log_type="error"); return False, f"Push failed: {push_proc.stderr.strip()}"
+
     _log_and_update_state(f"Successfully migrated Git data for '{project_namespace_path_old}'.")
-    return True
+    return True, None
+
+@contextmanager
+def _slot(semaphore, wait_stage):
+    """Holds one of semaphore's slots; the time spent waiting for it is recorded as wait_stage."""
+    with timings.stage(wait_stage): semaphore.acquire()
+    try: yield
+    finally: semaphore.release()
+
+def _transfer_repository_py(project_id_old, project_name_old, project_namespace_path_old, new_project, transfer_key, fork_parent_id=None, size_bytes=None,
+                            clone_slots=None, push_slots=None):
+    # Mirrors are cached per old project ID and kept between runs, so later syncs only transfer the delta. The
+    # workspace lease reserves disk for the clone/fetch and keeps the mirror (and its fork parent's) from eviction.
+    # clone_slots/push_slots default to this process's git_slots/git_push_slots; a transfer worker passes its own.
+    reference_path = workspace.find_mirror(fork_parent_id) if fork_parent_id and FORK_DEDUP else None
+    try:
+        with timings.stage("disk_wait"): lease = workspace.acquire(project_id_old, size_bytes, pins=(fork_parent_id,) if reference_path else ())
+    except WorkspaceFull as e:
+        _log_and_update_state(f"ERROR: {e} ('{project_namespace_path_old}').", log_type="error"); return False, str(e)
+    with lease:
+        # Clone and push take separate slots: once this project's mirror is ready, its git_slots seat goes to the
+        # next project's clone while this one waits for / runs its push.
+        with _slot(clone_slots or git_slots, "clone_wait"):
+            outcome, lfs_store_bytes = _fetch_repository_py(project_name_old, project_namespace_path_old, transfer_key, lease.path, reference_path)
+        lease.settle()
+        if outcome == "empty": return True, None
+        if outcome != "ok": return False, outcome
+        with _slot(push_slots or git_push_slots, "push_wait"):
+            return _push_repository_py(lease.path, lfs_store_bytes, project_name_old, project_namespace_path_old, new_project, transfer_key)
+
+def _transfer_via_workers(project_id_old, project_name_old, project_namespace_path_old, new_project, transfer_key, fork_parent_id=None, size_bytes=None):
+    """_transfer_repository_py() run by a worker process: enqueues the job and waits for its result, feeding the
+    worker's byte progress into transfer_meter and its stage timings into timings as they arrive."""
+    transfer_queue.enqueue(project_id_old, {"project_id": project_id_old, "name": project_name_old, "path_with_namespace": project_namespace_path_old,
+                                            "new_path_with_namespace": new_project.path_with_namespace, "new_empty_repo": new_project.attributes.get('empty_repo'),
+                                            "fork_parent_id": fork_parent_id, "size_bytes": size_bytes})
+    seen = {}; worker_id = None; poll_seconds = WORKER_RESULT_POLL_MIN_SECONDS; no_worker_since = None
+    def account(progress):
+        for kind, byte_count in progress.items():
+            transfer_meter.add(transfer_key, kind, byte_count - seen.get(kind, 0)); seen[kind] = max(byte_count, seen.get(kind, 0))
+    try:
+        while True:
+            job = transfer_queue.get(project_id_old)
+            if job is None: return False, "Transfer job vanished from the work queue"
+            if job["worker_id"] != worker_id and job["worker_id"]:
+                if worker_id: seen.clear() # re-leased: the new worker counts from zero again
+                worker_id = job["worker_id"]; _log_and_update_state(f"  '{project_namespace_path_old}' leased to worker {worker_id}.")
+            account(job["progress"])
+            if job["state"] == "done": break
+            now = time.time()
+            # claim() only fails over-leased jobs when some worker polls; don't count on one being left to do it.
+            if job["state"] == "leased" and job["leases"] >= WORKER_MAX_LEASES and job["lease_expires_at"] < now:
+                transfer_queue.fail(project_id_old, f"Worker lease expired {job['leases']} times (worker lost or stalled)"); continue
+            if _transfer_workers_alive(): no_worker_since = None
+            elif no_worker_since is None and WORKER_TOKEN: no_worker_since = now # a remote worker may still (re)connect
+            elif no_worker_since is None or now - no_worker_since >= WORKER_LEASE_SECONDS:
+                transfer_queue.fail(project_id_old, "No transfer worker is running (local workers exited and no remote worker checked in)"); continue
+            time.sleep(poll_seconds); poll_seconds = min(poll_seconds * 2, WORKER_RESULT_POLL_SECONDS)
+    finally: transfer_queue.remove(project_id_old)
+    result = job["result"]
+    timings.add_stages(result.get("stages") or {})
+    return result["ok"], result.get("detail")
 
-def migrate_users_py():
+def _transfer_workers_alive():
+    """True while a local worker process runs or, with remote workers allowed, any worker checked in within one lease.
+    Reports each local worker that exited once."""
+    alive = False
+    for process in local_worker_processes:
+        if process.poll() is None: alive = True
+        elif process.pid not in exited_local_workers:
+            exited_local_workers.add(process.pid)
+            _log_and_update_state(f"Local transfer worker (PID {process.pid}) exited with code {process.returncode}.", log_type="error")
+    return alive or (bool(WORKER_TOKEN) and transfer_queue.live_workers() > 0)
+
+def _start_local_workers():
+    for index in range(LOCAL_WORKERS):
+        local_worker_processes.append(subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "migration_worker.py"), "--queue", WORK_QUEUE_DB_PATH, "--slots", str(WORKER_SLOTS),
+                                                        "--worker-id", f"{os.uname().nodename}-local-{index + 1}", "--parent-pid", str(os.getpid())]))
+    if LOCAL_WORKERS: _log_and_update_state(f"Started {LOCAL_WORKERS} local transfer worker(s) with {WORKER_SLOTS} slot(s) each.")
+
+def _stop_local_workers():
+    for process in local_worker_processes: process.terminate()
+    for process in local_worker_processes:
+        try: process.wait(timeout=10)
+        except subprocess.TimeoutExpired: process.kill()
+    local_worker_processes.clear(); exited_local_workers.clear()
+
+def _link_fork_on_new(new_project, fork_parent_id_old, project_namespace_path_old):
+    """Recreates the fork relation on the target before the first push, so GitLab can share the parent's objects
+    (and only fork-specific objects are uploaded). A parent that isn't migrated leaves the fork standalone."""
+    with mapping_lock: parent_new_id = NEW_PROJECT_IDS.get(fork_parent_id_old)
+    if parent_new_id is None and checkpoint: parent_new_id = checkpoint.new_project_id(fork_parent_id_old)
+    if parent_new_id is None:
+        _log_and_update_state(f"  Fork parent (old ID {fork_parent_id_old}) of '{project_namespace_path_old}' is not migrated; keeping it as a standalone project.", log_type="warning"); return
+    if (new_project.attributes.get('forked_from_project') or {}).get('id') == parent_new_id: return
+    try:
+        new_project.create_fork_relation(parent_new_id)
+        _log_and_update_state(f"  Linked '{project_namespace_path_old}' as a fork of target project {parent_new_id}.")
+    except gitlab.exceptions.GitlabCreateError as e:
+        if e.response_code == 409: return # already forked from something
+        _log_and_update_state(f"  Could not link '{project_namespace_path_old}' to its fork parent (target ID {parent_new_id}): {e.error_message}", log_type="warning")
+    except Exception as e: _log_and_update_state(f"  Could not link '{project_namespace_path_old}' to its fork parent (target ID {parent_new_id}): {e}", log_type="warning")
+
+def migrate_project_repo_py(
+    project_id_old, project_name_old, project_path_old, project_namespace_path_old,
+    project_description_old, project_visibility_old, old_repo_ssh_url_from_stub,
+    new_target_namespace_id, old_project_attrs=None
+):
+    """Creates/finds the target project, syncs its members and transfers the repository. Returns (ok, failure_detail)."""
+    _log_and_update_state(f"Project: '{project_namespace_path_old}' (Old ID: {project_id_old})",
+                          action=f"Processing Project: {project_name_old}",
+                          section="projects", item_name=project_namespace_path_old)
+
+    # API work and git work are throttled separately so slow clones don't starve API-bound workers (and vice versa).
+    with _slot(api_slots, "api_wait"), timings.stage("api"):
+        new_project, create_error = _create_or_find_project_on_new(project_name_old, project_path_old, project_description_old, project_visibility_old, new_target_namespace_id)
+        if not new_project: _log_and_update_state(f"ERROR: new_project is None for old project '{project_name_old}'. Cannot proceed.", log_type="error"); return False, create_error
+        with mapping_lock: NEW_PROJECT_IDS[project_id_old] = new_project.id
+        migrate_project_members(project_id_old, project_name_old, new_project)
+        fork_parent_id = fork_network.fork_parent_id(old_project_attrs) if FORK_DEDUP else None
+        if fork_parent_id: _link_fork_on_new(new_project, fork_parent_id, project_namespace_path_old)
+
+    if new_project.attributes.get('empty_repo') is False and not delta_sync_enabled:
+        _log_and_update_state(f"Repository '{new_project.name}' already contains data on target. Skipping clone and push.", action=f"Skipped: {project_name_old} (already migrated)")
+        return True, None
+
+    transfer_meter.start_project(project_namespace_path_old)
+    transfer = _transfer_via_workers if transfer_queue is not None else _transfer_repository_py
+    try: transferred_ok, failure_detail = transfer(project_id_old, project_name_old, project_namespace_path_old, new_project, project_namespace_path_old, fork_parent_id, _attributes_size_bytes(old_project_attrs))
+    finally: transfer = transfer_meter.finish_project(project_namespace_path_old)
+    if transferred_ok and transfer:
+        PROJECT_TRANSFER_STATS[project_id_old] = transfer
+        _log_and_update_state(f"  Transferred {format_bytes(transfer['total_bytes'])} for '{project_namespace_path_old}' in {transfer['seconds']}s ({transfer['mb_s']} MB/s; "
+                              f"pack {format_bytes(transfer['pack_download'])} down / {format_bytes(transfer['pack_upload'])} up, "
+                              f"LFS {format_bytes(transfer['lfs_download'])} down / {format_bytes(transfer['lfs_upload'])} up).")
+    return transferred_ok, failure_detail
+
+def record_phase_throughput(phase, processed, started_at):
+    """Stores items/s for a phase under metrics['phase_throughput'][phase]."""
+    elapsed = max(time.time() - started_at, 1e-6)
+    with state_lock:
+        phases = current_migration_state.setdefault("metrics", {}).setdefault("phase_throughput", {})
+        phases[phase] = {"processed": processed, "seconds": round(elapsed, 1), "per_s": round(processed / elapsed, 2)}
+
+def _index_new_users():
+    """Streams target users page by page into compact lowercase username/email -> ID lookups."""
+    id_by_username = {}; id_by_email = {}
+    for u in gl_new.users.list(iterator=True, per_page=USER_LIST_PAGE_SIZE):
+        id_by_username[u.username.lower()] = u.id
+        email = getattr(u, 'email', None)
+        if email: id_by_email[email.lower()] = u.id
+    return id_by_username, id_by_email
+
+def _create_user(payload):
+    """Creates a user on the target. 429s are handled once, below this call: the session's limiter pauses every
+    caller until Retry-After has passed and python-gitlab retries the request."""
+    with timings.timed(timing_metrics.ITEM_METRIC, phase="users"): return gl_new.users.create(payload)
+
+def migrate_users_py(plan=None, scoped_users=None):
+    """With a plan, users come from the plan file and its username -> target ID matches instead of listing both instances.
+    With scoped_users ({old ID: username}), only those users are fetched and looked up on the target one by one."""
     global OLD_TO_NEW_USER_ID_MAP
     _log_and_update_state("=== PHASE 0: Migrating Users ===", action="Starting user migration")
     with state_lock: current_migration_state["status"] = "migrating_users"
-    if not gl_old or not gl_new: return
-    
+    if not gl_old or not gl_new: return False
+
+    phase_started_at = time.time(); processed = 0
     try:
-        old_users = gl_old.users.list(all=True)
-        with state_lock: current_migration_state["stats"]["users"] = {"total": len(old_users), "completed": 0, "current_item_name": ""}
-        _log_and_update_state(f"Found {len(old_users)} users in old GitLab.")
-        
-        new_users = gl_new.users.list(all=True)
-        new_user_emails = {u.email.lower() for u in new_users if getattr(u, 'email', None)}
-        new_user_usernames = {u.username.lower() for u in new_users}
-        new_user_id_by_username = {u.username.lower(): u.id for u in new_users}
-        new_user_id_by_email = {u.email.lower(): u.id for u in new_users if getattr(u, 'email', None)}
-        
-        for u in old_users:
-            if u.username == 'root': 
-                new_root_id = new_user_id_by_username.get('root')
-                if new_root_id:
-                    OLD_TO_NEW_USER_ID_MAP[u.id] = new_root_id
-                    _log_and_update_state(f"Mapped old root user ID {u.id} to new root user ID {new_root_id}.")
-                with state_lock: current_migration_state["stats"]["users"]["completed"] += 1
-                continue # skip root
-                
-            # Check if user already exists
-            existing_id = None
-            if u.username.lower() in new_user_usernames:
-                existing_id = new_user_id_by_username[u.username.lower()]
-            elif getattr(u, 'email', None) and u.email.lower() in new_user_emails:
-                existing_id = new_user_id_by_email[u.email.lower()]
-                
-            if existing_id:
-                OLD_TO_NEW_USER_ID_MAP[u.id] = existing_id
-                _log_and_update_state(f"User {u.username} already exists in new GitLab (ID: {existing_id}). Skipping creation.", section="users", item_name=u.username, increment_completed=True)
-                continue
-                
-            _log_and_update_state(f"Creating user {u.username}...", action=f"Creating user {u.username}", section="users", item_name=u.username)
-            
-            payload = {
-                'email': getattr(u, 'email', f"{u.username}@example.com"), # Fallback if email is hidden
-                'username': u.username,
-                'name': u.name,
-                'password': 'Password123!', # Temporary password
-                'skip_confirmation': True
-            }
+        if plan:
+            new_user_id_by_username = {u["username"].lower(): u["new_id"] for u in plan["users"] if u["new_id"]}; new_user_id_by_email = {}
+            old_users = [SimpleNamespace(**{key: u.get(key) for key in ("id", "username", "email", "name")}) for u in plan["users"]]
+            old_user_total = len(old_users)
+            _log_and_update_state(f"Using planned users: {plan['summary']['users']}.")
+        elif scoped_users is not None:
+            old_users = _fetch_scoped_old_users(scoped_users)
+            old_user_total = len(scoped_users)
+        else:
+            _log_and_update_state("Indexing users on new GitLab...", action="Indexing target users")
+            new_user_id_by_username, new_user_id_by_email = _index_new_users()
+            _log_and_update_state(f"Indexed {len(new_user_id_by_username)} users in new GitLab.")
+            old_users = gl_old.users.list(iterator=True, per_page=USER_LIST_PAGE_SIZE)
+            old_user_total = old_users.total
+        def find_indexed_user(username, email):
+            return new_user_id_by_username.get(username.lower()) or (new_user_id_by_email.get(email.lower()) if email else None)
+        find_existing_user = find_indexed_user if plan or scoped_users is None else _find_new_user_id
+        # X-Total is missing on large instances; the preflight count (if it's done) fills in.
+        with state_lock: current_migration_state["stats"]["users"] = {"total": old_user_total or preflight.get("users") or 0, "completed": 0, "current_item_name": ""}
+        _log_and_update_state(f"Streaming users from old GitLab ({old_user_total if old_user_total is not None else 'unknown number of'} users).")
+
+        pending = {}
+
+        def finish_creation(future):
+            u = pending.pop(future)
             try:
-                new_u = gl_new.users.create(payload)
-                OLD_TO_NEW_USER_ID_MAP[u.id] = new_u.id
-                add_migrated_bytes(2 * 1024 * 1024) # mock 2MB per user
+                new_u = future.result()
+                _map_user(u.id, new_u.id, u.username)
                 _log_and_update_state(f"Created user {u.username} successfully (New ID: {new_u.id}).", section="users", item_name=u.username, increment_completed=True)
             except Exception as e:
                 _log_and_update_state(f"Failed to create user {u.username}: {e}", log_type="error", section="users", item_name=u.username, increment_completed=True)
-                
+
+        with ThreadPoolExecutor(max_workers=USER_CREATE_CONCURRENCY, thread_name_prefix="user-create") as executor:
+            try:
+                for u in old_users:
+                    processed += 1
+                    with state_lock:
+                        user_stats = current_migration_state["stats"]["users"]
+                        user_stats["total"] = max(user_stats["total"], processed)
+                    if processed % USER_LIST_PAGE_SIZE == 0: record_phase_throughput("users", processed, phase_started_at)
+
+                    if u.id in OLD_TO_NEW_USER_ID_MAP: # mapped by a previous (resumed) run
+                        with state_lock: current_migration_state["stats"]["users"]["completed"] += 1
+                        continue
+                    if u.username == 'root':
+                        new_root_id = find_existing_user('root', None)
+                        if new_root_id:
+                            _map_user(u.id, new_root_id, u.username)
+                            _log_and_update_state(f"Mapped old root user ID {u.id} to new root user ID {new_root_id}.")
+                        with state_lock: current_migration_state["stats"]["users"]["completed"] += 1
+                        continue # skip root
+
+                    # Check if user already exists
+                    email = getattr(u, 'email', None)
+                    existing_id = find_existing_user(u.username, email)
+                    if existing_id:
+                        _map_user(u.id, existing_id, u.username)
+                        _log_and_update_state(f"User {u.username} already exists in new GitLab (ID: {existing_id}). Skipping creation.", section="users", item_name=u.username, increment_completed=True)
+                        continue
+
+                    _log_and_update_state(f"Creating user {u.username}...", action=f"Creating user {u.username}", section="users", item_name=u.username)
+                    payload = {
+                        'email': email or f"{u.username}@example.com", # Fallback if email is hidden
+                        'username': u.username,
+                        'name': u.name,
+                        'password': 'Password123!', # Temporary password
+                        'skip_confirmation': True
+                    }
+                    pending[executor.submit(_create_user, payload)] = u
+                    # Bound the backlog so enumeration never runs far ahead of creation.
+                    if len(pending) >= USER_CREATE_CONCURRENCY * 2:
+                        done_futures, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done_futures: finish_creation(future)
+            finally:
+                # Map whatever was already submitted, even if enumeration failed part-way.
+                done_futures, _ = wait(pending)
+                for future in done_futures: finish_creation(future)
+
     except Exception as e:
         _log_and_update_state(f"Error migrating users: {e}", log_type="error")
-    
-    _log_and_update_state("=== FINISHED PHASE 0: User Migration ===", action="User migration complete")
+        record_phase_throughput("users", processed, phase_started_at)
+        return False
+
+    record_phase_throughput("users", processed, phase_started_at)
+    with state_lock:
+        current_migration_state["stats"]["users"]["total"] = processed; listed_sections.add("users")
+        users_per_s = current_migration_state["metrics"]["phase_throughput"]["users"]["per_s"]
+    _log_and_update_state(f"=== FINISHED PHASE 0: User Migration ({processed} users, {users_per_s} users/s) ===", action="User migration complete")
+    return True
 
-def run_full_migration():
-    global migration_status_log, OLD_TO_NEW_GROUP_ID_MAP, OLD_TO_NEW_USER_ID_MAP, CREATED_PROJECT_PATHS_IN_NEW_NAMESPACE, current_migration_state
+def _resolve_target_namespace_id(old_project_stub):
+    """Returns (namespace_id_or_None, error_message_or_None) for the project's namespace on the target."""
+    project_name_old = old_project_stub.name; project_namespace_path_old = old_project_stub.path_with_namespace
+    namespace_info = old_project_stub.attributes.get('namespace', {})
+    old_namespace_id = namespace_info.get('id'); old_namespace_kind = namespace_info.get('kind')
+    if old_namespace_kind == 'group':
+        with mapping_lock: mapped_id = OLD_TO_NEW_GROUP_ID_MAP.get(old_namespace_id)
+        if mapped_id: return mapped_id, None
+        _log_and_update_state(f"Group map missing for old group ID {old_namespace_id}. Attempting dynamic mapping by path...", log_type="warning")
+        initial_new_parent_id = TARGET_PARENT_GROUP_ID_ON_NEW_FOR_ALL if TARGET_PARENT_GROUP_ID_ON_NEW_FOR_ALL else None
+        with _slot(api_slots, "api_wait"), timings.stage("api"): new_target_namespace_id = ensure_group_mapped_by_path(namespace_info, initial_new_parent_id)
+        if not new_target_namespace_id:
+            err_msg = f"Could not dynamically map group ID {old_namespace_id}"
+            _log_and_update_state(f"ERROR: {err_msg} (project: {project_namespace_path_old}). Skipping.", log_type="error")
+            return None, err_msg
+        return new_target_namespace_id, None
+    if old_namespace_kind == 'user':
+        username_old = namespace_info.get('path')
+        _log_and_update_state(f"Project '{project_name_old}' is a user project owned by '{username_old}'. Resolving user namespace on target...")
+        with _slot(api_slots, "api_wait"), timings.stage("api"): resolved_user_ns_id = get_user_namespace_id_on_new(username_old)
+        if resolved_user_ns_id:
+            _log_and_update_state(f"  Resolved user '{username_old}' namespace ID: {resolved_user_ns_id}.")
+        else:
+            _log_and_update_state(f"  Could not find user '{username_old}' namespace on target. Falling back to token owner namespace.", log_type="warning")
+        return resolved_user_ns_id, None
+    err_msg = f"Unknown namespace kind '{old_namespace_kind}'"
+    _log_and_update_state(f"{err_msg} for '{project_name_old}'. Skipping.", log_type="warning")
+    return None, err_msg
+
+def _migrate_project_stub(old_project_stub):
+    """Worker entry point. Returns (outcome, message, failure_class) where outcome is 'ok', 'retry' or 'failed'
+    and failure_class is one of the retry_policy classes (None on success)."""
+    with timings.bind_project(getattr(old_project_stub, 'id', None)), timings.stage("total"), timings.timed(timing_metrics.ITEM_METRIC, phase="projects"):
+        return _migrate_project_stub_timed(old_project_stub)
+
+def _migrate_project_stub_timed(old_project_stub):
+    try:
+        project_id_old = old_project_stub.id; project_name_old = old_project_stub.name
+        project_path_old = old_project_stub.path; project_namespace_path_old = old_project_stub.path_with_namespace
+        project_description_old = old_project_stub.attributes.get('description', "") or ""
+        project_visibility_old = old_project_stub.attributes.get('visibility', 'private') or 'private'
+        old_repo_ssh_url_from_stub = old_project_stub.attributes.get('ssh_url_to_repo')
+
+        new_target_namespace_id, ns_error = _resolve_target_namespace_id(old_project_stub)
+        if ns_error: return "failed", ns_error, retry_policy.PERMANENT
+
+        success, failure_detail = migrate_project_repo_py(project_id_old, project_name_old, project_path_old, project_namespace_path_old,
+                                                          project_description_old, project_visibility_old, old_repo_ssh_url_from_stub,
+                                                          new_target_namespace_id, old_project_stub.attributes)
+        if success: return "ok", None, None
+        failure_class = retry_policy.classify_failure(failure_detail)
+        return ("failed" if failure_class == retry_policy.PERMANENT else "retry"), _shorten(failure_detail or "Network delay or failure"), failure_class
+    except AttributeError as ae:
+        err_msg = f"ATTRIBUTE ERROR processing stub ID {getattr(old_project_stub, 'id', 'N/A')}: {ae}"
+        _log_and_update_state(err_msg, log_type="error", error_msg=str(ae))
+        _log_and_update_state(f"  Problematic stub: {getattr(old_project_stub, 'attributes', 'N/A')}")
+        return "failed", err_msg, retry_policy.PERMANENT
+    except Exception as e_proj_loop:
+        failure_class = retry_policy.classify_failure(exc=e_proj_loop)
+        return ("failed" if failure_class == retry_policy.PERMANENT else "retry"), f"UNEXPECTED ERROR: {e_proj_loop}", failure_class
+
+def _shorten(text, limit=300):
+    # git puts the decisive "fatal:" line last, so keep the tail.
+    text = " ".join(text.split())
+    return text if len(text) <= limit else "..." + text[-limit:]
+
+_END_OF_PROJECTS = object()
+
+def _project_size_bytes(old_project_stub):
+    """Repository + LFS bytes from the stub's statistics, or None when the API didn't return them."""
+    return _attributes_size_bytes(old_project_stub.attributes)
+
+def _attributes_size_bytes(attrs):
+    stats = (attrs or {}).get('statistics')
+    if not stats: return None
+    return (stats.get('repository_size') or 0) + (stats.get('lfs_objects_size') or 0)
+
+def _publish_project_byte_progress(listing_state, listing_finished, byte_progress, phase_started_at):
+    """Byte-based totals and ETA for the projects phase: stats['projects'] total_bytes / completed_bytes / bytes_per_s / eta_seconds.
+    The rate is the completed-bytes throughput of the last ETA_WINDOW_SECONDS (the whole phase until a window has passed)."""
+    now = time.time(); window = byte_progress["window"]
+    window.append((now, byte_progress["completed"]))
+    while len(window) > 2 and window[1][0] <= now - ETA_WINDOW_SECONDS: window.popleft()
     with state_lock:
-        current_migration_state["status"] = "initializing"; current_migration_state["logs"] = []
+        project_stats = current_migration_state["stats"]["projects"]
+        listed = listing_state["listed"]
+        total_bytes = listing_state["listed_bytes"]
+        sized = listing_state["sized"]
+        if not listing_finished and listed: total_bytes = total_bytes * max(project_stats["total"], listed) / listed # extrapolate over the (preflight) total while listing
+        done_bytes = byte_progress["completed"] + byte_progress["skipped"]
+        window_started_at, window_start_bytes = window[0]
+        if now - window_started_at >= 1 and byte_progress["completed"] > window_start_bytes: rate = (byte_progress["completed"] - window_start_bytes) / (now - window_started_at)
+        else: rate = byte_progress["completed"] / (now - phase_started_at) if now > phase_started_at else 0 # nothing finished within the window
+        project_stats["total_bytes"] = int(total_bytes)
+        project_stats["completed_bytes"] = done_bytes
+        project_stats["bytes_per_s"] = int(rate)
+        project_stats["eta_seconds"] = int(max(0, total_bytes - done_bytes) / rate) if rate > 0 and sized else None
+
+def _iter_old_project_stubs():
+    """Yields project stubs from the old instance page by page (keyset pagination, falls back to offset paging),
+    or rebuilt from the plan being executed."""
+    if active_plan:
+        for planned in active_plan["projects"]: yield Project(gl_old.projects, planned["stub"])
+        return
+    if scope_inventory:
+        yield from scope_inventory["projects"]
+        return
+    yield from _list_old_projects()
+
+def _keyset_list(manager, **list_kwargs):
+    """manager.list() streamed with keyset pagination, or offset paging where the instance/endpoint doesn't support it."""
+    try:
+        # The first page is requested here, so an unsupported keyset request fails before anything is yielded.
+        return manager.list(iterator=True, pagination='keyset', **list_kwargs)
+    except gitlab.exceptions.GitlabListError as e:
+        _log_and_update_state(f"Keyset pagination not available for /{manager.path.lstrip('/')} on old GitLab ({e}). Falling back to offset pagination.", log_type="warning")
+        return manager.list(iterator=True, **list_kwargs)
+
+def _list_old_projects(**filters):
+    # statistics=True adds repository/LFS sizes to every stub (admin tokens only) at no extra request cost.
+    # Removed archived=False and simple=True to fetch ALL projects with full metadata.
+    yield from _keyset_list(gl_old.projects, per_page=PROJECT_LIST_PAGE_SIZE, order_by='id', sort='asc', statistics=True, **filters)
+
+def _preflight_total(counts, manager, **list_kwargs):
+    """Exact number of items in manager's listing: X-Total of a one-item page where GitLab sends it (up to 10,000
+    items), otherwise a keyset walk. None if the run moved on meanwhile."""
+    total = manager.list(per_page=1, iterator=True, **list_kwargs).total
+    if total is not None: return total
+    total = 0
+    for _ in _keyset_list(manager, per_page=100, order_by='id', sort='asc', **list_kwargs):
+        if counts["cancelled"]: return None
+        total += 1
+    return total
+
+def _run_preflight_counts(counts):
+    """Preflight thread of a full run: exact user and project counts, so progress totals are right before those phases
+    have listed everything. GitLab omits X-Total above 10,000 items; past that the count walks the lightest listing
+    (simple=True for projects, archived ones included) instead of competing with the phases for full pages. Groups
+    need no count: the groups phase lists them all before creating any. Project bytes come from the projects phase's
+    own listing, extrapolated over this count until it is complete (sizes are only in the full representation)."""
+    sources = (("users", gl_old.users, {}), ("projects", gl_old.projects, {"simple": True}))
+    started_at = time.time()
+    try:
+        for section, manager, list_kwargs in sources:
+            with state_lock: already_listed = section in listed_sections
+            if already_listed or counts["cancelled"]: continue
+            count = _preflight_total(counts, manager, **list_kwargs)
+            if count is None: return
+            counts[section] = count
+            with state_lock:
+                section_stats = current_migration_state["stats"][section]
+                # A phase that has finished its own listing already has the exact figure.
+                if section not in listed_sections: section_stats["total"] = max(section_stats["total"], count)
+                current_migration_state["metrics"]["preflight"] = {key: value for key, value in counts.items() if key != "cancelled"}
+        _log_and_update_state(f"Preflight: {counts['users']} users, {counts['projects']} projects in {time.time() - started_at:.1f}s.")
+    except Exception as e:
+        counts["error"] = str(e)
+        _log_and_update_state(f"Warning: Preflight count stopped early ({e}). Progress totals grow as items are listed instead.", log_type="warning")
+    finally:
+        counts["finished"] = True
+        if not counts["cancelled"]:
+            with state_lock: current_migration_state["metrics"]["preflight"] = {key: value for key, value in counts.items() if key != "cancelled"}
+
+def _produce_project_stubs(project_feed, listing_state):
+    """Lister thread: streams project stubs into project_feed and always ends with _END_OF_PROJECTS."""
+    _log_and_update_state(f"Streaming project stubs from old GitLab (keyset pagination, per_page={PROJECT_LIST_PAGE_SIZE})...", action="Listing old projects")
+    try:
+        for stub in _iter_old_project_stubs():
+            project_feed.put(stub)
+            size_bytes = _project_size_bytes(stub)
+            if size_bytes is not None: listing_state["listed_bytes"] += size_bytes; listing_state["sized"] += 1
+            listing_state["listed"] += 1
+            listed = listing_state["listed"]
+            with state_lock:
+                project_stats = current_migration_state["stats"]["projects"]
+                project_stats["total"] = max(project_stats["total"], listed)
+            if listed % PROJECT_LIST_PAGE_SIZE == 0: _log_and_update_state(f"Listed {listed} project stubs so far.")
+    except Exception as e:
+        listing_state["error"] = str(e)
+        _log_and_update_state(f"ERROR fetching project stubs: {e}. No further projects will be queued.", log_type="error")
+    finally:
+        if not listing_state["error"]:
+            with state_lock: current_migration_state["stats"]["projects"]["total"] = listing_state["listed"]; listed_sections.add("projects")
+            _log_and_update_state(f"Total project stubs listed for processing: {listing_state['listed']}.")
+        project_feed.put(_END_OF_PROJECTS)
+
+def _preload_namespace_cache(scan=True):
+    global namespace_cache
+    namespace_cache = NamespaceCache()
+    if not scan:
+        _log_and_update_state("Scoped run: target namespaces are looked up per path instead of preloading all of them.")
+        return
+    try:
+        _log_and_update_state("Preloading target namespace cache (one streamed namespaces scan)...", action="Indexing target namespaces")
+        group_count, user_ns_count = namespace_cache.preload(gl_new)
+        _log_and_update_state(f"Namespace cache ready: {group_count} groups, {user_ns_count} user namespaces.")
+    except Exception as e:
+        _log_and_update_state(f"Warning: Could not preload namespace cache ({e}). Lookups will fall back to the API.", log_type="warning")
+    publish_namespace_cache_stats()
+
+def publish_namespace_cache_stats():
+    cache_stats = namespace_cache.stats()
+    with state_lock: current_migration_state.setdefault("metrics", {})["namespace_cache"] = cache_stats
+
+def _clean_temp_dir_keeping_mirror_cache():
+    os.makedirs(MIGRATION_TEMP_DIR, exist_ok=True)
+    volume_paths = {os.path.realpath(volume.path) for volume in workspace.volumes}
+    leftovers = [name for name in os.listdir(MIGRATION_TEMP_DIR) if os.path.realpath(os.path.join(MIGRATION_TEMP_DIR, name)) not in volume_paths]
+    if leftovers: _log_and_update_state(f"Cleaning {len(leftovers)} leftover entries from temp dir: {MIGRATION_TEMP_DIR} (mirror cache kept)")
+    for name in leftovers:
+        path = os.path.join(MIGRATION_TEMP_DIR, name)
+        if os.path.isdir(path): shutil.rmtree(path, ignore_errors=True)
+        else: os.remove(path)
+    workspace.prepare() # also repairs/removes mirrors left half-written by a crashed run
+    _log_and_update_state("Mirror workspace: " + ", ".join(f"'{volume['path']}' ({volume['fs_type'] or 'unknown fs'}, {format_bytes(volume['free_bytes'])} free"
+                                                              + (f", repos up to {format_bytes(volume['max_repo_bytes'])}" if volume['max_repo_bytes'] else "") + ")"
+                                                              for volume in workspace.usage()["volumes"]) + f"; keeping {format_bytes(DISK_RESERVE_BYTES)} free on each.")
+
+# --- Scoped (wave) migration ---
+def _phase_key(phase):
+    """Checkpoint name of a phase: waves keep their own users/groups phases, so finishing one wave doesn't skip the next."""
+    scope_dict = active_plan.get("scope") if active_plan else (active_scope.to_dict() if active_scope else None)
+    return f"{phase}@{MigrationScope.from_dict(scope_dict).fingerprint}" if scope_dict else phase
+
+def _list_old_namespace_projects(namespace_path):
+    """Projects under a group (including subgroups) or, for a single segment that is a username, in that user's namespace."""
+    list_kwargs = {'iterator': True, 'statistics': True, 'order_by': 'id', 'sort': 'asc', 'per_page': PROJECT_LIST_PAGE_SIZE}
+    try:
+        listed = gl_old.groups.get(namespace_path, lazy=True).projects.list(include_subgroups=True, with_shared=False, **list_kwargs)
+    except gitlab.exceptions.GitlabListError as e:
+        owner = gl_old.users.list(username=namespace_path) if e.response_code == 404 and "/" not in namespace_path else None
+        if not owner: raise
+        listed = gl_old.users.get(owner[0].id, lazy=True).projects.list(**list_kwargs)
+    return listed
+
+def _scoped_project_stubs(scope):
+    """Project stubs in scope, fetched as narrowly as the scope allows: by ID or exact path, per group subtree
+    (include_subgroups), and only for unanchored patterns an instance-wide listing narrowed by search=."""
+    seen = set()
+    def keep(stub):
+        if stub.id in seen: return False
+        seen.add(stub.id); return True
+    for key in scope.project_ids + scope.exact_paths():
+        try: stub = gl_old.projects.get(key, statistics=True)
+        except gitlab.exceptions.GitlabGetError as e:
+            _log_and_update_state(f"Scope: project '{key}' not found on old instance ({e.response_code}). Skipping.", log_type="warning"); continue
+        if keep(stub): yield stub
+    for namespace_path, path_filter in scope.pushdown_groups():
+        try:
+            for listed in _list_old_namespace_projects(namespace_path):
+                if path_filter and not path_filter.match(listed.path_with_namespace): continue
+                if keep(listed): yield Project(gl_old.projects, listed.attributes)
+        except gitlab.exceptions.GitlabListError as e:
+            _log_and_update_state(f"Scope: could not list projects of namespace '{namespace_path}' ({e.response_code}). Skipping.", log_type="warning")
+    if scope.has_unanchored():
+        search = scope.search_term()
+        _log_and_update_state("Scope: some patterns have no literal group prefix; listing " + (f"projects matching '{search}'." if search else "all projects and filtering locally."), log_type="warning")
+        for stub in _list_old_projects(**({'search': search, 'search_namespaces': True} if search else {})):
+            if scope.matches_unanchored(stub.path_with_namespace) and keep(stub): yield stub
+
+def _scoped_groups(scope, project_stubs):
+    """{old group ID: group} for the scope's group subtrees, the namespaces of in-scope projects and all their ancestors."""
+    groups = {}; by_path = {}
+    def add_with_ancestors(full_path):
+        segments = full_path.split("/")
+        for depth in range(1, len(segments) + 1):
+            path = "/".join(segments[:depth]).lower()
+            if path in by_path: continue
+            try: group = gl_old.groups.get(path)
+            except gitlab.exceptions.GitlabGetError as e:
+                _log_and_update_state(f"Scope: group '{path}' not found on old instance ({e.response_code}).", log_type="warning"); return None
+            groups[group.id] = by_path[path] = group
+        return by_path[full_path.lower()]
+    for root_path in scope.groups:
+        root = add_with_ancestors(root_path)
+        if root is None: continue
+        for descendant in root.descendant_groups.list(iterator=True, all_available=True, per_page=GROUP_LIST_PAGE_SIZE):
+            groups[descendant.id] = by_path[descendant.full_path.lower()] = descendant
+    for namespace_path in sorted({(stub.attributes.get('namespace') or {}).get('full_path') for stub in project_stubs
+                                  if (stub.attributes.get('namespace') or {}).get('kind') == 'group'} - {None}):
+        add_with_ancestors(namespace_path)
+    return groups
+
+def _scoped_member_users(groups, project_stubs):
+    """{old user ID: username} of everyone who is a member (direct, inherited or via sharing) of an in-scope group or
+    project, or owns an in-scope personal project. Group memberships land in OLD_GROUP_MEMBERS_CACHE for the member sync."""
+    users = {}
+    def project_users(stub):
+        found = {m.id: m.username for m in gl_old.projects.get(stub.id, lazy=True).members.list(iterator=True, per_page=100)}
+        for shared in stub.attributes.get('shared_with_groups') or []:
+            found.update((uid, username) for uid, (username, _) in old_group_members_all(shared.get('group_id'), shared.get('group_full_path')).items())
+        namespace_info = stub.attributes.get('namespace') or {}
+        if namespace_info.get('kind') == 'user':
+            found.update((u.id, u.username) for u in gl_old.users.list(username=namespace_info.get('path')))
+        return found
+    def group_users(group):
+        return {uid: username for uid, (username, _) in old_group_members_all(group.id, group.full_path).items()}
+    with ThreadPoolExecutor(max_workers=API_CONCURRENCY, thread_name_prefix="scope-members") as pool:
+        for found in pool.map(group_users, groups.values()): users.update(found)
+        for found in pool.map(project_users, project_stubs): users.update(found)
+    return users
+
+def collect_scope_inventory(scope):
+    """Enumerates only what the wave touches; every request here scales with the wave, not with the instance."""
+    _log_and_update_state(f"Scope: {scope.describe()}. Listing in-scope projects...", action="Listing scoped projects")
+    projects = list(_scoped_project_stubs(scope))
+    _log_and_update_state(f"Scope: {len(projects)} projects. Resolving their groups...", action="Listing scoped groups")
+    groups = _scoped_groups(scope, projects)
+    _log_and_update_state(f"Scope: {len(groups)} groups (including ancestors). Collecting members...", action="Listing scoped members")
+    users = _scoped_member_users(groups, projects)
+    _log_and_update_state(f"Scope: {len(users)} users are members of in-scope groups/projects.")
+    return {"projects": projects, "groups": groups, "users": users}
+
+def _fetch_scoped_old_users(scoped_users, skip_mapped=True):
+    """Full old user objects (for email/name) of a wave's members; users mapped by a previous run aren't fetched again."""
+    for user_id, username in sorted(scoped_users.items()):
+        if skip_mapped and user_id in OLD_TO_NEW_USER_ID_MAP: yield SimpleNamespace(id=user_id, username=username); continue
+        try: yield gl_old.users.get(user_id)
+        except gitlab.exceptions.GitlabGetError as e:
+            _log_and_update_state(f"Could not fetch old user {username} ({e}). Skipping.", log_type="warning", section="users", item_name=username, increment_completed=True)
+
+def _find_new_user_id(username, email):
+    """Per-user target lookup (by username, then email) for scoped runs, instead of indexing every target user."""
+    found = gl_new.users.list(username=username)
+    if found: return found[0].id
+    if email:
+        return next((u.id for u in gl_new.users.list(search=email) if (getattr(u, 'email', None) or '').lower() == email.lower()), None)
+    return None
+
+# --- Dry-run planning ---
+def collect_plan_inventory(scope=None):
+    """Bulk, read-only enumeration of both instances for migration_plan.build_plan(): one streamed list per
+    object type and instance, nothing written to the target. With a scope, the old side is only the wave."""
+    inventory = {"old_url": OLD_GITLAB_URL, "new_url": NEW_GITLAB_URL, "target_parent_id": TARGET_PARENT_GROUP_ID_ON_NEW_FOR_ALL, "target_root_full_path": None,
+                 "scope": scope.to_dict() if scope else None}
+    if TARGET_PARENT_GROUP_ID_ON_NEW_FOR_ALL: inventory["target_root_full_path"] = gl_new.groups.get(TARGET_PARENT_GROUP_ID_ON_NEW_FOR_ALL).full_path
+    def user_dicts(users):
+        return [{"id": u.id, "username": u.username, "email": getattr(u, 'email', None), "name": u.name} for u in users]
+    wave = collect_scope_inventory(scope) if scope else None
+    _log_and_update_state("Plan: listing users on both instances...", action="Planning: users")
+    inventory["old_users"] = user_dicts(_fetch_scoped_old_users(wave["users"], skip_mapped=False) if wave else gl_old.users.list(iterator=True, per_page=USER_LIST_PAGE_SIZE))
+    inventory["new_users"] = user_dicts(gl_new.users.list(iterator=True, per_page=USER_LIST_PAGE_SIZE))
+    inventory["target_user_paths"] = {u["username"].lower() for u in inventory["new_users"]}
+    _log_and_update_state(f"Plan: {len(inventory['old_users'])} source users, {len(inventory['new_users'])} target users. Listing groups...", action="Planning: groups")
+    inventory["old_groups"] = [{"id": g.id, "parent_id": g.parent_id, "name": g.name, "path": g.path, "full_path": g.full_path,
+                                "visibility": g.visibility, "description": g.description}
+                               for g in (wave["groups"].values() if wave else gl_old.groups.list(iterator=True, all_available=True, per_page=GROUP_LIST_PAGE_SIZE))]
+    inventory["target_groups_by_path"] = {g.full_path.lower(): g.id for g in gl_new.groups.list(iterator=True, all_available=True, per_page=GROUP_LIST_PAGE_SIZE)}
+    _log_and_update_state(f"Plan: {len(inventory['old_groups'])} source groups, {len(inventory['target_groups_by_path'])} target groups. Listing projects...", action="Planning: projects")
+    inventory["old_projects"] = [{key: stub.attributes.get(key) for key in migration_plan.PROJECT_STUB_ATTRIBUTES} for stub in (wave["projects"] if wave else _iter_old_project_stubs())]
+    inventory["target_projects_by_path"] = {p.path_with_namespace.lower(): {"id": p.id, "empty_repo": p.attributes.get('empty_repo')}
+                                            for p in gl_new.projects.list(iterator=True, per_page=PROJECT_LIST_PAGE_SIZE)}
+    _log_and_update_state(f"Plan: {len(inventory['old_projects'])} source projects, {len(inventory['target_projects_by_path'])} target projects.")
+    return inventory
+
+def run_migration_plan(plan_path=None, scope=None):
+    """Dry run: computes what a real run would create, reuse, skip or trip over, with byte and time estimates,
+    and writes it to plan_path (MIGRATION_PLAN_FILE). Nothing is written to either GitLab instance."""
+    global active_plan, active_scope, scope_inventory
+    plan_path = plan_path or PLAN_FILE_PATH; active_plan = None; active_scope = None; scope_inventory = None
+    with state_lock:
+        current_migration_state["status"] = "planning"; log_buffer.clear()
         current_migration_state["error_message"] = None
         current_migration_state["stats"] = {"users": {"total": 0, "completed": 0, "current_item_name": ""}, "groups": {"total": 0, "completed": 0, "current_item_name": ""}, "projects": {"total": 0, "completed": 0, "current_item_name": "", "failed": 0, "errors_resolved": 0}}
-        current_migration_state["metrics"] = {"start_time": time.time(), "data_flowing_bytes": 0, "avg_speed_mb_s": 0}
+        current_migration_state["metrics"] = {"start_time": time.time()}
+        current_migration_state.pop("plan", None)
+    try: initialize_gitlab_clients()
+    except Exception as e: _log_and_update_state(f"Halting: client init failure: {e}", log_type="error", error_msg=str(e), set_status="error"); return None
+    with state_lock: current_migration_state["status"] = "planning"
+    try:
+        inventory = collect_plan_inventory(scope)
+        plan = migration_plan.build_plan(inventory, PLAN_THROUGHPUT_MB_S, API_MAX_REQUESTS_PER_SECOND, PROJECT_WORKERS)
+        migration_plan.save_plan(plan, plan_path)
+    except Exception as e:
+        _log_and_update_state(f"ERROR building migration plan: {e}", log_type="error", error_msg=str(e), set_status="error"); return None
+    estimates = plan["estimates"]
+    with state_lock: current_migration_state["plan"] = {"path": plan_path, "created_at": plan["created_at"], "summary": plan["summary"], "estimates": estimates}
+    _log_and_update_state(f"Plan summary: users {plan['summary']['users']}, groups {plan['summary']['groups']}, projects {plan['summary']['projects']}.")
+    _log_and_update_state(f"Plan estimate: {format_bytes(estimates['transfer_bytes'])} to transfer ({estimates['unsized_projects']} projects without size statistics), "
+                          f"~{estimates['api_calls']} API calls, ~{estimates['seconds'] // 60} min at {PLAN_THROUGHPUT_MB_S} MB/s.")
+    _log_and_update_state(f"Plan written to '{plan_path}'.", action="Plan ready", set_status="planned")
+    return plan
+
+def run_full_migration(resume=False, delta_sync=None, plan_path=None, scope=None):
+    """With plan_path, users, groups and projects come from a plan file written by run_migration_plan()
+    instead of being enumerated on the old instance again. With a MigrationScope, only that wave is migrated."""
+    global migration_status_log, OLD_TO_NEW_GROUP_ID_MAP, OLD_TO_NEW_USER_ID_MAP, CREATED_PROJECT_PATHS_IN_NEW_NAMESPACE, current_migration_state, delta_sync_enabled, member_ops_executor, active_plan, active_scope, scope_inventory, transfer_queue, preflight
+    delta_sync_enabled = DELTA_SYNC_DEFAULT if delta_sync is None else bool(delta_sync)
+    if preflight: preflight["cancelled"] = True # a count still running for an earlier run must not touch this one's stats
+    active_plan = None; active_scope = None; scope_inventory = None; preflight = {}
+    with state_lock: listed_sections.clear()
+    with state_lock:
+        current_migration_state["status"] = "initializing"; log_buffer.clear()
+        current_migration_state["error_message"] = None
+        current_migration_state["stats"] = {"users": {"total": 0, "completed": 0, "current_item_name": ""}, "groups": {"total": 0, "completed": 0, "current_item_name": ""}, "projects": {"total": 0, "completed": 0, "current_item_name": "", "failed": 0, "errors_resolved": 0}}
+        current_migration_state["metrics"] = {"start_time": time.time()}
+    transfer_meter.reset(); PROJECT_TRANSFER_STATS.clear(); NEW_PROJECT_IDS.clear(); timings.reset()
     OLD_TO_NEW_GROUP_ID_MAP = {}; OLD_TO_NEW_USER_ID_MAP = {}; CREATED_PROJECT_PATHS_IN_NEW_NAMESPACE = {}
-    FAILED_REPOS.clear()
-    DONE_REPOS.clear()
+    _reset_reports()
+    with member_cache_lock: OLD_GROUP_MEMBERS_CACHE.clear()
     try: initialize_gitlab_clients()
     except Exception as e: _log_and_update_state(f"Halting: client init failure: {e}", log_type="error", error_msg=str(e), set_status="error"); return
-    if os.path.exists(MIGRATION_TEMP_DIR): _log_and_update_state(f"Cleaning old temp dir: {MIGRATION_TEMP_DIR}"); shutil.rmtree(MIGRATION_TEMP_DIR)
-    os.makedirs(MIGRATION_TEMP_DIR, exist_ok=True)
+    try: resumed = open_checkpoint(resume)
+    except Exception as e: _log_and_update_state(f"Halting: could not open checkpoint '{CHECKPOINT_DB_PATH}': {e}", log_type="error", error_msg=str(e), set_status="error"); return
+    _clean_temp_dir_keeping_mirror_cache()
+    if delta_sync_enabled: _log_and_update_state("Delta-sync mode: projects that already have data on the target are re-synced from the cached mirrors.")
+    if plan_path:
+        try: active_plan = migration_plan.load_plan(plan_path, OLD_GITLAB_URL, NEW_GITLAB_URL)
+        except Exception as e: _log_and_update_state(f"Halting: could not load plan '{plan_path}': {e}", log_type="error", error_msg=str(e), set_status="error"); return
+        if active_plan["target_parent_id"] != TARGET_PARENT_GROUP_ID_ON_NEW_FOR_ALL:
+            _log_and_update_state(f"Halting: plan '{plan_path}' targets parent group {active_plan['target_parent_id']}, configuration says {TARGET_PARENT_GROUP_ID_ON_NEW_FOR_ALL}. Re-run the plan.", log_type="error", error_msg="Plan does not match TARGET_PARENT_GROUP_ID_ON_NEW_FOR_ALL", set_status="error"); active_plan = None; return
+        _log_and_update_state(f"Executing plan '{plan_path}' created {active_plan['created_at']}: {len(active_plan['users'])} users, {len(active_plan['groups'])} groups, {len(active_plan['projects'])} projects.")
+        with state_lock:
+            current_migration_state["stats"]["groups"]["total"] = len(active_plan["groups"])
+            current_migration_state["stats"]["projects"]["total"] = len(active_plan["projects"])
+        if scope: _log_and_update_state("Ignoring the requested scope: the plan was already built for its own scope.", log_type="warning")
+    elif scope:
+        active_scope = scope
+        try: scope_inventory = collect_scope_inventory(scope)
+        except Exception as e: _log_and_update_state(f"Halting: could not enumerate scope ({scope.describe()}): {e}", log_type="error", error_msg=str(e), set_status="error"); return
+        with state_lock:
+            current_migration_state["stats"]["groups"]["total"] = len(scope_inventory["groups"])
+            current_migration_state["stats"]["projects"]["total"] = len(scope_inventory["projects"])
 
-    try: # Estimate totals
-        _log_and_update_state("Estimating total groups...", action="Estimating groups")
-        all_old_groups_paginated = gl_old.groups.list(all=True, as_list=False, per_page=1, all_available=True)
-        with state_lock: current_migration_state["stats"]["groups"]["total"] = all_old_groups_paginated.total_items if hasattr(all_old_groups_paginated, 'total_items') else 1 # Avoid div by zero if total not available
-        _log_and_update_state(f"Estimated total groups: {current_migration_state['stats']['groups']['total']}")
-    except Exception as e: _log_and_update_state(f"Warning: Could not estimate total groups: {e}", log_type="warning")
-    try:
-        _log_and_update_state("Estimating total projects...", action="Estimating projects")
-        all_old_projects_paginated = gl_old.projects.list(all=True, archived=False, as_list=False, per_page=1)
-        project_total_count = all_old_projects_paginated.total_items if hasattr(all_old_projects_paginated, 'total_items') else 1
-        with state_lock: current_migration_state["stats"]["projects"]["total"] = project_total_count
-        _log_and_update_state(f"Estimated total projects: {project_total_count}")
-    except Exception as e: _log_and_update_state(f"Warning: Could not estimate total projects: {e}", log_type="warning")
+    if not active_plan and not scope_inventory:
+        # Counted in the background while users and groups migrate; plans and waves already know their totals.
+        preflight = {"users": None, "projects": None, "finished": False, "error": None, "cancelled": False}
+        threading.Thread(target=_run_preflight_counts, args=(preflight,), name="preflight-count", daemon=True).start()
 
     with state_lock: current_migration_state["status"] = "migrating_users"
-    migrate_users_py()
+    if resumed and checkpoint.is_phase_done(_phase_key("users")):
+        _log_and_update_state(f"=== PHASE 0: Users already migrated in a previous run ({len(OLD_TO_NEW_USER_ID_MAP)} mapped). Skipping. ===", action="User migration complete")
+        with state_lock: current_migration_state["stats"]["users"].update(total=len(OLD_TO_NEW_USER_ID_MAP), completed=len(OLD_TO_NEW_USER_ID_MAP)); listed_sections.add("users")
+    elif migrate_users_py(active_plan, scope_inventory["users"] if scope_inventory else None):
+        checkpoint.mark_phase_done(_phase_key("users"))
 
     with state_lock: current_migration_state["status"] = "migrating_groups"
-    _log_and_update_state("=== PHASE 1: Migrating Group Hierarchy ===", action="Starting group migration")
-    initial_new_parent_id = TARGET_PARENT_GROUP_ID_ON_NEW_FOR_ALL if TARGET_PARENT_GROUP_ID_ON_NEW_FOR_ALL else None
-    if initial_new_parent_id: _log_and_update_state(f"All migrated groups will be under new group ID: {initial_new_parent_id}")
-    migrate_groups_recursive_py(None, initial_new_parent_id)
-    _log_and_update_state("=== FINISHED PHASE 1: Group Hierarchy Migration ===", action="Group migration complete")
+    _preload_namespace_cache(scan=not scope_inventory)
+    member_ops_executor = ThreadPoolExecutor(max_workers=MEMBER_SYNC_CONCURRENCY, thread_name_prefix="member-sync")
+    if resumed and checkpoint.is_phase_done(_phase_key("groups")):
+        _log_and_update_state(f"=== PHASE 1: Group hierarchy already migrated in a previous run ({len(OLD_TO_NEW_GROUP_ID_MAP)} mapped). Skipping. ===", action="Group migration complete")
+        with state_lock: current_migration_state["stats"]["groups"].update(total=len(OLD_TO_NEW_GROUP_ID_MAP), completed=len(OLD_TO_NEW_GROUP_ID_MAP)); listed_sections.add("groups")
+    else:
+        _log_and_update_state("=== PHASE 1: Migrating Group Hierarchy ===", action="Starting group migration")
+        initial_new_parent_id = TARGET_PARENT_GROUP_ID_ON_NEW_FOR_ALL if TARGET_PARENT_GROUP_ID_ON_NEW_FOR_ALL else None
+        if initial_new_parent_id: _log_and_update_state(f"All migrated groups will be under new group ID: {initial_new_parent_id}")
+        if migrate_group_hierarchy_py(initial_new_parent_id, active_plan, scope_inventory["groups"] if scope_inventory else None): checkpoint.mark_phase_done(_phase_key("groups"))
+        else: _log_and_update_state("Group hierarchy migration had errors; it will be re-checked on resume.", log_type="warning")
+        publish_namespace_cache_stats()
+        _log_and_update_state("=== FINISHED PHASE 1: Group Hierarchy Migration ===", action="Group migration complete")
 
     with state_lock: current_migration_state["status"] = "migrating_projects"
     _log_and_update_state("=== PHASE 2: Migrating Projects and Repositories ===", action="Starting project migration")
     projects_migrated_ok_count = 0; projects_failed_processing_count = 0; total_errors_encountered = 0
-    old_projects_stubs_list = []
-    try:
-        _log_and_update_state("Fetching all project stubs from old GitLab (manual pagination)...", action="Listing old projects")
-        page = 1; per_page_projects = 20 
-        while True:
-            _log_and_update_state(f"Fetching projects page {page} (per_page={per_page_projects})...", action=f"Listing projects (Page {page})")
-            # Removed archived=False and simple=True to fetch ALL projects with full metadata
-            projects_on_page = gl_old.projects.list(page=page, per_page=per_page_projects, statistics=False, as_list=True, all=False)
-            if not projects_on_page: _log_and_update_state("No more project stubs on this page."); break
-            old_projects_stubs_list.extend(projects_on_page)
-            _log_and_update_state(f"Fetched {len(projects_on_page)} project stubs. Total stubs: {len(old_projects_stubs_list)}")
-            if len(projects_on_page) < per_page_projects: _log_and_update_state("Likely the last page of project stubs."); break
-            page += 1; time.sleep(0.2)
-    except Exception as e: _log_and_update_state(f"ERROR fetching project stubs: {e}. Halting.", log_type="error", error_msg=str(e), set_status="error"); return
-    
-    with state_lock: 
-        if current_migration_state["stats"]["projects"]["total"] == 0 and len(old_projects_stubs_list) > 0: # Update if estimation failed
-            current_migration_state["stats"]["projects"]["total"] = len(old_projects_stubs_list)
-    _log_and_update_state(f"Total project stubs fetched for processing: {len(old_projects_stubs_list)}.")
-
-    processing_queue = deque(old_projects_stubs_list)
+    lanes = ProjectLanes(LARGE_PROJECT_BYTES) # listed + retried projects waiting for a worker
+    retry_delays = retry_policy.DelayQueue() # failed projects backing off before they re-enter the lanes
+    fork_gate = fork_network.ForkGate() # forks waiting for their parent to finish
+    project_feed = queue.Queue(maxsize=PROJECT_FEED_MAXSIZE)
+    listing_state = {"listed": 0, "listed_bytes": 0, "sized": 0, "error": None}
+    lister_thread = threading.Thread(target=_produce_project_stubs, args=(project_feed, listing_state), name="project-lister", daemon=True)
+    lister_thread.start()
     failed_repos_retry_counts = {}
-    MAX_RETRIES = 6
-    processed_count = 0
-    total_in_queue_ever = len(old_projects_stubs_list)
-
-    while processing_queue:
-        old_project_stub = processing_queue.popleft()
-        processed_count += 1
-        with state_lock: current_migration_state["current_action"] = f"Processing project {processed_count}/{total_in_queue_ever} (Queue size: {len(processing_queue)+1}): {old_project_stub.name}"
-        try:
-            project_id_old = old_project_stub.id; project_name_old = old_project_stub.name
-            project_path_old = old_project_stub.path; project_namespace_path_old = old_project_stub.path_with_namespace
-            project_description_old = old_project_stub.attributes.get('description', "") or ""
-            project_visibility_old = old_project_stub.attributes.get('visibility', 'private') or 'private'
-            old_repo_ssh_url_from_stub = old_project_stub.attributes.get('ssh_url_to_repo')
-            
-            namespace_info = old_project_stub.attributes.get('namespace', {})
-            old_namespace_id = namespace_info.get('id'); old_namespace_kind = namespace_info.get('kind')
-            new_target_namespace_id = None
-            if old_namespace_kind == 'group':
-                if old_namespace_id in OLD_TO_NEW_GROUP_ID_MAP: 
-                    new_target_namespace_id = OLD_TO_NEW_GROUP_ID_MAP[old_namespace_id]
-                else:
-                    _log_and_update_state(f"Group map missing for old group ID {old_namespace_id}. Attempting dynamic mapping by path...", log_type="warning")
-                    initial_new_parent_id = TARGET_PARENT_GROUP_ID_ON_NEW_FOR_ALL if TARGET_PARENT_GROUP_ID_ON_NEW_FOR_ALL else None
-                    new_target_namespace_id = ensure_group_mapped_by_path(namespace_info, initial_new_parent_id)
-                    
-                    if not new_target_namespace_id:
-                        err_msg = f"Could not dynamically map group ID {old_namespace_id}"
-                        _log_and_update_state(f"ERROR: {err_msg} (project: {project_namespace_path_old}). Skipping.", log_type="error")
-                        FAILED_REPOS.append({"Repo Name": project_name_old, "Old URL": project_namespace_path_old, "Reason": err_msg})
-                        projects_failed_processing_count += 1
-                        continue
-            elif old_namespace_kind == 'user':
-                username_old = namespace_info.get('path')
-                _log_and_update_state(f"Project '{project_name_old}' is a user project owned by '{username_old}'. Resolving user namespace on target...")
-                resolved_user_ns_id = get_user_namespace_id_on_new(username_old)
-                if resolved_user_ns_id:
-                    new_target_namespace_id = resolved_user_ns_id
-                    _log_and_update_state(f"  Resolved user '{username_old}' namespace ID: {new_target_namespace_id}.")
-                else:
-                    _log_and_update_state(f"  Could not find user '{username_old}' namespace on target. Falling back to token owner namespace.", log_type="warning")
-            else: 
-                err_msg = f"Unknown namespace kind '{old_namespace_kind}'"
-                _log_and_update_state(f"{err_msg} for '{project_name_old}'. Skipping.", log_type="warning")
-                FAILED_REPOS.append({"Repo Name": project_name_old, "Old URL": project_namespace_path_old, "Reason": err_msg})
-                projects_failed_processing_count += 1
+    started_project_ids = set()
+    # In delta-sync mode every project is revisited, since "done" only means done as of the previous sync.
+    done_in_previous_run = checkpoint.done_project_ids() if resumed and not delta_sync_enabled else set(); skipped_from_checkpoint = 0
+    _log_and_update_state(f"Migrating projects with {PROJECT_WORKERS} workers (API slots: {API_CONCURRENCY}, git slots: {GIT_CONCURRENCY}, "
+                          f"slots for projects >= {LARGE_PROJECT_BYTES // (1024 * 1024)} MB: {LARGE_PROJECT_SLOTS}) while listing continues in the background.")
+    byte_progress = {"completed": 0, "skipped": 0, "window": deque()}; phase_started_at = time.time()
+
+    if DISTRIBUTED:
+        if transfer_queue is None: transfer_queue = LeaseQueue(WORK_QUEUE_DB_PATH, WORKER_LEASE_SECONDS, WORKER_MAX_LEASES)
+        transfer_queue.reset(); _start_local_workers()
+        _log_and_update_state(f"Distributed mode: repository transfers go to workers through '{WORK_QUEUE_DB_PATH}' (lease {WORKER_LEASE_SECONDS}s); "
+                              f"up to {PROJECT_WORKERS} transfers are leased at once.")
+        if os.getenv('MIGRATION_WORKER_SLOTS') and LOCAL_WORKERS * WORKER_SLOTS > PROJECT_WORKERS: _log_and_update_state(f"MIGRATION_PROJECT_WORKERS ({PROJECT_WORKERS}) is below the local worker slots ({LOCAL_WORKERS * WORKER_SLOTS}); some slots will stay idle.", log_type="warning")
+
+    # Workers only run the migration itself; all queue/retry/report bookkeeping happens here on the scheduler thread.
+    with ThreadPoolExecutor(max_workers=PROJECT_WORKERS, thread_name_prefix="project-worker") as executor:
+        in_flight = {} # future -> (stub, size_bytes, is_large)
+        listing_finished = False
+        while not listing_finished or lanes or in_flight or retry_delays:
+            for old_project_stub, size_bytes in retry_delays.pop_ready(time.time()): lanes.add(old_project_stub, size_bytes)
+            # Move listed stubs into the size lanes; capped so the lister still feels back-pressure.
+            while not listing_finished and len(lanes) < PROJECT_FEED_MAXSIZE:
+                try:
+                    # Block for the next stub only when nothing else could wake us up.
+                    idle = not in_flight and not lanes
+                    next_retry_in = retry_delays.seconds_until_next(time.time())
+                    idle_timeout = 1.0 if next_retry_in is None else min(1.0, max(0.05, next_retry_in))
+                    old_project_stub = project_feed.get(timeout=idle_timeout) if idle else project_feed.get_nowait()
+                except queue.Empty: break
+                if old_project_stub is _END_OF_PROJECTS:
+                    listing_finished = True
+                    break
+                if old_project_stub.id in done_in_previous_run:
+                    skipped_from_checkpoint += 1; byte_progress["skipped"] += _project_size_bytes(old_project_stub) or 0
+                    _record_report_entry(DONE_REPOS, {"Repo Name": old_project_stub.name, "Old URL": old_project_stub.path_with_namespace, "Status": "Success",
+                                                      "Size Bytes": _project_size_bytes(old_project_stub), "Details": "Completed in a previous run"})
+                    with state_lock: current_migration_state["stats"]["projects"]["completed"] += 1
+                    continue
+                size_bytes = _project_size_bytes(old_project_stub)
+                if not FORK_DEDUP or fork_gate.admit(old_project_stub, size_bytes): lanes.add(old_project_stub, size_bytes)
+
+            while len(in_flight) < PROJECT_WORKERS:
+                large_in_flight = sum(1 for _, _, is_large in in_flight.values() if is_large)
+                small_waiting, large_waiting = lanes.counts()
+                # Large projects stay within their slots, unless nothing small is left to keep the other workers busy.
+                allow_large = large_in_flight < LARGE_PROJECT_SLOTS or (listing_finished and not small_waiting)
+                picked = lanes.pop(allow_large)
+                if picked is None: break
+                old_project_stub, size_bytes, is_large = picked
+                retry_label = " (retry)" if old_project_stub.id in started_project_ids else ""; started_project_ids.add(old_project_stub.id)
+                size_label = format_bytes(size_bytes) if size_bytes is not None else "size unknown"
+                with state_lock: current_migration_state["current_action"] = f"Processing project {len(started_project_ids) + skipped_from_checkpoint}/{current_migration_state['stats']['projects']['total']}{retry_label} (Queued: {small_waiting} small / {large_waiting} large, backing off: {len(retry_delays)}, forks waiting for parents: {len(fork_gate)}, in flight: {len(in_flight)+1}): {old_project_stub.name} ({size_label})"
+                in_flight[executor.submit(_migrate_project_stub, old_project_stub)] = picked
+
+            if not in_flight:
+                # Only retries that are still backing off remain; sleep until the first one is due.
+                if listing_finished and not lanes: time.sleep(min(1.0, retry_delays.seconds_until_next(time.time()) or 0))
                 continue
-            
-            # Attempt migration
-            success = migrate_project_repo_py(project_id_old, project_name_old, project_path_old, project_namespace_path_old, 
-                                       project_description_old, project_visibility_old, old_repo_ssh_url_from_stub, 
-                                       new_target_namespace_id)
-            if success:
-                projects_migrated_ok_count += 1
-                DONE_REPOS.append({"Repo Name": project_name_old, "Old URL": project_namespace_path_old, "Status": "Success"})
-                if project_id_old in failed_repos_retry_counts:
-                    with state_lock: current_migration_state["stats"]["projects"]["errors_resolved"] += 1
-            else:
-                total_errors_encountered += 1
-                retries = failed_repos_retry_counts.get(project_id_old, 0)
-                if retries < MAX_RETRIES:
-                    failed_repos_retry_counts[project_id_old] = retries + 1
-                    _log_and_update_state(f"Network delay or failure for '{project_name_old}'. Re-queuing (Retry {retries + 1}/{MAX_RETRIES}).", log_type="warning")
-                    processing_queue.append(old_project_stub)
-                    total_in_queue_ever += 1 # To keep progress bar somewhat accurate or moving
+            # Short timeout so newly listed stubs are picked up while long transfers are still running.
+            done_futures, _ = wait(in_flight, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done_futures:
+                old_project_stub, size_bytes, _ = in_flight.pop(future)
+                outcome, err_msg, failure_class = future.result()
+                project_id = getattr(old_project_stub, 'id', 'N/A')
+                project_name = getattr(old_project_stub, 'name', 'Unknown')
+                project_url = getattr(old_project_stub, 'path_with_namespace', 'Unknown')
+                retries = failed_repos_retry_counts.get(project_id, 0)
+                retry_limit = retry_policy.retry_limit(failure_class, MAX_PROJECT_RETRIES) if failure_class else 0
+                if not (outcome == "retry" and retries < retry_limit):
+                    byte_progress["completed"] += size_bytes or 0 # leaves the queue for good
+                    for fork_stub, fork_size_bytes in fork_gate.finish(project_id): lanes.add(fork_stub, fork_size_bytes)
+                if outcome == "ok":
+                    projects_migrated_ok_count += 1
+                    checkpoint.record_project(project_id, project_url, checkpoint_store.PROJECT_DONE, attempts=failed_repos_retry_counts.get(project_id, 0), new_id=NEW_PROJECT_IDS.get(project_id))
+                    transfer = PROJECT_TRANSFER_STATS.get(project_id, {})
+                    _record_report_entry(DONE_REPOS, {"Repo Name": project_name, "Old URL": project_url, "Status": "Success", "Size Bytes": size_bytes,
+                                                      "Transferred Bytes": transfer.get("total_bytes", 0), "Transfer MB/s": transfer.get("mb_s", 0.0),
+                                                      "Stage Seconds": timings.project_timings(project_id), "Retries": retries})
+                    _log_and_update_state(f"Project '{project_url}' done.", section="projects", increment_completed=True)
+                    if project_id in failed_repos_retry_counts:
+                        with state_lock: current_migration_state["stats"]["projects"]["errors_resolved"] += 1
+                elif outcome == "retry":
+                    total_errors_encountered += 1
+                    if retries < retry_limit:
+                        failed_repos_retry_counts[project_id] = retries + 1
+                        delay = retry_policy.backoff_delay(failure_class, retries, RETRY_BASE_DELAY_SECONDS, RETRY_MAX_DELAY_SECONDS)
+                        _log_and_update_state(f"{err_msg} for '{project_name}' ({failure_class}). Retrying in {delay:.0f}s (Retry {retries + 1}/{retry_limit}).", log_type="warning")
+                        retry_delays.push(time.time() + delay, (old_project_stub, size_bytes))
+                        checkpoint.record_project(project_id, project_url, checkpoint_store.PROJECT_RETRYING, reason=err_msg, attempts=retries + 1)
+                    else:
+                        final_msg = f"Max retries ({retry_limit}) reached for {failure_class} errors. Last error: {err_msg}"
+                        _log_and_update_state(f"Max retries ({retry_limit}) reached for '{project_name}' ({failure_class}). Giving up.", log_type="error", section="projects", increment_completed=True)
+                        _record_report_entry(FAILED_REPOS, {"Repo Name": project_name, "Old URL": project_url, "Reason": final_msg, "Size Bytes": size_bytes,
+                                                            "Stage Seconds": timings.project_timings(project_id), "Retries": retries})
+                        checkpoint.record_project(project_id, project_url, checkpoint_store.PROJECT_FAILED, reason=final_msg, attempts=retries)
+                        projects_failed_processing_count += 1
                 else:
-                    err_msg = f"Max retries ({MAX_RETRIES}) reached due to network/execution delays."
-                    _log_and_update_state(f"Max retries ({MAX_RETRIES}) reached for '{project_name_old}'. Giving up.", log_type="error")
-                    FAILED_REPOS.append({"Repo Name": project_name_old, "Old URL": project_namespace_path_old, "Reason": err_msg})
+                    if failure_class: err_msg = f"[{failure_class}] {err_msg}"
+                    _record_report_entry(FAILED_REPOS, {"Repo Name": project_name, "Old URL": project_url, "Reason": err_msg, "Size Bytes": size_bytes,
+                                                        "Stage Seconds": timings.project_timings(project_id), "Retries": retries})
+                    checkpoint.record_project(project_id, project_url, checkpoint_store.PROJECT_FAILED, reason=err_msg, attempts=retries)
+                    _log_and_update_state(f"Project '{project_url}' failed permanently: {err_msg}", log_type="error", section="projects", increment_completed=True)
                     projects_failed_processing_count += 1
-                    
-            time.sleep(0.5)
-        except AttributeError as ae:
-            err_msg = f"ATTRIBUTE ERROR processing stub ID {old_project_stub.id if old_project_stub else 'N/A'}: {ae}"
-            _log_and_update_state(err_msg, log_type="error", error_msg=str(ae))
-            _log_and_update_state(f"  Problematic stub: {old_project_stub.attributes if old_project_stub else 'N/A'}")
-            FAILED_REPOS.append({"Repo Name": old_project_stub.name if old_project_stub else 'Unknown', "Old URL": getattr(old_project_stub, 'path_with_namespace', 'Unknown'), "Reason": err_msg})
-            projects_failed_processing_count += 1
-        except Exception as e_proj_loop:
-            total_errors_encountered += 1
-            project_id = old_project_stub.id if old_project_stub else 'N/A'
-            retries = failed_repos_retry_counts.get(project_id, 0)
-            if retries < MAX_RETRIES and old_project_stub:
-                failed_repos_retry_counts[project_id] = retries + 1
-                _log_and_update_state(f"UNEXPECTED ERROR for '{old_project_stub.name}': {e_proj_loop}. Re-queuing (Retry {retries + 1}/{MAX_RETRIES}).", log_type="warning")
-                processing_queue.append(old_project_stub)
-                total_in_queue_ever += 1
-            else:
-                err_msg = f"UNEXPECTED ERROR in project loop for old ID {project_id} (Max retries reached): {e_proj_loop}"
-                _log_and_update_state(err_msg, log_type="error", error_msg=str(e_proj_loop))
-                FAILED_REPOS.append({"Repo Name": getattr(old_project_stub, 'name', 'Unknown'), "Old URL": getattr(old_project_stub, 'path_with_namespace', 'Unknown'), "Reason": err_msg})
-                projects_failed_processing_count += 1
-        
-        # Also update global stats count for failed
-        with state_lock:
-            current_migration_state["stats"]["projects"]["failed"] = total_errors_encountered
 
-    _log_and_update_state("=== MIGRATION COMPLETE ===", action="Migration finished", set_status="completed");
+            # Also update global stats count for failed
+            with state_lock:
+                current_migration_state["stats"]["projects"]["failed"] = total_errors_encountered
+            _publish_project_byte_progress(listing_state, listing_finished, byte_progress, phase_started_at)
+            if done_futures: publish_namespace_cache_stats()
+
+    lister_thread.join()
+    if preflight: preflight["cancelled"] = True # only matters if the run got here before the count did
+    if local_worker_processes: _stop_local_workers()
+    _publish_project_byte_progress(listing_state, True, byte_progress, phase_started_at)
+    record_phase_throughput("projects", projects_migrated_ok_count + projects_failed_processing_count, phase_started_at)
+    member_ops_executor.shutdown(); member_ops_executor = None
+    _stop_async_api()
+    if skipped_from_checkpoint: _log_and_update_state(f"Skipped {skipped_from_checkpoint} projects already completed in a previous run.")
+    if fork_gate.forks_seen: _log_and_update_state(f"{fork_gate.forks_seen} forks were migrated after their parents, reusing the parents' cached objects where available.")
+    if listing_state["error"]:
+        _log_and_update_state(f"Project listing aborted early: {listing_state['error']}. Only {listing_state['listed']} listed projects were processed.", log_type="error",
+                              action="Migration finished with listing error", error_msg=f"ERROR fetching project stubs: {listing_state['error']}", set_status="error")
+    else:
+        _log_and_update_state("=== MIGRATION COMPLETE ===", action="Migration finished", set_status="completed");
     _log_and_update_state(f"Successfully processed Git data for: {projects_migrated_ok_count} projects.")
     _log_and_update_state(f"Failed to process/migrate: {projects_failed_processing_count} projects.")
 
@@ -0,0 +1,109 @@
+import json
+import os
+import time
+
+PLAN_FORMAT_VERSION = 1
+# Project attributes kept in the plan: enough for a real run to rebuild the project stub without listing the old instance again.
+PROJECT_STUB_ATTRIBUTES = ("id", "name", "path", "path_with_namespace", "description", "visibility", "ssh_url_to_repo",
+                           "http_url_to_repo", "web_url", "namespace", "statistics", "empty_repo", "archived", "forked_from_project")
+# Rough API requests per created item (create + lookups + member sync), used only for the time estimate.
+API_CALLS_PER_ITEM = {"users": 1, "groups": 4, "projects": 8}
+
+def target_group_path(old_full_path, target_root_full_path):
+    return f"{target_root_full_path}/{old_full_path}" if target_root_full_path else old_full_path
+
+def _plan_users(old_users, new_users):
+    """old_users/new_users: dicts with id, username, email, name. Target users are matched by username, then email."""
+    by_username = {u["username"].lower(): u["id"] for u in new_users}
+    by_email = {u["email"].lower(): u["id"] for u in new_users if u.get("email")}
+    planned = []
+    for u in old_users:
+        email = (u.get("email") or "").lower()
+        username_id = by_username.get(u["username"].lower()); email_id = by_email.get(email) if email else None
+        if username_id and email_id and username_id != email_id:
+            action, new_id, note = "conflict", username_id, f"username matches target user {username_id}, email matches target user {email_id}"
+        elif username_id or email_id:
+            action, new_id, note = "map", username_id or email_id, None
+        elif u["username"] == "root":
+            action, new_id, note = "skip", None, "no root user on target"
+        else:
+            action, new_id, note = "create", None, None
+        planned.append({**u, "action": action, "new_id": new_id, "note": note})
+    return planned
+
+def _plan_groups(old_groups, target_groups_by_path, target_user_paths, target_root_full_path):
+    """old_groups: dicts with id, parent_id, name, path, full_path, visibility, description.
+    target_groups_by_path: lowercase full_path -> ID of every group on the target."""
+    planned = []
+    for g in old_groups:
+        target_path = target_group_path(g["full_path"], target_root_full_path)
+        new_id = target_groups_by_path.get(target_path.lower())
+        if new_id: action, note = "map", None
+        elif "/" not in target_path and target_path.lower() in target_user_paths: action, note = "conflict", "path is taken by a user namespace on the target"
+        else: action, note = "create", None
+        planned.append({**g, "target_path": target_path, "action": action, "new_id": new_id, "note": note})
+    return planned
+
+def _plan_projects(old_projects, target_projects_by_path, target_group_paths, target_root_full_path):
+    """old_projects: project stub attribute dicts. target_projects_by_path: lowercase path_with_namespace ->
+    {id, empty_repo}. Group projects land under target_root_full_path (if any); user projects keep their path."""
+    planned = []
+    for attrs in old_projects:
+        namespace = attrs.get("namespace") or {}
+        if namespace.get("kind") == "group": target_path = target_group_path(attrs["path_with_namespace"], target_root_full_path)
+        else: target_path = attrs["path_with_namespace"]
+        stats = attrs.get("statistics") or {}
+        size_bytes = (stats.get("repository_size") or 0) + (stats.get("lfs_objects_size") or 0) if stats else None
+        existing = target_projects_by_path.get(target_path.lower())
+        if existing and existing.get("empty_repo") is False: action, note = "skip", "target already has repository data (re-synced in delta mode)"
+        elif existing: action, note = "push", None
+        elif target_path.lower() in target_group_paths: action, note = "conflict", "path is taken by a group on the target"
+        else: action, note = "create", None
+        planned.append({"stub": attrs, "target_path": target_path, "size_bytes": size_bytes, "action": action,
+                        "new_id": existing["id"] if existing else None, "note": note})
+    return planned
+
+def _count_actions(items):
+    counts = {}
+    for item in items: counts[item["action"]] = counts.get(item["action"], 0) + 1
+    return counts
+
+def build_plan(inventory, throughput_mb_s, api_rate_per_s, project_workers):
+    """Diffs a bulk inventory of both instances (see migration_logic.collect_plan_inventory) into a plan dict."""
+    users = _plan_users(inventory["old_users"], inventory["new_users"])
+    groups = _plan_groups(inventory["old_groups"], inventory["target_groups_by_path"], inventory["target_user_paths"], inventory["target_root_full_path"])
+    target_group_paths = set(inventory["target_groups_by_path"]) | {g["target_path"].lower() for g in groups if g["action"] == "create"}
+    projects = _plan_projects(inventory["old_projects"], inventory["target_projects_by_path"], target_group_paths, inventory["target_root_full_path"])
+
+    transfer_bytes = sum(p["size_bytes"] or 0 for p in projects if p["action"] in ("create", "push"))
+    unsized = sum(1 for p in projects if p["size_bytes"] is None and p["action"] in ("create", "push"))
+    api_calls = sum(API_CALLS_PER_ITEM[kind] * sum(1 for item in items if item["action"] != "skip")
+                    for kind, items in (("users", users), ("groups", groups), ("projects", projects)))
+    # API work is capped by the rate limit when there is one; otherwise assume ~50 ms per request spread over the workers.
+    api_seconds = api_calls / api_rate_per_s if api_rate_per_s else api_calls * 0.05 / max(project_workers, 1)
+    transfer_seconds = transfer_bytes / (throughput_mb_s * 1024 * 1024) if throughput_mb_s else 0
+    return {
+        "version": PLAN_FORMAT_VERSION,
+        "created_at": time.strftime('%Y-%m-%d %H:%M:%S'),
+        "old_url": inventory["old_url"], "new_url": inventory["new_url"],
+        "target_parent_id": inventory["target_parent_id"], "target_root_full_path": inventory["target_root_full_path"],
+        "scope": inventory.get("scope"), # MigrationScope.to_dict() of the wave, None for the whole instance
+        "summary": {"users": _count_actions(users), "groups": _count_actions(groups), "projects": _count_actions(projects)},
+        "estimates": {"transfer_bytes": transfer_bytes, "unsized_projects": unsized, "api_calls": api_calls,
+                      "assumed_throughput_mb_s": throughput_mb_s, "project_workers": project_workers,
+                      "seconds": int(api_seconds + transfer_seconds)},
+        "users": users, "groups": groups, "projects": projects,
+    }
+
+def save_plan(plan, path):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f: json.dump(plan, f)
+    os.replace(tmp_path, path)
+
+def load_plan(path, old_url, new_url):
+    """Reads a plan file. Raises ValueError if it was made for another source/target pair or format."""
+    with open(path, encoding="utf-8") as f: plan = json.load(f)
+    if plan.get("version") != PLAN_FORMAT_VERSION: raise ValueError(f"unsupported plan format version {plan.get('version')}")
+    if (plan.get("old_url"), plan.get("new_url")) != (old_url, new_url):
+        raise ValueError(f"plan was made for {plan.get('old_url')} -> {plan.get('new_url')}")
+    return plan
@@ -0,0 +1,111 @@
+import csv
+import fnmatch
+import hashlib
+import io
+import json
+import re
+
+# Columns accepted in an uploaded scope CSV (header row required; any subset, one value per cell).
+CSV_COLUMNS = {"project_id": "project_ids", "group": "groups", "group_full_path": "groups", "path_with_namespace": "patterns", "pattern": "patterns", "regex": "regexes"}
+_GLOB_CHARS = re.compile(r"[*?\[]")
+
+def _clean_path(path):
+    return str(path).strip().strip("/")
+
+class MigrationScope:
+    """The slice of the source instance a run (a "wave") migrates: whole group subtrees, projects whose
+    path_with_namespace matches a glob or regex, and explicit project IDs. A project is in scope if any of them matches.
+
+    Globs without wildcards are exact project paths. Globs and regexes are only pushed down into the API as far as
+    their literal prefix allows (see pushdown_groups/search_term); the rest is filtered client-side.
+    """
+
+    def __init__(self, groups=(), patterns=(), regexes=(), project_ids=()):
+        paths = sorted({_clean_path(g) for g in groups if _clean_path(g)}, key=lambda p: (p.count("/"), p.lower()))
+        # Nested paths are covered by their ancestor's subtree.
+        self.groups = [p for i, p in enumerate(paths) if not any(p.lower().startswith(q.lower() + "/") for q in paths[:i])]
+        self.patterns = sorted({_clean_path(p) for p in patterns if _clean_path(p)})
+        self.regexes = sorted({str(r).strip() for r in regexes if str(r).strip()})
+        self.project_ids = sorted({int(i) for i in project_ids})
+        self._globs = [re.compile(fnmatch.translate(p), re.IGNORECASE) for p in self.patterns if _GLOB_CHARS.search(p)]
+        self._regexes = [re.compile(r) for r in self.regexes] # re.error surfaces as a bad request
+        self._ids = set(self.project_ids)
+
+    def __bool__(self):
+        return bool(self.groups or self.patterns or self.regexes or self.project_ids)
+
+    def to_dict(self):
+        return {"groups": self.groups, "patterns": self.patterns, "regexes": self.regexes, "project_ids": self.project_ids}
+
+    @classmethod
+    def from_dict(cls, data):
+        data = data or {}
+        def as_list(key):
+            value = data.get(key) or []
+            return [v for v in re.split(r"[,\n]", value)] if isinstance(value, str) else list(value)
+        return cls(as_list("groups"), as_list("patterns"), as_list("regexes"), [i for i in as_list("project_ids") if str(i).strip()])
+
+    @classmethod
+    def from_csv(cls, text):
+        """A CSV with a header row naming any of CSV_COLUMNS. Raises ValueError if none are present."""
+        reader = csv.DictReader(io.StringIO(text))
+        known = {name.strip().lower(): name for name in reader.fieldnames or [] if name and name.strip().lower() in CSV_COLUMNS}
+        if not known: raise ValueError(f"scope CSV needs a header with at least one of: {', '.join(sorted(CSV_COLUMNS))}")
+        values = {"groups": [], "patterns": [], "regexes": [], "project_ids": []}
+        for row in reader:
+            for column, field in known.items():
+                cell = (row.get(field) or "").strip()
+                if cell: values[CSV_COLUMNS[column]].append(cell)
+        return cls.from_dict(values)
+
+    def merged(self, other):
+        return MigrationScope(self.groups + other.groups, self.patterns + other.patterns, self.regexes + other.regexes, self.project_ids + other.project_ids)
+
+    @property
+    def fingerprint(self):
+        """Short stable ID, used to keep per-wave checkpoint phases apart."""
+        return hashlib.sha1(json.dumps(self.to_dict(), sort_keys=True).encode()).hexdigest()[:12]
+
+    def describe(self):
+        parts = [f"{len(values)} {label}" for label, values in (("group subtrees", self.groups), ("path patterns", self.patterns),
+                                                                ("regexes", self.regexes), ("project IDs", self.project_ids)) if values]
+        return ", ".join(parts) or "whole instance"
+
+    def exact_paths(self):
+        return [p for p in self.patterns if not _GLOB_CHARS.search(p)]
+
+    def in_groups(self, path_with_namespace):
+        path = path_with_namespace.lower()
+        return any(path.startswith(g.lower() + "/") for g in self.groups)
+
+    def pushdown_groups(self):
+        """[(group full_path, compiled filter or None)] to list with include_subgroups: the group subtrees themselves, plus the
+        literal leading groups of globs such as 'team-a/*/api-*'. Globs already inside a listed subtree are not listed twice."""
+        listed = [(g, None) for g in self.groups]
+        for pattern, compiled in zip([p for p in self.patterns if _GLOB_CHARS.search(p)], self._globs):
+            segments = pattern.split("/")
+            prefix = []
+            for segment in segments[:-1]:
+                if _GLOB_CHARS.search(segment): break
+                prefix.append(segment)
+            if not prefix or self.in_groups(pattern): continue
+            listed.append(("/".join(prefix), compiled))
+        return listed
+
+    def _unanchored_globs(self):
+        return [(pattern, compiled) for pattern, compiled in zip([p for p in self.patterns if _GLOB_CHARS.search(p)], self._globs)
+                if "/" not in pattern or _GLOB_CHARS.search(pattern.split("/")[0])]
+
+    def has_unanchored(self):
+        """True if some globs (no literal group prefix) or regexes need an instance-wide, search-narrowed listing."""
+        return bool(self._unanchored_globs() or self._regexes)
+
+    def matches_unanchored(self, path_with_namespace):
+        return any(compiled.match(path_with_namespace) for _, compiled in self._unanchored_globs()) or any(r.search(path_with_namespace) for r in self._regexes)
+
+    def search_term(self):
+        """Longest literal run of the one unanchored glob, for narrowing the listing with search= (None with several filters or regexes)."""
+        sources = [pattern for pattern, _ in self._unanchored_globs()]
+        if self.regexes or len(sources) != 1: return None
+        literals = [chunk for chunk in re.split(r"[*?/]|\[[^\]]*\]", sources[0]) if len(chunk) >= 3]
+        return max(literals, key=len) if literals else None
@@ -0,0 +1,113 @@
+"""Repository transfer worker for distributed migrations (MIGRATION_DISTRIBUTED=true).
+
+Claims transfer jobs from the coordinator, runs the clone/fetch + push of each one with the same code a
+single-process run uses, and reports the outcome, byte counts and stage timings back.
+
+Same machine (shares the coordinator's SQLite queue; this is what MIGRATION_LOCAL_WORKERS starts):
+    python -m migration_worker --queue ./migration_work_queue.sqlite3 --slots 4
+Another machine (talks to the web app's /worker/* endpoints, needs MIGRATION_WORKER_TOKEN set there):
+    python -m migration_worker --coordinator http://coordinator:5000 --token "$MIGRATION_WORKER_TOKEN" --slots 4
+
+Workers read OLD_/NEW_GITLAB_URL and the tokens from their own environment (.env); credentials are never sent
+through the queue.
+"""
+import argparse
+import os
+import socket
+import threading
+from types import SimpleNamespace
+
+import migration_logic as ml
+from transfer_meter import TRANSFER_KINDS
+from work_queue import HttpLeaseQueue, LeaseQueue
+
+IDLE_POLL_SECONDS = 1.0
+# An idle slot claims again after this delay, doubling up to IDLE_POLL_SECONDS until it gets a job.
+IDLE_POLL_MIN_SECONDS = 0.05
+
+class TransferWorker:
+    def __init__(self, job_queue, worker_id, slots, parent_pid=None):
+        self.queue = job_queue
+        self.worker_id = worker_id
+        self.slots = slots
+        self.parent_pid = parent_pid
+        self._active = {} # project ID -> transfer key of the jobs running now
+        self._active_lock = threading.Lock()
+        self._stop = threading.Event()
+        # Clone and push slots sized to this worker, not to the coordinator's GIT_CONCURRENCY settings.
+        self._clone_slots = threading.BoundedSemaphore(slots); self._push_slots = threading.BoundedSemaphore(slots)
+
+    def _orphaned(self):
+        return self.parent_pid is not None and os.getppid() != self.parent_pid
+
+    def run_job(self, job):
+        payload = job["payload"]; project_id = payload["project_id"]; key = payload["path_with_namespace"]
+        new_project = SimpleNamespace(path_with_namespace=payload["new_path_with_namespace"], attributes={"empty_repo": payload["new_empty_repo"]})
+        ml._log_and_update_state(f"[{self.worker_id}] Transferring '{key}' (Old ID: {project_id}).")
+        ml.transfer_meter.start_project(key)
+        with self._active_lock: self._active[project_id] = key
+        try:
+            with ml.timings.bind_project(project_id):
+                ok, detail = ml._transfer_repository_py(project_id, payload["name"], key, new_project, key, payload.get("fork_parent_id"), payload.get("size_bytes"),
+                                                      self._clone_slots, self._push_slots)
+        except Exception as e:
+            ok, detail = False, f"Worker {self.worker_id} error: {e}"
+        finally:
+            with self._active_lock: self._active.pop(project_id, None)
+            transfer = ml.transfer_meter.finish_project(key) or {}
+        progress = {kind: transfer.get(kind, 0) for kind in TRANSFER_KINDS}
+        return {"ok": ok, "detail": detail, "progress": progress, "stages": ml.timings.pop_project_timings(project_id)}
+
+    def _slot_loop(self):
+        idle_seconds = IDLE_POLL_MIN_SECONDS
+        while not self._stop.is_set():
+            try: jobs = self.queue.claim(self.worker_id, 1, self.slots)
+            except Exception as e:
+                ml._log_and_update_state(f"[{self.worker_id}] Claim failed: {e}", log_type="warning"); jobs = []
+            if not jobs:
+                self._stop.wait(idle_seconds); idle_seconds = min(idle_seconds * 2, IDLE_POLL_SECONDS); continue
+            job = jobs[0]; idle_seconds = IDLE_POLL_MIN_SECONDS
+            result = self.run_job(job)
+            try: accepted = self.queue.complete(self.worker_id, job["project_id"], result)
+            except Exception as e: accepted = False; ml._log_and_update_state(f"[{self.worker_id}] Could not report result: {e}", log_type="error")
+            if not accepted: ml._log_and_update_state(f"[{self.worker_id}] Result for '{job['payload']['path_with_namespace']}' discarded: the lease had moved on.", log_type="warning")
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(max(1.0, self.queue.lease_seconds / 3)):
+            if self._orphaned(): self._stop.set(); break
+            with self._active_lock: active = dict(self._active)
+            progress = {project_id: {kind: ml.transfer_meter.project_bytes(key, kind) for kind in TRANSFER_KINDS}
+                        for project_id, key in active.items()}
+            try: self.queue.heartbeat(self.worker_id, progress)
+            except Exception as e: ml._log_and_update_state(f"[{self.worker_id}] Heartbeat failed: {e}", log_type="warning")
+
+    def run(self):
+        ml.workspace.prepare()
+        ml._log_and_update_state(f"[{self.worker_id}] Transfer worker started with {self.slots} slot(s).")
+        threads = [threading.Thread(target=self._slot_loop, name=f"transfer-slot_{index}", daemon=True) for index in range(self.slots)]
+        threads.append(threading.Thread(target=self._heartbeat_loop, name="worker-heartbeat", daemon=True))
+        for thread in threads: thread.start()
+        try:
+            while not self._stop.wait(IDLE_POLL_SECONDS):
+                if self._orphaned(): self._stop.set()
+        except KeyboardInterrupt: self._stop.set()
+        ml._log_and_update_state(f"[{self.worker_id}] Transfer worker stopping.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Repository transfer worker for distributed GitLab migrations.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--queue", help="SQLite work queue shared with a coordinator on this machine")
+    source.add_argument("--coordinator", help="base URL of the coordinator web app")
+    parser.add_argument("--token", default=os.getenv("MIGRATION_WORKER_TOKEN"), help="coordinator's MIGRATION_WORKER_TOKEN")
+    parser.add_argument("--slots", type=int, default=ml.WORKER_SLOTS, help="concurrent transfers")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument("--parent-pid", type=int, help="exit when this process (the coordinator) goes away")
+    args = parser.parse_args(argv)
+    if args.queue: job_queue = LeaseQueue(args.queue, ml.WORKER_LEASE_SECONDS, ml.WORKER_MAX_LEASES)
+    else:
+        if not args.token: parser.error("--coordinator needs --token (or MIGRATION_WORKER_TOKEN)")
+        job_queue = HttpLeaseQueue(args.coordinator, args.token)
+    TransferWorker(job_queue, args.worker_id, max(1, args.slots), args.parent_pid).run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import threading
+
+class NamespaceCache:
+    """Thread-safe path -> ID lookups for namespaces on the target instance.
+
+    Groups are keyed by (parent_id, path) so a hierarchy can be resolved segment by segment without
+    knowing the parent's full path; user namespaces are keyed by path. preload() fills both from a
+    single streamed namespaces scan, after which lookups are dict hits. Callers fall back to the API
+    on a miss and remember() what they find or create. After a preload, or once a lookup came back empty
+    (remember_group_absent), group_known_absent() lets callers skip the existence check and create directly.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._group_ids = {}
+        self._user_namespace_ids = {}
+        self._absent_groups = set()
+        self.complete = False # True after preload(): every target group was seen, so a miss means "doesn't exist"
+        self.hits = 0
+        self.misses = 0
+
+    def preload(self, gl, per_page=100):
+        groups = {}; user_namespaces = {}
+        for ns in gl.namespaces.list(iterator=True, per_page=per_page):
+            attrs = ns.attributes
+            if attrs.get('kind') == 'group':
+                groups[(attrs.get('parent_id'), attrs['path'].lower())] = ns.id
+            elif attrs.get('kind') == 'user':
+                user_namespaces[attrs['path'].lower()] = ns.id
+        with self._lock:
+            self._group_ids.update(groups)
+            self._user_namespace_ids.update(user_namespaces)
+            self.complete = True
+        return len(groups), len(user_namespaces)
+
+    def _lookup(self, table, key):
+        with self._lock:
+            value = table.get(key)
+            if value is None: self.misses += 1
+            else: self.hits += 1
+            return value
+
+    def get_group_id(self, parent_id, path):
+        return self._lookup(self._group_ids, (parent_id or None, path.lower()))
+
+    def remember_group(self, parent_id, path, group_id):
+        key = (parent_id or None, path.lower())
+        with self._lock: self._group_ids[key] = group_id; self._absent_groups.discard(key)
+
+    def knows_group(self, parent_id, path):
+        """True if the group's ID or its absence is already known (not counted as a lookup)."""
+        key = (parent_id or None, path.lower())
+        with self._lock: return key in self._group_ids or key in self._absent_groups or self.complete
+
+    def remember_group_absent(self, parent_id, path):
+        with self._lock: self._absent_groups.add((parent_id or None, path.lower()))
+
+    def group_known_absent(self, parent_id, path):
+        key = (parent_id or None, path.lower())
+        with self._lock: return key not in self._group_ids and (self.complete or key in self._absent_groups)
+
+    def get_user_namespace_id(self, username):
+        return self._lookup(self._user_namespace_ids, username.lower())
+
+    def remember_user_namespace(self, username, namespace_id):
+        with self._lock: self._user_namespace_ids[username.lower()] = namespace_id
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                    "groups": len(self._group_ids), "user_namespaces": len(self._user_namespace_ids)}
@@ -0,0 +1,43 @@
+import heapq
+import itertools
+from collections import deque
+
+class ProjectLanes:
+    """Pending projects split by repository size.
+
+    Small projects (and those whose size is unknown) wait in a FIFO fast lane; projects of at least
+    large_threshold_bytes wait in a largest-first heap, so the biggest transfers start as early as their
+    dedicated slots allow instead of landing at the tail of the run. Only the scheduler thread touches it.
+    """
+
+    def __init__(self, large_threshold_bytes):
+        self.large_threshold_bytes = large_threshold_bytes
+        self._small = deque()
+        self._large = []
+        self._tiebreak = itertools.count()
+        self.pending_bytes = 0
+
+    def __len__(self):
+        return len(self._small) + len(self._large)
+
+    def counts(self):
+        return len(self._small), len(self._large)
+
+    def add(self, stub, size_bytes):
+        self.pending_bytes += size_bytes or 0
+        if size_bytes is not None and size_bytes >= self.large_threshold_bytes:
+            heapq.heappush(self._large, (-size_bytes, next(self._tiebreak), stub))
+        else:
+            self._small.append((size_bytes, stub))
+
+    def pop(self, allow_large):
+        """(stub, size_bytes, is_large) for the next project to start, or None. Large projects go first when allowed."""
+        if allow_large and self._large:
+            negative_size, _, stub = heapq.heappop(self._large)
+            self.pending_bytes += negative_size
+            return stub, -negative_size, True
+        if self._small:
+            size_bytes, stub = self._small.popleft()
+            self.pending_bytes -= size_bytes or 0
+            return stub, size_bytes, False
+        return None
@@ -0,0 +1,134 @@
+import csv
+import io
+import json
+import os
+import threading
+import time
+
+from timing_metrics import PROJECT_STAGES
+
+STAGE_COLUMNS = tuple(f"{stage} (s)" for stage in PROJECT_STAGES)
+REPORT_COLUMNS = ("Repo Name", "Old URL", "Status", "Details", "Size (MB)", "Transferred (MB)", "Transfer MB/s", "Duration (s)", "Retries") + STAGE_COLUMNS
+PLACEHOLDER_ROW = {"Repo Name": "None", "Old URL": "N/A", "Status": "N/A", "Details": "No migrations attempted."}
+
+def _mb(byte_count):
+    return round(byte_count / (1024 * 1024), 2) if byte_count is not None else None
+
+def report_row(entry, status):
+    """Flat REPORT_COLUMNS dict for one recorded DONE_REPOS/FAILED_REPOS entry."""
+    stages = entry.get("Stage Seconds") or {}
+    row = {"Repo Name": entry.get("Repo Name"), "Old URL": entry.get("Old URL"), "Status": status,
+           "Details": entry.get("Details") or ("Migrated successfully" if status == "Success" else entry.get("Reason", "Unknown")),
+           "Size (MB)": _mb(entry.get("Size Bytes")), "Transferred (MB)": _mb(entry.get("Transferred Bytes")),
+           "Transfer MB/s": entry.get("Transfer MB/s"), "Duration (s)": stages.get("total"), "Retries": entry.get("Retries", 0)}
+    row.update((column, stages.get(stage)) for column, stage in zip(STAGE_COLUMNS, PROJECT_STAGES))
+    return row
+
+def report_rows(done_repos, failed_repos):
+    """Report rows, successes first, built lazily so large runs are never materialized as a second list."""
+    for entry in done_repos: yield report_row(entry, "Success")
+    for entry in failed_repos: yield report_row(entry, "Failed")
+
+def iter_csv(rows):
+    """CSV text chunks: the header, then one line per row."""
+    buffer = io.StringIO(); writer = csv.writer(buffer)
+    writer.writerow(REPORT_COLUMNS)
+    yield buffer.getvalue()
+    for row in rows:
+        buffer.seek(0); buffer.truncate()
+        writer.writerow(["" if row.get(column) is None else row.get(column) for column in REPORT_COLUMNS])
+        yield buffer.getvalue()
+
+def iter_ndjson(rows):
+    for row in rows: yield json.dumps(row) + "\n"
+
+def write_xlsx(rows, path):
+    """Write-only workbook: rows are serialized as they are appended instead of held as cell objects."""
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Migration Report")
+    sheet.append(REPORT_COLUMNS)
+    empty = True
+    for row in rows:
+        sheet.append([row.get(column) for column in REPORT_COLUMNS]); empty = False
+    if empty: sheet.append([PLACEHOLDER_ROW.get(column) for column in REPORT_COLUMNS])
+    workbook.save(path)
+
+def _latin1(text):
+    return str(text).encode('latin-1', 'replace').decode('latin-1') # the core PDF fonts only cover latin-1
+
+def write_pdf(done_repos, failed_repos, path):
+    from fpdf import FPDF
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", style='B', size=14)
+    pdf.cell(200, 10, txt="GitLab Migration Execution Report", ln=True, align='C')
+    pdf.ln(5)
+    for title, color, entries, status, empty_text in (("Successfully Migrated Repositories", (16, 185, 129), done_repos, "Success", "No successful repository migrations recorded."),
+                                                      ("Failed Migrations", (239, 68, 68), failed_repos, "Failed", "No failures recorded.")):
+        pdf.set_font("Arial", style='B', size=12)
+        pdf.set_text_color(*color)
+        pdf.cell(200, 10, txt=f"{title} ({len(entries)})", ln=True)
+        pdf.set_text_color(0, 0, 0)
+        if not entries:
+            pdf.set_font("Arial", size=10)
+            pdf.cell(200, 8, txt=empty_text, ln=True)
+        for idx, row in enumerate((report_row(entry, status) for entry in entries), 1):
+            pdf.set_font("Arial", style='B', size=10)
+            pdf.cell(200, 6, txt=_latin1(f"{idx}. {row['Repo Name'] or 'Unknown'}"), ln=True)
+            pdf.set_font("Arial", size=9)
+            pdf.cell(200, 5, txt=_latin1(f"URL: {row['Old URL'] or 'Unknown'}"), ln=True)
+            figures = [f"{label}: {row[column]}" for label, column in (("Size MB", "Size (MB)"), ("Duration s", "Duration (s)"), ("Retries", "Retries")) if row[column] not in (None, 0)]
+            if figures: pdf.cell(200, 5, txt=", ".join(figures), ln=True)
+            if status == "Failed": pdf.multi_cell(0, 5, txt=_latin1(f"Reason: {row['Details']}"))
+            pdf.ln(3)
+        pdf.ln(5)
+    pdf.output(path, 'F')
+
+class ReportCache:
+    """Generated report files keyed by (run ID, generation): a report is rendered once per change of the recorded
+    entries and served from disk afterwards. Files of older generations are removed once nobody has been handed
+    them for grace_seconds, so a download that is still streaming one is never cut off."""
+
+    def __init__(self, directory, grace_seconds=600):
+        self.directory = directory
+        self.grace_seconds = grace_seconds
+        self._lock = threading.Lock() # guards the directory listing and _building, never a build
+        self._building = {} # file name -> Event set when its build finishes (or fails)
+
+    def get(self, run_id, generation, extension, build):
+        """Path of the cached report, calling build(tmp_path) to create it if this run/generation has none yet.
+        Concurrent requests for the same file wait for one build instead of rendering it again."""
+        name = f"migration_report-{run_id}-{generation}.{extension}"
+        path = os.path.join(self.directory, name)
+        while True:
+            with self._lock:
+                if os.path.exists(path):
+                    os.utime(path) # handed out again: restarts its grace period
+                    return path
+                building = self._building.get(name)
+                if building is None: self._building[name] = threading.Event(); break
+            building.wait() # then re-check: the other build may have failed
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            try:
+                build(tmp_path)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path): os.remove(tmp_path)
+                raise
+        finally:
+            with self._lock: self._building.pop(name).set()
+        self._remove_superseded(name, extension)
+        return path
+
+    def _remove_superseded(self, keep, extension):
+        cutoff = time.time() - self.grace_seconds
+        with self._lock:
+            for other in os.listdir(self.directory):
+                if other == keep or not (other.endswith(f".{extension}") or other.endswith(".tmp")): continue
+                other_path = os.path.join(self.directory, other)
+                try:
+                    if os.path.getmtime(other_path) < cutoff: os.remove(other_path) # .tmp: left by a build that crashed
+                except FileNotFoundError: pass # removed by another process sharing the directory
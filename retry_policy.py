@@ -0,0 +1,96 @@
+import heapq
+import itertools
+import random
+import re
+
+import gitlab
+import requests
+
+# Failure classes, in the order classify_failure() checks them.
+PERMANENT = "permanent" # 4xx other than 408/429, missing/forbidden repositories, rejected pushes
+RATE_LIMITED = "rate_limited" # HTTP 429
+SERVER_ERROR = "server_error" # HTTP 5xx
+DISK = "disk" # no room on the scratch volumes, or one filled up mid-transfer (the workspace estimate was too low)
+NETWORK = "network" # connection/TLS/DNS failures, timeouts, dropped transfers
+GIT = "git" # other git-level failures (corrupt pack, failed index-pack, ...)
+UNKNOWN = "unknown"
+
+# class -> (retryable, backoff base multiplier, attempt cap or None for MIGRATION_MAX_RETRIES)
+RETRY_POLICIES = {
+    PERMANENT: (False, 0, 0),
+    RATE_LIMITED: (True, 6, None),
+    SERVER_ERROR: (True, 3, None),
+    NETWORK: (True, 1, None),
+    DISK: (True, 4, 2), # by then other transfers have settled, or idle mirrors can be evicted
+    GIT: (True, 2, 2), # a repeat of the same git error is rarely fixed by a third try
+    UNKNOWN: (True, 1, None),
+}
+
+# "Not found" only counts in GitLab's own wording: git and tools say it for conditions a retry can fix too
+# (a ref gone mid-fetch, "git-lfs: command not found"). "Has already been taken" isn't final either: the migration
+# looks the existing project up, and reports "not found on target" once those lookups have given up.
+_PERMANENT_PATTERNS = re.compile(
+    r"repository (?:'[^']*' )?not found|project you were looking for could not be found|404 (?:project|namespace|group|user) not found|"
+    r"not found on target|does not appear to be a git repository|authentication failed|access denied|"
+    r"returned error: 40[0-7]|returned error: 41\d|returned error: 422|(?:^|\s)4(?:0[0-7]|1\d|22): |pre-receive hook declined|exceeds file size limit|"
+    r"could not dynamically map|unknown namespace kind|does not fit on any scratch volume|no transfer worker is running", re.IGNORECASE)
+# "NNN: " is how python-gitlab renders GitlabError (response code, then message).
+_RATE_LIMIT_PATTERNS = re.compile(r"returned error: 429|too many requests|(?:^|\s)429: ", re.IGNORECASE)
+_SERVER_PATTERNS = re.compile(r"returned error: 5\d\d|internal server error|bad gateway|service unavailable|gateway time-?out|(?:^|\s)5\d\d: ", re.IGNORECASE)
+_NETWORK_PATTERNS = re.compile(
+    r"could not resolve host|failed to connect|connection (?:refused|reset|timed out)|operation timed out|timed out|"
+    r"remote end hung up|early eof|rpc failed|gnutls|\bssl\b|\btls\b|network is unreachable|broken pipe|unexpected disconnect", re.IGNORECASE)
+_DISK_PATTERNS = re.compile(r"no space left on device|disk quota exceeded|not enough free disk space", re.IGNORECASE)
+_GIT_PATTERNS = re.compile(r"fatal:|index-pack failed|unpack failed|pack-objects died|error: |command not found", re.IGNORECASE)
+
+def classify_failure(detail=None, exc=None):
+    """Failure class for a failed project attempt, from the exception (if any) and/or the error text / git stderr."""
+    if exc is not None:
+        if isinstance(exc, gitlab.exceptions.GitlabError) and exc.response_code:
+            code = exc.response_code
+            if code == 429: return RATE_LIMITED
+            if code >= 500: return SERVER_ERROR
+            if 400 <= code < 500 and code != 408: return PERMANENT
+        if isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout, ConnectionError, TimeoutError)):
+            return NETWORK
+        detail = f"{detail or ''} {exc}"
+    text = detail or ""
+    if _RATE_LIMIT_PATTERNS.search(text): return RATE_LIMITED
+    if _SERVER_PATTERNS.search(text): return SERVER_ERROR
+    if _DISK_PATTERNS.search(text): return DISK # git often reports a hung-up remote after the local write failed
+    if _NETWORK_PATTERNS.search(text): return NETWORK
+    if _PERMANENT_PATTERNS.search(text): return PERMANENT
+    if _GIT_PATTERNS.search(text): return GIT
+    return UNKNOWN
+
+def retry_limit(failure_class, max_retries):
+    retryable, _, cap = RETRY_POLICIES[failure_class]
+    if not retryable: return 0
+    return max_retries if cap is None else min(cap, max_retries)
+
+def backoff_delay(failure_class, attempt, base_seconds, max_seconds):
+    """Exponential backoff with equal jitter: half the capped delay is fixed, the other half random."""
+    _, multiplier, _ = RETRY_POLICIES[failure_class]
+    delay = min(max_seconds, base_seconds * multiplier * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+class DelayQueue:
+    """Items that become ready at a given time. Only the scheduler thread touches it."""
+
+    def __init__(self):
+        self._heap = []
+        self._tiebreak = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, ready_at, item):
+        heapq.heappush(self._heap, (ready_at, next(self._tiebreak), item))
+
+    def pop_ready(self, now):
+        ready = []
+        while self._heap and self._heap[0][0] <= now: ready.append(heapq.heappop(self._heap)[2])
+        return ready
+
+    def seconds_until_next(self, now):
+        return max(0.0, self._heap[0][0] - now) if self._heap else None
@@ -0,0 +1,86 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+class SamplingProfiler:
+    """Low-overhead profiler that can be switched on during a run.
+
+    A background thread snapshots every thread's stack (sys._current_frames) each interval and counts
+    them in collapsed form ("outer;inner;leaf"), which flamegraph.pl / speedscope read directly.
+    Samples accumulate across start/stop until reset().
+    """
+
+    def __init__(self, interval=0.01, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._stacks = Counter()
+            self.samples = 0
+            self.started_at = None
+            self.sampled_seconds = 0.0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=None):
+        if self.running: return False
+        if interval: self.interval = interval
+        self._stop.clear()
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        if not self.running: return False
+        self._stop.set(); self._thread.join()
+        self.sampled_seconds += time.time() - self.started_at
+        return True
+
+    def _frame_label(self, frame):
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id: continue
+                labels = []
+                while frame is not None and len(labels) < self.max_depth:
+                    labels.append(self._frame_label(frame)); frame = frame.f_back
+                # Group by thread name without the pool index, so all workers of a pool fold together.
+                thread_name = names.get(thread_id, "thread").rsplit("_", 1)[0]
+                stacks.append(";".join([thread_name] + labels[::-1]))
+            with self._lock:
+                self._stacks.update(stacks); self.samples += 1
+
+    def folded(self):
+        """Collapsed stacks, one 'frame;frame;frame count' line each, most frequent first."""
+        with self._lock: return "\n".join(f"{stack} {count}" for stack, count in self._stacks.most_common()) + "\n"
+
+    def top(self, limit=30):
+        """[(function, self samples, total samples)] ordered by self samples."""
+        self_counts = Counter(); total_counts = Counter()
+        with self._lock: stacks = list(self._stacks.items())
+        for stack, count in stacks:
+            frames = stack.split(";")[1:]
+            if not frames: continue
+            self_counts[frames[-1]] += count
+            for frame in set(frames): total_counts[frame] += count
+        return [(frame, count, total_counts[frame]) for frame, count in self_counts.most_common(limit)]
+
+    def status(self):
+        with self._lock: samples = self.samples
+        return {"running": self.running, "interval_ms": round(self.interval * 1000, 1), "samples": samples}
@@ -36,10 +36,16 @@ document.addEventListener('DOMContentLoaded', () => {
     let animationIntervalId = null;
     let currentMigrationStatus = "idle";
     let cablesDrawn = false;
+    let lastLogSeq = null; // cursor for incremental /get-status?since=<seq> polling
+    let logEntriesCache = []; // newest first, capped like the server-side ring buffer
+    const maxLogEntries = 250;
     const cables = [];
 
     const startMigrationUrl = "/start-migration"; 
     const getStatusUrl = "/get-status";
+    const eventsUrl = "/events";
+    let eventSource = null; // live /events stream; polling is only used when it is unavailable
+    let streamedState = {};
 
     // --- Event Listeners ---
     if (startMigrationButton) {
@@ -47,6 +53,7 @@ document.addEventListener('DOMContentLoaded', () => {
     }
     if (clearLogButton) {
         clearLogButton.addEventListener('click', () => {
+            logEntriesCache = [];
             if (logOutputContainer) logOutputContainer.innerHTML = '<div class="text-gray-600 italic">[Terminal buffer cleared]</div>';
         });
     }
@@ -188,6 +195,7 @@ document.addEventListener('DOMContentLoaded', () => {
         if(errorMessageText) errorMessageText.textContent = "";
 
         currentMigrationStatus = 'initializing';
+        logEntriesCache = []; // the server clears its log buffer on start; sequence numbers keep increasing
         startAnimationLoop();
 
         fetch(startMigrationUrl, { method: 'POST' })
@@ -197,7 +205,7 @@ document.addEventListener('DOMContentLoaded', () => {
             })
             .then(data => {
                 if (data.status === 'success' || data.status === 'warning') { 
-                    if (!pollingInterval) {
+                    if (!eventSource && !pollingInterval) {
                         fetchAndUpdateStatus(); 
                         pollingInterval = setInterval(fetchAndUpdateStatus, pollingTime);
                     }
@@ -270,7 +278,7 @@ document.addEventListener('DOMContentLoaded', () => {
             const filesSyncedDisplay = document.getElementById('filesSyncedDisplay');
             const filesSyncedBar = document.getElementById('filesSyncedBar');
 
-            if (avgSpeedDisplay) avgSpeedDisplay.textContent = data.metrics.avg_speed_mb_s + " MB/s";
+            if (avgSpeedDisplay) avgSpeedDisplay.textContent = `${data.metrics.avg_speed_mb_s || 0} MB/s (now ${data.metrics.window_speed_mb_s || 0})`;
             
             let dataFlowingStr = data.metrics.data_flowing_bytes + " Bytes";
             if (data.metrics.data_flowing_bytes > 1024*1024*1024) dataFlowingStr = (data.metrics.data_flowing_bytes / (1024*1024*1024)).toFixed(2) + " GB";
@@ -300,6 +308,7 @@ document.addEventListener('DOMContentLoaded', () => {
         let overallProgress = 0;
         if (data.status === "migrating_users") overallProgress = Math.round(((data.stats.users.completed||0) / Math.max(1, data.stats.users.total||1)) * 10);
         else if (data.status === "migrating_groups") overallProgress = 10 + Math.round(((data.stats.groups.completed||0) / Math.max(1, data.stats.groups.total||1)) * 20);
+        else if (data.status === "migrating_projects" && data.stats.projects.total_bytes > 0) overallProgress = 30 + Math.round(Math.min(1, (data.stats.projects.completed_bytes||0) / data.stats.projects.total_bytes) * 70);
         else if (data.status === "migrating_projects") overallProgress = 30 + Math.round(((data.stats.projects.completed||0) / Math.max(1, data.stats.projects.total||1)) * 70);
         else if (data.status === "completed") overallProgress = 100;
         else if (["initializing", "running"].includes(data.status)) overallProgress = 2;
@@ -308,7 +317,17 @@ document.addEventListener('DOMContentLoaded', () => {
             overallProgressBar.style.width = `${overallProgress}%`;
             overallProgressPercent.textContent = `${overallProgress}% Complete`;
         }
-        if (estTime) estTime.textContent = overallProgress > 0 && overallProgress < 100 ? "Calculating..." : (overallProgress === 100 ? "Done" : "Pending");
+        const etaSeconds = data.status === "migrating_projects" ? data.stats.projects.eta_seconds : null;
+        if (estTime && etaSeconds != null) estTime.textContent = formatDuration(etaSeconds) + " left";
+        else if (estTime) estTime.textContent = overallProgress > 0 && overallProgress < 100 ? "Calculating..." : (overallProgress === 100 ? "Done" : "Pending");
+    }
+
+    function formatDuration(totalSeconds) {
+        const hours = Math.floor(totalSeconds / 3600);
+        const minutes = Math.floor((totalSeconds % 3600) / 60);
+        if (hours > 0) return `~${hours}h ${minutes}m`;
+        if (minutes > 0) return `~${minutes}m`;
+        return `~${totalSeconds}s`;
     }
 
     function updateLogUI(logEntries) {
@@ -331,17 +350,54 @@ document.addEventListener('DOMContentLoaded', () => {
         if (isScrolledToBottom) logOutputContainer.scrollTop = logOutputContainer.scrollHeight;
     }
     
+    // Shared by the event stream and the polling fallback. Returns true while a migration is running.
+    function applyStatus(data) {
+        const isRunning = ["running", "initializing", "planning", "migrating_users", "migrating_groups", "migrating_projects"].includes(data.status);
+
+        updateMainStatusDisplay(data);
+        // Entries are newest first; skip any we already have (a stream snapshot can overlap the last delta).
+        const newLogs = lastLogSeq === null ? data.logs : data.logs.filter(log => log.seq > lastLogSeq);
+        if (newLogs.length > 0) {
+            logEntriesCache = newLogs.concat(logEntriesCache).slice(0, maxLogEntries);
+            updateLogUI(logEntriesCache);
+        }
+        lastLogSeq = Math.max(lastLogSeq || 0, data.last_log_seq);
+
+        if (isRunning) startAnimationLoop();
+        else stopAnimationLoop();
+        return isRunning;
+    }
+
+    function connectEventStream() {
+        if (!window.EventSource) return false;
+        let receivedAny = false;
+        eventSource = new EventSource(eventsUrl);
+        eventSource.addEventListener('snapshot', e => {
+            receivedAny = true;
+            streamedState = JSON.parse(e.data);
+            applyStatus(streamedState);
+        });
+        eventSource.addEventListener('delta', e => {
+            const delta = JSON.parse(e.data);
+            Object.assign(streamedState, delta.state);
+            applyStatus(Object.assign({}, streamedState, { logs: delta.logs, last_log_seq: delta.last_log_seq }));
+        });
+        eventSource.onerror = () => {
+            // EventSource retries on its own (resuming from Last-Event-ID); give up only if it never worked or was closed.
+            if (receivedAny && eventSource.readyState !== EventSource.CLOSED) return;
+            eventSource.close();
+            eventSource = null;
+            console.warn('Status event stream unavailable, falling back to polling.');
+            fetchAndUpdateStatus();
+        };
+        return true;
+    }
+
     function fetchAndUpdateStatus() {
-        fetch(getStatusUrl)
+        fetch(lastLogSeq === null ? getStatusUrl : `${getStatusUrl}?since=${lastLogSeq}`)
             .then(r => r.json())
             .then(data => {
-                const isRunning = ["running", "initializing", "migrating_users", "migrating_groups", "migrating_projects"].includes(data.status);
-                
-                updateMainStatusDisplay(data);
-                updateLogUI(data.logs);
-
-                if (isRunning) {
-                    startAnimationLoop(); 
+                if (applyStatus(data)) {
                     if (!pollingInterval) {
                         pollingInterval = setInterval(fetchAndUpdateStatus, pollingTime);
                     }
@@ -363,6 +419,6 @@ document.addEventListener('DOMContentLoaded', () => {
     setTimeout(() => {
         if (window.lucide) window.lucide.createIcons();
         drawCables();
-        fetchAndUpdateStatus();
+        if (!connectEventStream()) fetchAndUpdateStatus();
     }, 100);
 });
\ No newline at end of file
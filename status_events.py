@@ -0,0 +1,90 @@
+import json
+import queue
+import threading
+import time
+
+class StatusEventBroadcaster:
+    """Fans coalesced migration-state deltas out to Server-Sent Events subscribers.
+
+    While anyone is subscribed, one publisher thread takes a state snapshot every `interval` seconds,
+    diffs it against the last published one and serializes the delta once; each client only drains its
+    own queue, so the cost per extra viewer is a queue put. New clients start from the last published
+    state, so every delta they receive applies cleanly on top of their snapshot. Clients that fall more
+    than `max_pending` frames behind are dropped and resync with a fresh snapshot when they reconnect.
+    """
+
+    def __init__(self, snapshot_fn, interval=0.5, heartbeat=15, max_pending=100):
+        self.snapshot_fn = snapshot_fn # snapshot_fn(since_seq) -> state dict with "logs" (newest first) and "last_log_seq"
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._thread = None
+        self._last_state = None
+        self._last_seq = None
+
+    @staticmethod
+    def _frame(event, payload, seq):
+        return f"id: {seq}\nevent: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+    def _take_snapshot(self, since_seq):
+        snapshot = self.snapshot_fn(since_seq)
+        logs = snapshot.pop("logs"); seq = snapshot.pop("last_log_seq"); snapshot.pop("logs_since", None)
+        return snapshot, logs, seq
+
+    def _publish_locked(self):
+        state, logs, seq = self._take_snapshot(self._last_seq)
+        changed = {key: value for key, value in state.items() if self._last_state.get(key) != value}
+        self._last_state = state; self._last_seq = seq
+        if not changed and not logs: return
+        frame = self._frame("delta", {"state": changed, "logs": logs, "last_log_seq": seq}, seq)
+        for q in list(self._subscribers):
+            try:
+                q.put_nowait(frame)
+            except queue.Full:
+                self._subscribers.discard(q)
+                with q.mutex: q.queue.clear()
+                q.put_nowait(None) # tells the stream to close; EventSource reconnects and resyncs
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None; self._last_state = None; self._last_seq = None
+                    return
+                self._publish_locked()
+
+    def _subscribe(self, last_event_id):
+        q = queue.Queue(maxsize=self.max_pending)
+        with self._lock:
+            if self._last_state is None:
+                self._last_state, _, self._last_seq = self._take_snapshot(None)
+            _, logs, _ = self._take_snapshot(last_event_id)
+            logs = [entry for entry in logs if entry["seq"] <= self._last_seq]
+            first_frame = self._frame("snapshot", dict(self._last_state, logs=logs, last_log_seq=self._last_seq), self._last_seq)
+            self._subscribers.add(q)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="status-events", daemon=True)
+                self._thread.start()
+        return q, first_frame
+
+    def stream(self, last_event_id=None):
+        """SSE frames for one client: a full snapshot (logs after last_event_id, if given), then deltas."""
+        q, first_frame = self._subscribe(last_event_id)
+        try:
+            yield first_frame
+            while True:
+                try:
+                    frame = q.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if frame is None: return
+                yield frame
+        finally:
+            with self._lock: self._subscribers.discard(q)
+
+    def subscriber_count(self):
+        with self._lock: return len(self._subscribers)
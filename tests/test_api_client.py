@@ -0,0 +1,124 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import api_client
+from api_client import AdaptiveRateLimiter, InstrumentedSession
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(api_client, "time", clock)
+    return clock
+
+def test_bucket_allows_a_burst_then_refills_at_the_rate(clock):
+    limiter = AdaptiveRateLimiter(10, burst=5)
+    assert [limiter.try_acquire() for _ in range(5)] == [0.0] * 5
+    assert limiter.try_acquire() == pytest.approx(0.1) # one token takes 1/rate seconds
+    clock.now += 0.25
+    assert [limiter.try_acquire() for _ in range(2)] == [0.0, 0.0]
+    assert limiter.try_acquire() > 0
+    clock.now += 10 # refill is capped at the burst size
+    assert sum(limiter.try_acquire() == 0.0 for _ in range(10)) == 5
+
+def test_acquire_paces_requests_to_the_rate(clock):
+    limiter = AdaptiveRateLimiter(4, burst=1)
+    started = clock.now
+    waited = sum(limiter.acquire() for _ in range(9))
+    assert clock.now - started == pytest.approx(2.0) and waited == pytest.approx(2.0) # 1 free token, then 8 at 4/s
+
+def test_rate_follows_ratelimit_remaining(clock):
+    limiter = AdaptiveRateLimiter(30)
+    # 50 requests left for the next 10 s: slow to 80% of 5 req/s.
+    limiter.observe(200, {"RateLimit-Remaining": "50", "RateLimit-Reset": str(clock.now + 10)})
+    assert limiter.rate == pytest.approx(4.0)
+    # Headers show room again: recover additively, not in one jump.
+    limiter.observe(200, {"RateLimit-Remaining": "10000", "RateLimit-Reset": str(clock.now + 10)})
+    assert limiter.rate == pytest.approx(4.5)
+    for _ in range(100): limiter.observe(200, {})
+    assert limiter.rate == 30
+    # Nothing left: the floor keeps requests trickling.
+    limiter.observe(200, {"RateLimit-Remaining": "0", "RateLimit-Reset": str(clock.now + 60)})
+    assert limiter.rate == limiter.min_rate
+
+def test_429_halves_the_rate_and_blocks_until_retry_after(clock):
+    limiter = AdaptiveRateLimiter(20)
+    limiter.observe(429, {"Retry-After": "3"})
+    assert limiter.rate == 10
+    assert limiter.try_acquire() == pytest.approx(3.0)
+    clock.now += 2.9
+    assert limiter.try_acquire() == pytest.approx(0.1)
+    clock.now += 0.1
+    assert limiter.try_acquire() == 0.0
+
+def test_429_without_retry_after_blocks_for_a_second(clock):
+    limiter = AdaptiveRateLimiter(20)
+    limiter.observe(429, {"Retry-After": "Wed, 21 Oct 2026 07:28:00 GMT"}) # HTTP-date: not parsed, default used
+    assert limiter.try_acquire() == pytest.approx(1.0)
+
+# --- InstrumentedSession against a local server ---
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    in_flight = 0; peak = 0; lock = threading.Lock(); responses = []
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock: cls.in_flight += 1; cls.peak = max(cls.peak, cls.in_flight)
+        time.sleep(0.05)
+        status, headers = cls.responses.pop(0) if cls.responses else (200, {})
+        body = b"{}"
+        self.send_response(status)
+        for key, value in {"Content-Length": str(len(body)), "Content-Type": "application/json", **headers}.items(): self.send_header(key, value)
+        self.end_headers(); self.wfile.write(body)
+        with cls.lock: cls.in_flight -= 1
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    _Handler.in_flight = 0; _Handler.peak = 0; _Handler.responses = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True); thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", _Handler
+    httpd.shutdown(); httpd.server_close()
+
+def test_session_pool_blocks_instead_of_exceeding_its_size(server):
+    url, handler = server
+    session = InstrumentedSession("old", 0, pool_size=2)
+    statuses = []
+    threads = [threading.Thread(target=lambda: statuses.append(session.get(url + "/api/v4/projects", timeout=10).status_code)) for _ in range(8)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert statuses == [200] * 8
+    assert handler.peak <= 2 # threads waited for a pooled connection
+    assert session.stats()["requests"] == 8
+
+def test_session_feeds_responses_to_the_limiter_and_counters(server):
+    url, handler = server
+    handler.responses = [(200, {"RateLimit-Remaining": "5", "RateLimit-Reset": str(int(time.time()) + 100)}), (429, {"Retry-After": "0.2"})]
+    session = InstrumentedSession("new", 50, pool_size=2)
+    session.get(url + "/api/v4/users")
+    assert session.limiter.rate == session.limiter.min_rate # 0.8 * 5 / ~100 s is below the floor
+    assert session.stats()["rate_limit_remaining"] == "5"
+    session.get(url + "/api/v4/users")
+    started_at = time.monotonic()
+    session.get(url + "/api/v4/users") # waits out Retry-After
+    assert time.monotonic() - started_at >= 0.15
+    stats = session.stats()
+    assert stats["requests"] == 3 and stats["rate_limited"] == 1 and stats["throttle_waits"] >= 1
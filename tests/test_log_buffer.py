@@ -0,0 +1,50 @@
+import threading
+
+from log_buffer import LogRingBuffer
+
+def _filled(capacity, count):
+    buffer = LogRingBuffer(capacity)
+    for index in range(count): buffer.append(f"t{index}", f"message {index + 1}", "info", float(index))
+    return buffer
+
+def _seqs(entries):
+    return [entry["seq"] for entry in entries]
+
+def test_since_returns_entries_after_the_cursor():
+    buffer = _filled(10, 5)
+    assert _seqs(buffer.since()) == [1, 2, 3, 4, 5]
+    assert _seqs(buffer.since(2)) == [3, 4, 5]
+    assert buffer.since(5) == []
+    assert buffer.last_seq() == 5
+
+def test_since_across_wraparound():
+    buffer = _filled(3, 7) # seqs 1-4 were dropped
+    assert _seqs(buffer.since()) == [5, 6, 7]
+    assert _seqs(buffer.since(2)) == [5, 6, 7] # cursor older than the buffer: everything retained
+    assert _seqs(buffer.since(5)) == [6, 7]
+    assert buffer.since(7) == []
+    assert buffer.since(100) == [] # cursor from a newer buffer (e.g. the server restarted)
+
+def test_cursor_stays_valid_across_clear():
+    buffer = _filled(5, 4)
+    cursor = buffer.last_seq()
+    buffer.clear()
+    assert buffer.since(cursor) == [] and buffer.last_seq() == 0
+    buffer.append("t", "after reset", "info", 0.0)
+    assert [(entry["seq"], entry["message"]) for entry in buffer.since(cursor)] == [(5, "after reset")]
+
+def test_clear_waits_for_an_append_in_progress():
+    buffer = _filled(5, 1)
+    buffer._append_lock.acquire() # an append holding its sequence number
+    clearing = threading.Thread(target=buffer.clear); clearing.start()
+    clearing.join(0.1)
+    assert clearing.is_alive()
+    buffer._append_lock.release(); clearing.join(1)
+    assert not clearing.is_alive() and buffer.since() == []
+
+def test_concurrent_appends_keep_sequence_order():
+    buffer = LogRingBuffer(10000)
+    threads = [threading.Thread(target=lambda: [buffer.append("t", "m", "info", 0.0) for _ in range(500)]) for _ in range(8)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert _seqs(buffer.since()) == list(range(1, 4001))
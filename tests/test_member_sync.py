@@ -0,0 +1,120 @@
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+import async_api
+import migration_logic as ml
+
+GUEST, REPORTER, DEVELOPER, MAINTAINER, OWNER = 10, 20, 30, 40, 50
+
+class FakeMemberList:
+    def __init__(self, members=(), error=None):
+        self.members = members
+        self.error = error
+
+    def list(self, **kwargs):
+        if self.error: raise self.error
+        return [SimpleNamespace(id=user_id, username=username, access_level=level) for user_id, username, level in self.members]
+
+class FakeOldGitLab:
+    """gl_old with one project; groups must not be consulted (the project's members_all already resolves them)."""
+
+    def __init__(self, project):
+        self.projects = SimpleNamespace(get=lambda project_id, lazy=False: project)
+        self.groups = SimpleNamespace(get=self._no_group_lookups)
+
+    def _no_group_lookups(self, *args, **kwargs):
+        raise AssertionError("project membership must come from the project's members_all")
+
+@pytest.fixture
+def synced(monkeypatch):
+    calls = []
+    monkeypatch.setattr(ml, "sync_members", lambda target, levels, kind, name: calls.append((kind, levels)))
+    monkeypatch.setattr(ml, "_log_and_update_state", lambda *args, **kwargs: None)
+    return calls
+
+def _migrate(monkeypatch, project):
+    monkeypatch.setattr(ml, "gl_old", FakeOldGitLab(project))
+    ml.migrate_project_members(7, "Project", SimpleNamespace(id=70))
+
+def test_project_members_match_members_all_for_shared_and_nested_groups(monkeypatch, synced):
+    # Project in top/sub/leaf, shared with group "ops" at Reporter; "qa" is shared onto the ancestor "top".
+    members_all = [
+        (1, "direct-dev", DEVELOPER),      # direct project member
+        (2, "top-owner", OWNER),           # inherited from the top-level ancestor
+        (3, "ops-capped", REPORTER),       # Maintainer in ops, capped by the project share
+        (4, "qa-via-ancestor", DEVELOPER), # member of a group shared onto an ancestor
+        (5, "both", MAINTAINER),           # Maintainer in sub, also in ops (capped to Reporter there)
+        (5, "both", REPORTER),
+    ]
+    project = SimpleNamespace(members_all=FakeMemberList(members_all), members=FakeMemberList([(1, "direct-dev", DEVELOPER)]))
+    # Stale group data that a re-derivation from ancestors and shares would pick up instead.
+    monkeypatch.setitem(ml.OLD_GROUP_MEMBERS_CACHE, 99, {3: ("ops-capped", MAINTAINER)})
+
+    _migrate(monkeypatch, project)
+
+    assert synced == [("project", {1: ("direct-dev", DEVELOPER), 2: ("top-owner", OWNER), 3: ("ops-capped", REPORTER),
+                                   4: ("qa-via-ancestor", DEVELOPER), 5: ("both", MAINTAINER)})]
+
+def test_project_members_fall_back_to_direct_members(monkeypatch, synced):
+    project = SimpleNamespace(members_all=FakeMemberList(error=RuntimeError("403 Forbidden")),
+                              members=FakeMemberList([(1, "direct-dev", DEVELOPER), (2, "guest", GUEST)]))
+
+    _migrate(monkeypatch, project)
+
+    assert synced == [("project", {1: ("direct-dev", DEVELOPER), 2: ("guest", GUEST)})]
+
+# --- sync_members: the python-gitlab, thread-pool and async paths apply and report the same diff ---
+class FakeTargetMembers:
+    def __init__(self, members, failing_user_ids):
+        self.members = dict(members); self.failing = failing_user_ids; self.writes = []
+
+    def list(self, **kwargs):
+        return [SimpleNamespace(id=user_id, access_level=level) for user_id, level in self.members.items()]
+
+    def write(self, op, user_id, level):
+        self.writes.append((op, user_id, level))
+        if user_id in self.failing: raise RuntimeError("409 Conflict")
+
+    def create(self, data):
+        self.write("add", data['user_id'], data['access_level'])
+
+    def update(self, user_id, data):
+        self.write("update", user_id, data['access_level'])
+
+class FakeAsyncTarget:
+    def __init__(self, members):
+        self.members = members; self.paths = []
+
+    async def request(self, method, path, json=None):
+        self.paths.append((method, path))
+        if method == "POST": self.members.write("add", json['user_id'], json['access_level'])
+        else: self.members.write("update", int(path.rsplit("/", 1)[1]), json['access_level'])
+
+@pytest.mark.parametrize("path", ["serial", "pool", "async"])
+def test_sync_members_paths_agree(monkeypatch, path):
+    messages = []
+    monkeypatch.setattr(ml, "_log_and_update_state", lambda message, log_type="info", **kwargs: messages.append((log_type, message)))
+    monkeypatch.setattr(ml, "OLD_TO_NEW_USER_ID_MAP", {1: 101, 2: 102, 3: 103, 4: 104})
+    members = FakeTargetMembers({101: DEVELOPER, 102: REPORTER}, failing_user_ids={104})
+    target = SimpleNamespace(id=70, members=members)
+    monkeypatch.setattr(ml, "async_new", None); monkeypatch.setattr(ml, "member_ops_executor", None)
+    if path == "pool": monkeypatch.setattr(ml, "member_ops_executor", ThreadPoolExecutor(2))
+    if path == "async":
+        engine = async_api.AsyncEngine(); async_target = FakeAsyncTarget(members)
+        monkeypatch.setattr(ml, "async_engine", engine); monkeypatch.setattr(ml, "async_new", async_target)
+
+    old_levels = {1: ("same", DEVELOPER), 2: ("promoted", MAINTAINER), 3: ("new", GUEST), 4: ("broken", OWNER), 5: ("unmapped", GUEST)}
+    ml.sync_members(target, old_levels, "project", "g/p")
+
+    assert sorted(members.writes) == [("add", 103, GUEST), ("add", 104, OWNER), ("update", 102, MAINTAINER)]
+    assert messages == [
+        ("warning", "  Failed to add project member broken (target user ID: 104) in 'g/p': 409 Conflict"),
+        ("warning", "  1 users not mapped to target, skipped for project 'g/p': unmapped"),
+        ("info", "  Members for project 'g/p': 2 added, 1 updated, 1 unchanged, 1 failed."),
+    ]
+    if path == "pool": ml.member_ops_executor.shutdown()
+    if path == "async":
+        assert sorted(async_target.paths) == [("POST", "/projects/70/members"), ("POST", "/projects/70/members"), ("PUT", "/projects/70/members/102")]
+        engine.close()
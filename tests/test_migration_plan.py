@@ -0,0 +1,130 @@
+from types import SimpleNamespace
+
+import pytest
+
+import migration_logic as ml
+import migration_plan
+
+class Obj:
+    """A listed API object: attributes as fields and in .attributes, like python-gitlab's RESTObject."""
+
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+        self.attributes = attrs
+
+class ReadOnlyManager:
+    """list()/get() over fixed objects; there is no create/update/delete, so any write fails the test."""
+
+    def __init__(self, objects=()):
+        self.objects = list(objects)
+        self.path = "/fake"
+
+    def list(self, **kwargs):
+        return iter(self.objects)
+
+    def get(self, object_id, **kwargs):
+        return next(o for o in self.objects if o.id == object_id)
+
+def _project(project_id, path_with_namespace, kind="group", repository_size=None, empty_repo=None):
+    namespace_path, _, path = path_with_namespace.rpartition("/")
+    stats = {"repository_size": repository_size, "lfs_objects_size": 24} if repository_size is not None else None
+    return Obj(id=project_id, name=path.title(), path=path, path_with_namespace=path_with_namespace, description="", visibility="private",
+               namespace={"kind": kind, "full_path": namespace_path}, statistics=stats, empty_repo=empty_repo)
+
+OLD = SimpleNamespace(
+    users=ReadOnlyManager([Obj(id=1, username="root", email="admin@old.example", name="Administrator"),
+                           Obj(id=2, username="alice", email="alice@old.example", name="Alice"),     # same username on target
+                           Obj(id=3, username="bob", email="bob@old.example", name="Bob"),           # email matches carol on target
+                           Obj(id=4, username="dave", email="dave@old.example", name="Dave"),        # username and email match different users
+                           Obj(id=5, username="erin", email="erin@old.example", name="Erin")]),     # new
+    groups=ReadOnlyManager([Obj(id=1, parent_id=None, name="Top", path="top", full_path="top", visibility="private", description=""),
+                            Obj(id=2, parent_id=1, name="Sub", path="sub", full_path="top/sub", visibility="private", description=""),
+                            Obj(id=3, parent_id=None, name="Ops", path="ops", full_path="ops", visibility="internal", description="")]),
+    projects=ReadOnlyManager([_project(10, "top/app", repository_size=1000),       # target has it with data
+                              _project(11, "top/sub/lib", repository_size=2000),   # target has it, empty
+                              _project(12, "top/data", repository_size=4000),      # new
+                              _project(13, "top/sub"),                             # clashes with the planned group top/sub; no statistics
+                              _project(14, "alice/notes", kind="user")]),          # user project: new, keeps its path
+)
+
+def _new_instance(root_group=None):
+    groups = [Obj(id=901, full_path=f"{root_group}/top" if root_group else "top")]
+    if root_group: groups.append(Obj(id=900, full_path=root_group))
+    app_path = f"{root_group}/top/app" if root_group else "top/app"; lib_path = f"{root_group}/top/sub/lib" if root_group else "top/sub/lib"
+    return SimpleNamespace(
+        users=ReadOnlyManager([Obj(id=20, username="alice", email="alice@new.example", name="Alice"),
+                               Obj(id=21, username="carol", email="bob@old.example", name="Carol"),
+                               Obj(id=22, username="dave", email="d@new.example", name="Dave T"),
+                               Obj(id=23, username="dora", email="dave@old.example", name="Dora"),
+                               Obj(id=24, username="ops", email="ops@new.example", name="Ops Bot")]),
+        groups=ReadOnlyManager(groups),
+        projects=ReadOnlyManager([Obj(id=30, path_with_namespace=app_path, empty_repo=False),
+                                  Obj(id=31, path_with_namespace=lib_path, empty_repo=True)]),
+    )
+
+@pytest.fixture
+def instances(monkeypatch):
+    def use(root_group=None):
+        new = _new_instance(root_group)
+        def initialize(): ml.gl_old = OLD; ml.gl_new = new
+        monkeypatch.setattr(ml, "initialize_gitlab_clients", initialize)
+        monkeypatch.setattr(ml, "TARGET_PARENT_GROUP_ID_ON_NEW_FOR_ALL", 900 if root_group else None)
+        monkeypatch.setattr(ml, "gl_old", None); monkeypatch.setattr(ml, "gl_new", None)
+    monkeypatch.setattr(ml, "API_MAX_REQUESTS_PER_SECOND", 10)
+    monkeypatch.setattr(ml, "PLAN_THROUGHPUT_MB_S", 1)
+    return use
+
+def _by(items, key):
+    return {item[key] if key != "stub" else item["stub"]["path_with_namespace"]: item for item in items}
+
+def test_plan_diff_against_target_listings(instances, tmp_path):
+    instances()
+    plan_path = str(tmp_path / "plan.json")
+    plan = ml.run_migration_plan(plan_path)
+
+    users = _by(plan["users"], "username")
+    assert {name: (u["action"], u["new_id"]) for name, u in users.items()} == {
+        "root": ("skip", None), "alice": ("map", 20), "bob": ("map", 21), "dave": ("conflict", 22), "erin": ("create", None)}
+    assert "email matches target user 23" in users["dave"]["note"]
+
+    groups = _by(plan["groups"], "full_path")
+    assert {path: (g["action"], g["new_id"], g["target_path"]) for path, g in groups.items()} == {
+        "top": ("map", 901, "top"), "top/sub": ("create", None, "top/sub"), "ops": ("conflict", None, "ops")}
+    assert groups["ops"]["note"] == "path is taken by a user namespace on the target"
+
+    projects = _by(plan["projects"], "stub")
+    assert {path: (p["action"], p["new_id"], p["size_bytes"]) for path, p in projects.items()} == {
+        "top/app": ("skip", 30, 1024), "top/sub/lib": ("push", 31, 2024), "top/data": ("create", None, 4024),
+        "top/sub": ("conflict", None, None), "alice/notes": ("create", None, None)}
+    assert projects["top/sub"]["note"] == "path is taken by a group on the target"
+
+    assert plan["summary"] == {"users": {"skip": 1, "map": 2, "conflict": 1, "create": 1}, "groups": {"map": 1, "create": 1, "conflict": 1},
+                               "projects": {"skip": 1, "push": 1, "create": 2, "conflict": 1}}
+    # Only pushes and creates transfer data; the sizeless create is reported, not guessed.
+    assert plan["estimates"]["transfer_bytes"] == 2024 + 4024 and plan["estimates"]["unsized_projects"] == 1
+    # Everything but skips costs API calls: 4 users, 3 groups, 4 projects.
+    assert plan["estimates"]["api_calls"] == 4 * 1 + 3 * 4 + 4 * 8
+
+    assert migration_plan.load_plan(plan_path, ml.OLD_GITLAB_URL, ml.NEW_GITLAB_URL)["summary"] == plan["summary"]
+    with ml.state_lock:
+        assert ml.current_migration_state["status"] == "planned"
+        assert ml.current_migration_state["plan"]["summary"] == plan["summary"]
+
+def test_plan_places_group_content_under_the_target_root(instances, tmp_path):
+    instances(root_group="migrated")
+    plan = ml.run_migration_plan(str(tmp_path / "plan.json"))
+
+    groups = _by(plan["groups"], "full_path")
+    assert {path: (g["action"], g["target_path"]) for path, g in groups.items()} == {
+        "top": ("map", "migrated/top"), "top/sub": ("create", "migrated/top/sub"), "ops": ("create", "migrated/ops")} # no user-namespace clash below a root
+    projects = _by(plan["projects"], "stub")
+    assert {path: (p["action"], p["target_path"]) for path, p in projects.items()} == {
+        "top/app": ("skip", "migrated/top/app"), "top/sub/lib": ("push", "migrated/top/sub/lib"), "top/data": ("create", "migrated/top/data"),
+        "top/sub": ("conflict", "migrated/top/sub"), "alice/notes": ("create", "alice/notes")}
+
+def test_plan_for_another_instance_pair_is_rejected(instances, tmp_path):
+    instances()
+    plan_path = str(tmp_path / "plan.json")
+    ml.run_migration_plan(plan_path)
+    with pytest.raises(ValueError, match="plan was made for"):
+        migration_plan.load_plan(plan_path, "https://other.example", ml.NEW_GITLAB_URL)
@@ -0,0 +1,66 @@
+import re
+
+import pytest
+
+from migration_scope import MigrationScope
+
+def test_group_subtrees_are_normalised_and_nested_ones_dropped():
+    scope = MigrationScope(groups=["/team-a/", "team-a/backend", "Team-A/Backend/api", "team-b", " ", "team-ab"])
+    assert scope.groups == ["team-a", "team-ab", "team-b"] # team-ab is a sibling, not inside team-a
+    assert scope.in_groups("team-a/backend/svc") and scope.in_groups("TEAM-B/x")
+    assert not scope.in_groups("team-a") and not scope.in_groups("team-abc/x")
+
+def test_from_dict_accepts_lists_and_comma_or_newline_strings():
+    scope = MigrationScope.from_dict({"groups": "team-a, team-b\nteam-c", "patterns": ["team-d/api", " team-d/api "],
+                                      "regexes": "^ops/.*-infra$", "project_ids": "12, 7,\n7"})
+    assert scope.groups == ["team-a", "team-b", "team-c"]
+    assert scope.patterns == ["team-d/api"]
+    assert scope.regexes == ["^ops/.*-infra$"]
+    assert scope.project_ids == [7, 12]
+    assert scope.describe() == "3 group subtrees, 1 path patterns, 1 regexes, 2 project IDs"
+
+def test_empty_scope_means_the_whole_instance():
+    for scope in (MigrationScope(), MigrationScope.from_dict(None), MigrationScope.from_dict({"groups": " , ", "project_ids": ""})):
+        assert not scope and scope.describe() == "whole instance"
+
+def test_from_csv_maps_known_columns_and_ignores_others():
+    text = "Group_Full_Path,path_with_namespace,project_id,owner\nteam-a,,,ann\n,team-b/api,42,bob\n,team-c/*,,\n"
+    scope = MigrationScope.from_csv(text)
+    assert scope.to_dict() == {"groups": ["team-a"], "patterns": ["team-b/api", "team-c/*"], "regexes": [], "project_ids": [42]}
+
+def test_from_csv_without_a_known_column_is_rejected():
+    with pytest.raises(ValueError, match="needs a header"):
+        MigrationScope.from_csv("name,owner\napi,ann\n")
+
+def test_invalid_regex_is_rejected():
+    with pytest.raises(re.error):
+        MigrationScope(regexes=["team-(a"])
+
+def test_exact_paths_and_globs_are_told_apart():
+    scope = MigrationScope(patterns=["team-a/api", "team-b/*-svc", "*legacy*"])
+    assert scope.exact_paths() == ["team-a/api"]
+    assert scope.has_unanchored() and scope.matches_unanchored("x/old-legacy-app")
+    assert not scope.matches_unanchored("team-b/billing-svc") # anchored globs are matched by their pushed-down listing
+
+def test_pushdown_lists_literal_prefixes_of_globs_once():
+    scope = MigrationScope(groups=["team-a"], patterns=["team-a/backend/*", "team-b/*/api-*", "team-c/svc-?", "*/api"])
+    listed = dict(scope.pushdown_groups())
+    assert list(listed) == ["team-a", "team-b", "team-c"] # team-a/backend/* is inside the team-a subtree; */api has no prefix
+    assert listed["team-a"] is None
+    assert listed["team-b"].match("team-b/x/api-gw") and listed["team-b"].match("TEAM-B/x/API-1")
+    assert not listed["team-b"].match("team-b/x/web")
+    assert listed["team-c"].match("team-c/svc-1") and not listed["team-c"].match("team-c/svc-10")
+
+def test_search_term_narrows_only_a_single_unanchored_glob():
+    assert MigrationScope(patterns=["*payments-api*"]).search_term() == "payments-api"
+    assert MigrationScope(patterns=["*/ab*"]).search_term() is None # no literal long enough to search for
+    assert MigrationScope(patterns=["*alpha*", "*beta*"]).search_term() is None
+    assert MigrationScope(patterns=["*alpha*"], regexes=["beta"]).search_term() is None
+    assert MigrationScope(patterns=["team-a/*"]).search_term() is None # anchored: listed per group instead
+
+def test_fingerprint_ignores_order_and_duplicates():
+    first = MigrationScope(groups=["b", "a"], project_ids=[2, 1, 1])
+    second = MigrationScope.from_dict({"groups": "a,b", "project_ids": "1,2"})
+    assert first.fingerprint == second.fingerprint
+    assert first.fingerprint != MigrationScope(groups=["a"]).fingerprint
+    assert first.merged(MigrationScope(groups=["a/sub", "c"])).groups == ["a", "b", "c"]
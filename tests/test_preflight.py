@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+
+import pytest
+
+import migration_logic as ml
+
+class Listing(list):
+    def __init__(self, items, total):
+        super().__init__(items); self.total = total
+
+class CountingManager:
+    """Listing endpoint that records every list() call; X-Total is only sent up to x_total_limit items."""
+
+    def __init__(self, count, x_total_limit=10_000):
+        self.count = count; self.x_total_limit = x_total_limit; self.calls = []
+        self.path = "/fake"
+
+    def list(self, **kwargs):
+        self.calls.append(kwargs)
+        total = self.count if self.count <= self.x_total_limit else None
+        if kwargs.get("per_page") == 1: return Listing([SimpleNamespace(id=1)][:self.count], total)
+        return Listing([SimpleNamespace(id=item_id) for item_id in range(self.count)], total)
+
+class NoGroups:
+    def list(self, **kwargs):
+        raise AssertionError("the groups phase counts groups from its own listing")
+
+@pytest.fixture
+def old_instance(monkeypatch):
+    def use(users, projects):
+        old = SimpleNamespace(users=users, projects=projects, groups=NoGroups())
+        monkeypatch.setattr(ml, "gl_old", old)
+        monkeypatch.setattr(ml, "_log_and_update_state", lambda *args, **kwargs: None)
+        monkeypatch.setattr(ml, "listed_sections", set())
+        with ml.state_lock:
+            for section in ("users", "projects"): ml.current_migration_state["stats"][section] = {"total": 0, "completed": 0, "current_item_name": ""}
+        counts = {"users": None, "projects": None, "finished": False, "error": None, "cancelled": False}
+        return old, counts
+    return use
+
+def test_counts_come_from_x_total_with_one_request_each(old_instance):
+    old, counts = old_instance(CountingManager(40), CountingManager(9_000))
+    ml._run_preflight_counts(counts)
+    assert (counts["users"], counts["projects"], counts["finished"], counts["error"]) == (40, 9_000, True, None)
+    assert old.users.calls == [{"per_page": 1, "iterator": True}]
+    assert old.projects.calls == [{"per_page": 1, "iterator": True, "simple": True}]
+    with ml.state_lock:
+        assert ml.current_migration_state["stats"]["projects"]["total"] == 9_000
+        assert ml.current_migration_state["metrics"]["preflight"]["projects"] == 9_000
+
+def test_large_instances_walk_the_simple_listing(old_instance):
+    old, counts = old_instance(CountingManager(12_000, x_total_limit=10_000), CountingManager(15_000, x_total_limit=10_000))
+    ml._run_preflight_counts(counts)
+    assert (counts["users"], counts["projects"]) == (12_000, 15_000)
+    walk = old.projects.calls[1]
+    assert walk["simple"] is True and walk["pagination"] == "keyset" and "statistics" not in walk # no full pages with statistics
+    assert all("statistics" not in call for call in old.users.calls)
+
+def test_sections_the_phase_already_listed_are_skipped(old_instance):
+    old, counts = old_instance(CountingManager(40), CountingManager(50))
+    ml.listed_sections.add("users")
+    with ml.state_lock: ml.current_migration_state["stats"]["users"]["total"] = 38 # exact, from the users phase
+    ml._run_preflight_counts(counts)
+    assert old.users.calls == [] and counts["projects"] == 50
+    with ml.state_lock: assert ml.current_migration_state["stats"]["users"]["total"] == 38
+
+def test_cancelled_count_stops_walking(old_instance):
+    class CancellingManager(CountingManager):
+        def list(self, **kwargs):
+            listing = super().list(**kwargs)
+            if kwargs.get("pagination") == "keyset": counts["cancelled"] = True # a new run started mid-walk
+            return listing
+    old, counts = old_instance(CancellingManager(20_000), CountingManager(10))
+    ml._run_preflight_counts(counts)
+    assert counts["users"] is None and counts["projects"] is None and old.projects.calls == []
@@ -0,0 +1,70 @@
+import os
+import threading
+import time
+
+import pytest
+
+from report_writer import ReportCache
+
+def _writer(calls, content=b"report", started=None, release=None):
+    def build(path):
+        calls.append(path)
+        if started: started.set()
+        if release: release.wait(5)
+        with open(path, "wb") as handle: handle.write(content)
+    return build
+
+def _age(path, seconds):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+def test_report_is_built_once_per_generation(tmp_path):
+    cache = ReportCache(str(tmp_path)); calls = []
+    first = cache.get("run", 1, "pdf", _writer(calls))
+    assert cache.get("run", 1, "pdf", _writer(calls)) == first and len(calls) == 1
+    assert open(first, "rb").read() == b"report"
+    assert calls[0] != first and not os.path.exists(calls[0]) # built under a temp name, then moved into place
+    assert cache.get("run", 2, "pdf", _writer(calls)) != first and len(calls) == 2
+
+def test_build_runs_outside_the_lock_and_concurrent_requests_share_it(tmp_path):
+    cache = ReportCache(str(tmp_path)); calls = []; started = threading.Event(); release = threading.Event()
+    results = []
+    builder = threading.Thread(target=lambda: results.append(cache.get("run", 1, "xlsx", _writer(calls, started=started, release=release))))
+    builder.start(); assert started.wait(5)
+    # While the xlsx renders, other reports are still served...
+    assert open(cache.get("run", 1, "pdf", _writer(calls, b"pdf")), "rb").read() == b"pdf"
+    # ...and a second request for the same xlsx waits for that build instead of starting another.
+    waiter = threading.Thread(target=lambda: results.append(cache.get("run", 1, "xlsx", _writer(calls))))
+    waiter.start(); time.sleep(0.05)
+    assert waiter.is_alive()
+    release.set(); builder.join(5); waiter.join(5)
+    assert len(results) == 2 and results[0] == results[1]
+    assert len(calls) == 2 # one xlsx build, one pdf build
+
+def test_superseded_generations_are_kept_through_the_grace_period(tmp_path):
+    cache = ReportCache(str(tmp_path), grace_seconds=60); calls = []
+    old = cache.get("run", 1, "pdf", _writer(calls))
+    other_format = cache.get("run", 1, "xlsx", _writer(calls))
+    newer = cache.get("run", 2, "pdf", _writer(calls))
+    assert os.path.exists(old) # may still be streaming to whoever was handed it
+    _age(old, 120); _age(other_format, 120)
+    cache.get("run", 3, "pdf", _writer(calls))
+    assert not os.path.exists(old) and os.path.exists(newer) # newer was handed out moments ago
+    assert os.path.exists(other_format) # only the same format is superseded
+
+def test_serving_a_cached_file_restarts_its_grace_period(tmp_path):
+    cache = ReportCache(str(tmp_path), grace_seconds=60); calls = []
+    old = cache.get("run", 1, "pdf", _writer(calls))
+    _age(old, 120)
+    assert cache.get("run", 1, "pdf", _writer(calls)) == old # a late download of generation 1
+    cache.get("run", 2, "pdf", _writer(calls))
+    assert os.path.exists(old)
+
+def test_failed_build_leaves_nothing_behind_and_is_retried(tmp_path):
+    cache = ReportCache(str(tmp_path)); calls = []
+    def broken(path):
+        open(path, "wb").close(); raise RuntimeError("renderer crashed")
+    with pytest.raises(RuntimeError):
+        cache.get("run", 1, "pdf", broken)
+    assert os.listdir(tmp_path) == []
+    assert open(cache.get("run", 1, "pdf", _writer(calls)), "rb").read() == b"report"
@@ -0,0 +1,109 @@
+from types import SimpleNamespace
+
+import gitlab
+import pytest
+import requests
+
+import migration_logic as ml
+import retry_policy
+from retry_policy import DISK, GIT, NETWORK, PERMANENT, RATE_LIMITED, SERVER_ERROR, UNKNOWN, classify_failure
+
+@pytest.mark.parametrize("detail, expected", [
+    # git over HTTPS
+    ("fatal: unable to access 'https://gitlab.example.com/g/p.git/': Could not resolve host: gitlab.example.com", NETWORK),
+    ("fatal: unable to access 'https://gitlab.example.com/g/p.git/': Failed to connect to gitlab.example.com port 443 after 129 ms: Connection refused", NETWORK),
+    ("error: RPC failed; curl 92 HTTP/2 stream 5 was not closed cleanly: CANCEL (err 8)\nfatal: early EOF\nfatal: index-pack failed", NETWORK),
+    ("error: RPC failed; HTTP 502 curl 22 The requested URL returned error: 502\nfatal: the remote end hung up unexpectedly", SERVER_ERROR),
+    ("fatal: unable to access 'https://gitlab.example.com/g/p.git/': The requested URL returned error: 429", RATE_LIMITED),
+    ("remote: HTTP Basic: Access denied.\nfatal: Authentication failed for 'https://gitlab.example.com/g/p.git/'", PERMANENT),
+    ("remote: You are not allowed to push code to this project.\nfatal: unable to access 'https://gitlab.example.com/g/p.git/': The requested URL returned error: 403", PERMANENT),
+    ("fatal: repository 'https://gitlab.example.com/g/p.git/' not found", PERMANENT),
+    ("remote: The project you were looking for could not be found or you don't have permission to view it.\nfatal: repository 'https://gitlab.example.com/g/p.git/' not found", PERMANENT),
+    ("remote: GitLab: You are not allowed to force push code to a protected branch on this project.\n ! [remote rejected] main -> main (pre-receive hook declined)", PERMANENT),
+    ("remote: fatal: pack exceeds maximum allowed size\nerror: remote unpack failed: index-pack abnormal exit", GIT),
+    ("error: object file objects/ab/cdef is empty\nfatal: loose object abcdef is corrupt", GIT),
+    ("fatal: remote error: upload-pack: not our ref 1f2e3d4c5b6a", GIT),
+    ("error: Could not fetch origin\nfatal: couldn't find remote ref refs/heads/gone-branch", GIT),
+    ("git-lfs: command not found", GIT),
+    ("fatal: write error: No space left on device\nfatal: index-pack failed", DISK),
+    # python-gitlab / REST errors as the migration reports them
+    ("404: 404 Project Not Found", PERMANENT),
+    ("Error finding existing project: 404: 404 Namespace Not Found", PERMANENT),
+    ("400: {'path': ['has already been taken']}", PERMANENT), # a 4xx create error the migration didn't recover from
+    ("Error finding existing project: 502: 502 Bad Gateway", SERVER_ERROR),
+    ("Error finding existing project: HTTPSConnectionPool(host='gitlab.example.com', port=443): Read timed out. (read timeout=60)", NETWORK),
+    ("Path 'p' has already been taken on target", UNKNOWN), # recoverable: the lookup decides
+    ("Path 'p' has already been taken, but the project was not found on target after 3 lookups", PERMANENT),
+    ("Existing project 'p' not found on target after 3 lookups", PERMANENT),
+    # workspace and distributed transfers
+    ("Not enough free disk space: repository needs about 512.0 MB on a scratch volume (keeping 1024.0 MB free on each) and no cached mirror can be evicted", DISK),
+    ("Repository needs about 90000.0 MB and does not fit on any scratch volume", PERMANENT),
+    ("No transfer worker is running (local workers exited and no remote worker checked in)", PERMANENT),
+    ("Worker lease expired 3 times (worker lost or stalled)", UNKNOWN),
+    ("", UNKNOWN),
+])
+def test_classify_failure_detail(detail, expected):
+    assert classify_failure(detail) == expected
+
+@pytest.mark.parametrize("exc, expected", [
+    (gitlab.exceptions.GitlabHttpError("Too Many Requests", response_code=429), RATE_LIMITED),
+    (gitlab.exceptions.GitlabGetError("503 Service Unavailable", response_code=503), SERVER_ERROR),
+    (gitlab.exceptions.GitlabGetError("404 Project Not Found", response_code=404), PERMANENT),
+    (gitlab.exceptions.GitlabCreateError({"path": ["has already been taken"]}, response_code=400), PERMANENT),
+    (gitlab.exceptions.GitlabHttpError("Request Timeout", response_code=408), UNKNOWN), # 408 is left to the text
+    (requests.exceptions.ConnectionError("Connection aborted."), NETWORK),
+    (TimeoutError("timed out"), NETWORK),
+])
+def test_classify_failure_exception(exc, expected):
+    assert classify_failure(exc=exc) == expected
+
+def test_only_retryable_classes_get_retries():
+    assert retry_policy.retry_limit(PERMANENT, 6) == 0
+    assert retry_policy.retry_limit(GIT, 6) == 2
+    assert retry_policy.retry_limit(NETWORK, 6) == 6
+
+# --- "has already been taken" is final only once the lookup has given up ---
+class TakenTarget:
+    """gl_new whose project creation always reports the path as taken."""
+
+    def __init__(self):
+        def create(payload): raise gitlab.exceptions.GitlabCreateError("{'path': ['has already been taken']}", response_code=400)
+        self.projects = SimpleNamespace(create=create)
+
+@pytest.fixture
+def taken_target(monkeypatch):
+    monkeypatch.setattr(ml, "gl_new", TakenTarget())
+    monkeypatch.setattr(ml, "CREATED_PROJECT_PATHS_IN_NEW_NAMESPACE", {})
+    monkeypatch.setattr(ml, "_log_and_update_state", lambda *args, **kwargs: None)
+    monkeypatch.setattr(ml.time, "sleep", lambda seconds: None)
+
+def _lookups(monkeypatch, *outcomes):
+    """Makes _find_existing_project_on_new return (or raise) outcomes in turn; returns the list of calls."""
+    calls = []; outcomes = list(outcomes)
+    def find(path, namespace_id):
+        calls.append(path); outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception): raise outcome
+        return outcome
+    monkeypatch.setattr(ml, "_find_existing_project_on_new", find)
+    return calls
+
+def _create(namespace_id=5):
+    return ml._create_or_find_project_on_new("P", "p", "", "private", namespace_id)
+
+def test_taken_project_found_after_a_failed_lookup(monkeypatch, taken_target):
+    existing = SimpleNamespace(id=42, name="P", path="p")
+    calls = _lookups(monkeypatch, gitlab.exceptions.GitlabListError("502 Bad Gateway", response_code=502), None, existing)
+    assert _create() == (existing, None)
+    assert len(calls) == 3
+
+def test_taken_project_that_never_shows_up_is_permanent(monkeypatch, taken_target):
+    calls = _lookups(monkeypatch, None, None, None)
+    new_project, detail = _create()
+    assert new_project is None and len(calls) == ml.FIND_EXISTING_PROJECT_ATTEMPTS
+    assert classify_failure(detail) == PERMANENT
+
+def test_taken_project_whose_lookups_keep_failing_is_retried(monkeypatch, taken_target):
+    _lookups(monkeypatch, *[gitlab.exceptions.GitlabListError("502 Bad Gateway", response_code=502)] * ml.FIND_EXISTING_PROJECT_ATTEMPTS)
+    new_project, detail = _create()
+    assert new_project is None
+    assert classify_failure(detail) == SERVER_ERROR
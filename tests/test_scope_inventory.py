@@ -0,0 +1,118 @@
+from types import SimpleNamespace
+
+import gitlab
+import pytest
+
+import migration_logic as ml
+from migration_scope import MigrationScope
+
+# Old instance: group tree, one personal project, direct members per group/project (user ID -> username).
+GROUPS = {1: "top", 2: "top/mid", 3: "top/mid/leaf", 4: "top/other", 5: "other", 6: "other/deep", 7: "top/unused"}
+GROUP_MEMBERS = {1: {10: "u-top"}, 2: {11: "u-mid"}, 3: {12: "u-leaf"}, 4: {13: "u-other"}, 5: {14: "u-shared"}, 6: {15: "u-deep"}, 7: {18: "u-unused"}}
+USERS = {7: "alice"}
+PROJECTS = [ # (id, path_with_namespace, namespace kind, direct members, shared_with_groups)
+    (100, "top/mid/api", "group", {16: "u-api"}, []),
+    (101, "top/mid/leaf/api-v2", "group", {}, [{"group_id": 5, "group_full_path": "other", "group_access_level": 20}]),
+    (102, "top/other/web", "group", {19: "u-web"}, []),
+    (103, "other/deep/x", "group", {17: "u-x"}, []),
+    (104, "alice/notes", "user", {}, []),
+    (105, "top/other/api-gw", "group", {}, []),
+]
+
+def _member_list(members):
+    return SimpleNamespace(list=lambda **kwargs: [SimpleNamespace(id=uid, username=name, access_level=30) for uid, name in members.items()])
+
+def _inherited(group_id):
+    path = GROUPS[group_id]; members = {}
+    for other_id, other_path in GROUPS.items():
+        if path == other_path or path.startswith(other_path + "/"): members.update(GROUP_MEMBERS[other_id])
+    return members
+
+class FakeOldGitLab:
+    def __init__(self):
+        self.client = gitlab.Gitlab("http://old.example") # only to build Project stubs; never called
+        self.projects = SimpleNamespace(gitlab=self.client, parent_attrs={}, path="/projects", get=self._get_project, list=self._list_projects)
+        self.groups = SimpleNamespace(get=self._get_group)
+        self.users = SimpleNamespace(list=lambda username=None, **kwargs: [SimpleNamespace(id=uid, username=name) for uid, name in USERS.items() if name == username],
+                                     get=lambda user_id, lazy=False: SimpleNamespace(projects=SimpleNamespace(list=lambda **kwargs: self._stubs(lambda p: p[2] == "user" and p[1].startswith(USERS[user_id] + "/")))))
+        self.searches = []
+
+    def _stub(self, project):
+        project_id, path, kind, _, shared = project
+        namespace_path = path.rsplit("/", 1)[0]
+        return SimpleNamespace(id=project_id, path_with_namespace=path, attributes={
+            "id": project_id, "path_with_namespace": path, "shared_with_groups": shared,
+            "namespace": {"kind": kind, "full_path": namespace_path, "path": namespace_path.rsplit("/", 1)[-1]}})
+
+    def _stubs(self, keep):
+        return [self._stub(p) for p in PROJECTS if keep(p)]
+
+    def _get_project(self, key, lazy=False, **kwargs):
+        found = [p for p in PROJECTS if key in (p[0], p[1])]
+        if not found: raise gitlab.exceptions.GitlabGetError("404 Project Not Found", response_code=404)
+        stub = self._stub(found[0])
+        stub.members = _member_list(found[0][3])
+        return stub
+
+    def _list_projects(self, search=None, **kwargs):
+        self.searches.append(search)
+        return self._stubs(lambda p: search is None or search in p[1])
+
+    def _get_group(self, key, lazy=False, **kwargs):
+        group_id = next((gid for gid, path in GROUPS.items() if key in (gid, path)), None)
+        if group_id is None:
+            if lazy: # listing through a missing group fails like the API does
+                def fail(**kwargs): raise gitlab.exceptions.GitlabListError("404 Group Not Found", response_code=404)
+                return SimpleNamespace(projects=SimpleNamespace(list=fail))
+            raise gitlab.exceptions.GitlabGetError("404 Group Not Found", response_code=404)
+        path = GROUPS[group_id]
+        return SimpleNamespace(
+            id=group_id, full_path=path,
+            descendant_groups=SimpleNamespace(list=lambda **kwargs: [SimpleNamespace(id=gid, full_path=p) for gid, p in GROUPS.items() if p.startswith(path + "/")]),
+            projects=SimpleNamespace(list=lambda include_subgroups=False, **kwargs: self._stubs(lambda p: p[2] == "group" and p[1].startswith(path + "/"))),
+            members_all=_member_list(_inherited(group_id)), members=_member_list(GROUP_MEMBERS[group_id]))
+
+@pytest.fixture
+def old_instance(monkeypatch):
+    fake = FakeOldGitLab()
+    monkeypatch.setattr(ml, "gl_old", fake)
+    monkeypatch.setattr(ml, "OLD_GROUP_MEMBERS_CACHE", {})
+    warnings = []
+    monkeypatch.setattr(ml, "_log_and_update_state", lambda message, log_type="info", **kwargs: warnings.append(message) if log_type == "warning" else None)
+    fake.warnings = warnings
+    return fake
+
+def _paths(inventory):
+    return sorted(stub.attributes["path_with_namespace"] for stub in inventory["projects"]), sorted(group.full_path for group in inventory["groups"].values())
+
+def test_nested_group_subtree_pulls_in_ancestors_but_not_siblings(old_instance):
+    inventory = ml.collect_scope_inventory(MigrationScope(groups=["top/mid"]))
+    projects, groups = _paths(inventory)
+    assert projects == ["top/mid/api", "top/mid/leaf/api-v2"]
+    assert groups == ["top", "top/mid", "top/mid/leaf"] # the ancestor is created first; top/other and top/unused stay out
+    # Members of in-scope groups (inherited included), of the projects, and of the group api-v2 is shared with.
+    assert inventory["users"] == {10: "u-top", 11: "u-mid", 12: "u-leaf", 16: "u-api", 14: "u-shared"}
+    assert old_instance.searches == [] # nothing was listed instance-wide
+
+def test_ids_exact_paths_and_anchored_globs_combine(old_instance):
+    scope = MigrationScope(groups=["top/mid"], project_ids=[103], patterns=["alice/notes", "top/*/api-*"])
+    inventory = ml.collect_scope_inventory(scope)
+    projects, groups = _paths(inventory)
+    # top/*/api-* is listed under "top" and filtered; * also crosses subgroup levels (fnmatch).
+    assert projects == ["alice/notes", "other/deep/x", "top/mid/api", "top/mid/leaf/api-v2", "top/other/api-gw"]
+    assert groups == ["other", "other/deep", "top", "top/mid", "top/mid/leaf", "top/other"]
+    assert 7 in inventory["users"] and 17 in inventory["users"] and 15 in inventory["users"] # owner of alice/notes, project and group members
+    assert 18 not in inventory["users"] and 19 not in inventory["users"] # top/unused and top/other/web are out of scope
+    assert len(inventory["projects"]) == len({stub.id for stub in inventory["projects"]}) # each project once
+
+def test_unanchored_glob_uses_a_search_narrowed_listing(old_instance):
+    inventory = ml.collect_scope_inventory(MigrationScope(patterns=["*api-gw*"]))
+    assert _paths(inventory) == (["top/other/api-gw"], ["top", "top/other"])
+    assert old_instance.searches == ["api-gw"]
+
+def test_user_namespace_as_group_and_missing_entries(old_instance):
+    inventory = ml.collect_scope_inventory(MigrationScope(groups=["alice", "nope"], project_ids=[999]))
+    assert _paths(inventory) == (["alice/notes"], [])
+    assert inventory["users"] == {7: "alice"}
+    assert any("project '999' not found" in w for w in old_instance.warnings)
+    assert any("'nope'" in w for w in old_instance.warnings)
@@ -0,0 +1,60 @@
+import json
+import time
+
+import pytest
+
+import migration_logic as ml
+from status_events import StatusEventBroadcaster
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline: return False
+        time.sleep(0.01)
+    return True
+
+def _payload(frame):
+    return json.loads(next(line for line in frame.splitlines() if line.startswith("data: "))[len("data: "):])
+
+@pytest.fixture
+def broadcaster():
+    return StatusEventBroadcaster(ml.get_status_snapshot, interval=0.01, heartbeat=30, max_pending=3)
+
+def test_slow_subscriber_is_dropped_without_blocking_logging(broadcaster):
+    slow = broadcaster.stream(); next(slow) # takes its snapshot, then never reads again
+    fast = broadcaster.stream(); next(fast)
+    assert broadcaster.subscriber_count() == 2
+
+    received = []
+    for index in range(20):
+        started_at = time.monotonic()
+        ml._log_and_update_state(f"sse test line {index}")
+        assert time.monotonic() - started_at < 0.5 # logging never waits on subscribers
+        received.extend(entry["message"] for entry in _payload(next(fast))["logs"])
+    # The fast client keeps up; the slow one overflowed its queue and was dropped.
+    while "sse test line 19" not in received: received.extend(entry["message"] for entry in _payload(next(fast))["logs"])
+    assert _wait_for(lambda: broadcaster.subscriber_count() == 1)
+    assert [line for line in received if line.startswith("sse test line")] == [f"sse test line {index}" for index in range(20)]
+    with pytest.raises(StopIteration): next(slow) # its stream ends, so EventSource reconnects and resyncs
+    fast.close()
+    assert broadcaster.subscriber_count() == 0
+
+def test_idle_stream_sends_keepalives():
+    broadcaster = StatusEventBroadcaster(lambda since_seq: {"status": "idle", "logs": [], "last_log_seq": 0}, interval=0.01, heartbeat=0.05)
+    stream = broadcaster.stream()
+    assert _payload(next(stream)) == {"status": "idle", "logs": [], "last_log_seq": 0}
+    assert next(stream) == ": keepalive\n\n"
+    stream.close()
+
+def test_events_route_starts_with_a_snapshot():
+    import app as web_app
+    ml._log_and_update_state("sse route line")
+    response = web_app.app.test_client().get("/events", buffered=False)
+    try:
+        assert response.mimetype == "text/event-stream"
+        first = next(response.response)
+        first = first.decode() if isinstance(first, bytes) else first
+        assert first.startswith("id: ") and "event: snapshot" in first
+        assert "sse route line" in [entry["message"] for entry in _payload(first)["logs"]]
+    finally:
+        response.close()
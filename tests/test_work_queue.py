@@ -0,0 +1,128 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import app as web_app
+import migration_logic as ml
+import migration_worker
+import work_queue
+from work_queue import JOB_DONE, JOB_LEASED, JOB_QUEUED, LeaseQueue
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(work_queue, "time", clock)
+    return clock
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    job_queue = LeaseQueue(str(tmp_path / "queue.sqlite3"), lease_seconds=60, max_leases=2)
+    yield job_queue
+    job_queue.close()
+
+def _enqueue(job_queue, *project_ids, clock=None):
+    for project_id in project_ids:
+        job_queue.enqueue(project_id, {"project_id": project_id, "path_with_namespace": f"g/p{project_id}"})
+        if clock: clock.now += 0.001 # distinct enqueued_at, so claim order is defined
+
+def test_claim_leases_jobs_in_enqueue_order(queue, clock):
+    _enqueue(queue, 3, 1, 2, clock=clock)
+    assert [job["project_id"] for job in queue.claim("w1", limit=2, slots=4)] == [3, 1]
+    assert [job["project_id"] for job in queue.claim("w2", limit=5)] == [2]
+    assert queue.claim("w2") == []
+    job = queue.get(3)
+    assert (job["state"], job["worker_id"], job["leases"], job["lease_expires_at"]) == (JOB_LEASED, "w1", 1, pytest.approx(clock.now + 60))
+    assert queue.stats()["slots"] == 4 and queue.live_workers() == 2
+
+def test_heartbeat_extends_only_the_leases_the_worker_holds(queue, clock):
+    _enqueue(queue, 1, 2)
+    queue.claim("w1", limit=1); queue.claim("w2", limit=1)
+    clock.now += 50
+    assert queue.heartbeat("w1", {"1": {"clone": 10}, "2": {"clone": 99}}) == [1] # project 2 is w2's
+    assert queue.get(1)["lease_expires_at"] == 1110.0 and queue.get(1)["progress"] == {"clone": 10}
+    assert queue.get(2)["lease_expires_at"] == 1060.0 and queue.get(2)["progress"] == {}
+    clock.now += 20 # past w2's lease, within w1's extended one
+    assert [job["project_id"] for job in queue.claim("w3", limit=5)] == [2]
+
+def test_expired_lease_is_reclaimed_and_the_stale_worker_result_discarded(queue, clock):
+    _enqueue(queue, 1)
+    queue.claim("stale", limit=1)
+    assert queue.claim("fresh", limit=1) == [] # still leased
+    clock.now += 61
+    assert [job["project_id"] for job in queue.claim("fresh", limit=1)] == [1]
+    assert queue.get(1)["leases"] == 2 and queue.get(1)["progress"] == {} # the new worker reports from zero
+    assert queue.heartbeat("stale", {1: {"clone": 5}}) == [] # tells the stale worker it lost the job
+    assert not queue.complete("stale", 1, {"ok": True, "detail": None})
+    assert queue.get(1)["state"] == JOB_LEASED
+    assert queue.complete("fresh", 1, {"ok": True, "detail": None, "progress": {"clone": 7}})
+    job = queue.get(1)
+    assert (job["state"], job["result"]["ok"], job["progress"]) == (JOB_DONE, True, {"clone": 7})
+    assert not queue.complete("fresh", 1, {"ok": False}) # completing twice is refused too
+    assert {w["worker_id"]: w["completed"] for w in queue.stats()["workers"]} == {"fresh": 1, "stale": 0}
+
+def test_job_whose_lease_expired_max_leases_times_fails(queue, clock):
+    _enqueue(queue, 1, 2, clock=clock)
+    for attempt in range(2):
+        assert 1 in [job["project_id"] for job in queue.claim(f"w{attempt}", limit=1)]
+        clock.now += 61
+    assert [job["project_id"] for job in queue.claim("w9", limit=1)] == [2] # 1 is failed, not leased a third time
+    job = queue.get(1)
+    assert job["state"] == JOB_DONE and job["result"] == {"ok": False, "detail": "Worker lease expired 2 times (worker lost or stalled)"}
+
+def test_coordinator_fail_does_not_override_a_finished_job(queue):
+    _enqueue(queue, 1, 2)
+    queue.claim("w1", limit=2)
+    assert queue.complete("w1", 1, {"ok": True})
+    assert not queue.fail(1, "gave up")
+    assert queue.fail(2, "gave up") and queue.get(2)["result"] == {"ok": False, "detail": "gave up"}
+    assert not queue.complete("w1", 2, {"ok": True})
+
+def test_claims_from_several_connections_never_share_a_job(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    coordinator = LeaseQueue(path); _enqueue(coordinator, *range(40))
+    workers = [LeaseQueue(path) for _ in range(4)]; claimed = []
+    def drain(job_queue, name):
+        while True:
+            jobs = job_queue.claim(name, limit=3)
+            if not jobs: return
+            claimed.extend(job["project_id"] for job in jobs)
+    threads = [threading.Thread(target=drain, args=(job_queue, f"w{index}")) for index, job_queue in enumerate(workers)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert sorted(claimed) == list(range(40))
+    assert coordinator.stats()["jobs"] == {JOB_LEASED: 40} and JOB_QUEUED not in coordinator.stats()["jobs"]
+    for job_queue in [coordinator] + workers: job_queue.close()
+
+def test_worker_uses_its_own_slots_without_touching_the_coordinator(monkeypatch):
+    seen = {}
+    def transfer(*args):
+        seen["slots"] = args[-2:]
+        return True, None
+    monkeypatch.setattr(ml, "_transfer_repository_py", transfer)
+    monkeypatch.setattr(ml, "_log_and_update_state", lambda *args, **kwargs: None)
+    git_slots, git_push_slots = ml.git_slots, ml.git_push_slots
+    worker = migration_worker.TransferWorker(SimpleNamespace(lease_seconds=60), "w1", 3)
+    result = worker.run_job({"payload": {"project_id": 1, "name": "P", "path_with_namespace": "g/p", "new_path_with_namespace": "g/p", "new_empty_repo": True}})
+    assert result["ok"]
+    assert seen["slots"] == (worker._clone_slots, worker._push_slots) and worker._clone_slots._initial_value == 3
+    assert (ml.git_slots, ml.git_push_slots) == (git_slots, git_push_slots)
+
+def test_worker_routes_require_a_worker_id(monkeypatch, queue):
+    monkeypatch.setattr(ml, "WORKER_TOKEN", "secret")
+    monkeypatch.setattr(ml, "transfer_queue", queue)
+    client = web_app.app.test_client(); auth = {"Authorization": "Bearer secret"}
+    for route, body in (("claim", {}), ("heartbeat", {"progress": {"1": {}}}), ("complete", {"project_id": 1, "result": {"ok": True}})):
+        response = client.post(f"/worker/{route}", json=body, headers=auth)
+        assert response.status_code == 400 and response.get_json()["message"] == "worker_id is required."
+    assert client.post("/worker/heartbeat", json={"worker_id": "w1"}, headers={"Authorization": "Bearer wrong"}).status_code == 401
+    _enqueue(queue, 1)
+    assert [job["project_id"] for job in client.post("/worker/claim", json={"worker_id": "w1"}, headers=auth).get_json()["jobs"]] == [1]
+    assert client.post("/worker/heartbeat", json={"worker_id": "w1", "progress": {"1": {"clone": 1}}}, headers=auth).get_json() == {"held": [1]}
@@ -0,0 +1,133 @@
+import fcntl
+import multiprocessing
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import workspace_manager
+from workspace_manager import ADMISSION_LOCK_NAME, EVICTING_DIR_NAME, LEASE_DIR_NAME, ScratchVolume, WorkspaceFull, WorkspaceManager
+
+CAPACITY = 1000 # bytes per fake volume
+
+@pytest.fixture(autouse=True)
+def small_disks(monkeypatch):
+    """Each volume is a CAPACITY-byte disk whose free space is CAPACITY minus its mirrors (moved aside or not), so
+    mirrors take space and eviction frees it deterministically."""
+    def disk_usage(path):
+        used = sum(workspace_manager._tree_size_bytes(os.path.join(path, name)) for name in os.listdir(path) if name != LEASE_DIR_NAME)
+        return SimpleNamespace(total=CAPACITY, used=used, free=CAPACITY - used)
+    monkeypatch.setattr(workspace_manager.shutil, "disk_usage", disk_usage)
+    monkeypatch.setattr(workspace_manager, "ADMISSION_POLL_SECONDS", 0.05)
+
+def _manager(tmp_path, reserve=100, names=("scratch",), **kwargs):
+    volumes = [ScratchVolume(str(tmp_path / name)) for name in names]
+    manager = WorkspaceManager(volumes, reserve, overhead_percent=0, log=lambda message: None, **kwargs)
+    manager.prepare()
+    return manager
+
+def _mirror(volume, project_id, size, age):
+    path = volume.mirror_path(project_id); os.makedirs(path)
+    with open(os.path.join(path, "pack"), "wb") as f: f.write(b"x" * size)
+    past = time.time() - age; os.utime(path, (past, past))
+    return path
+
+def test_admission_reserves_space_until_settled(tmp_path):
+    manager = _manager(tmp_path)
+    first = manager.acquire(1, 500)
+    assert manager.usage()["volumes"][0]["reserved_bytes"] == 500
+    with pytest.raises(WorkspaceFull, match="does not fit on any scratch volume"):
+        manager.acquire(2, CAPACITY) # larger than the disk less the reserve: can never fit
+    waiter = threading.Thread(target=lambda: manager.acquire(3, 450).release()); waiter.start()
+    time.sleep(0.2)
+    assert waiter.is_alive() and manager.waiting == 1 # 1000 - 100 reserve - 500 reserved < 450
+    first.settle() # the clone wrote nothing, so settling frees the whole reservation
+    waiter.join(5)
+    assert not waiter.is_alive() and manager.waiting == 0
+    first.release()
+
+def test_refused_when_nothing_is_in_flight_or_evictable(tmp_path):
+    manager = _manager(tmp_path, evict=False)
+    _mirror(manager.volumes[0], 5, 600, age=100)
+    with pytest.raises(WorkspaceFull, match="Not enough free disk space"):
+        manager.acquire(1, 400)
+
+def test_capped_volume_takes_small_repositories(tmp_path):
+    manager = _manager(tmp_path, names=("tmpfs", "disk"))
+    manager.volumes[0].max_repo_bytes = 200
+    small = manager.acquire(1, 150); large = manager.acquire(2, 300)
+    assert (small.volume.path, large.volume.path) == (manager.volumes[0].path, manager.volumes[1].path)
+    small.release(); large.release()
+
+def test_eviction_takes_least_recently_used_idle_mirrors(tmp_path):
+    manager = _manager(tmp_path)
+    volume = manager.volumes[0]
+    _mirror(volume, 1, 200, age=400) # least recently used
+    _mirror(volume, 2, 200, age=300) # borrowed from by 3
+    child = _mirror(volume, 3, 50, age=10)
+    os.makedirs(os.path.join(child, "objects", "info"))
+    with open(os.path.join(child, "objects", "info", "alternates"), "w") as f: f.write(os.path.join(volume.mirror_path(2), "objects") + "\n")
+    os.utime(child, (time.time() - 10, time.time() - 10))
+    _mirror(volume, 4, 200, age=200) # in use below
+    _mirror(volume, 5, 200, age=100)
+    held = manager.acquire(4, 200) # already has its 200 bytes: reserves nothing more
+    # 1000 - 850 mirrors - 100 reserve = 50 free (less the alternates file); 350 needed: evict 1, skip 2 (borrowed)
+    # and 4 (leased), evict 5, keep 3.
+    lease = manager.acquire(6, 350)
+    assert sorted(volume.mirror_ids()) == [2, 3, 4] and os.listdir(os.path.join(volume.path, EVICTING_DIR_NAME)) == []
+    assert (manager.evicted, manager.evicted_bytes) == (2, 400)
+    lease.release(); held.release()
+
+def test_eviction_deletes_outside_the_admission_lock(tmp_path, monkeypatch):
+    manager = _manager(tmp_path)
+    volume = manager.volumes[0]
+    _mirror(volume, 1, 600, age=100)
+    observed = {}
+    real_rmtree = workspace_manager.shutil.rmtree
+    def rmtree(path, **kwargs):
+        with open(os.path.join(volume.lease_dir, ADMISSION_LOCK_NAME), "a") as lock_file: # another open file: contends like another process
+            try: fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB); observed["flock_free"] = True
+            except BlockingIOError: observed["flock_free"] = False
+        probe = threading.Thread(target=lambda: observed.update(condition_free=manager._condition.acquire(blocking=False)) or
+                                 (observed["condition_free"] and manager._condition.release()))
+        probe.start(); probe.join()
+        observed["lease_written"] = os.path.exists(os.path.join(volume.lease_dir, "2.json"))
+        observed["mirror_gone"] = 1 not in volume.mirror_ids()
+        real_rmtree(path, **kwargs)
+    monkeypatch.setattr(workspace_manager.shutil, "rmtree", rmtree)
+    manager.acquire(2, 500).release()
+    assert observed == {"flock_free": True, "condition_free": True, "lease_written": True, "mirror_gone": True}
+    assert not os.path.exists(volume.mirror_path(1))
+
+def test_cleanup_removes_evictions_a_dead_process_left_behind(tmp_path):
+    manager = _manager(tmp_path)
+    evicting_dir = os.path.join(manager.volumes[0].path, EVICTING_DIR_NAME); os.makedirs(os.path.join(evicting_dir, f"7.{2 ** 22 + 1}.0"))
+    os.makedirs(os.path.join(evicting_dir, f"8.{os.getpid()}.0")) # this process is still deleting it
+    manager.cleanup_orphans()
+    assert os.listdir(evicting_dir) == [f"8.{os.getpid()}.0"]
+
+# --- Two processes admitting against the same volume ---
+def _contend(root, project_id, barrier, events):
+    manager = WorkspaceManager([ScratchVolume(root)], 100, overhead_percent=0, evict=False, log=lambda message: None)
+    pick = manager._pick_volume
+    def slow_pick(*args): # widen the window between the headroom check and the lease write
+        volume = pick(*args); time.sleep(0.05); return volume
+    manager._pick_volume = slow_pick
+    barrier.wait()
+    with manager.acquire(project_id, 300):
+        events.put(("in", time.monotonic())); time.sleep(0.3); events.put(("out", time.monotonic()))
+
+def test_processes_sharing_a_volume_never_overcommit_it(tmp_path):
+    context = multiprocessing.get_context("fork") # children inherit the fake disks
+    manager = _manager(tmp_path)
+    barrier = context.Barrier(6); events = context.Queue()
+    processes = [context.Process(target=_contend, args=(manager.volumes[0].path, 100 + index, barrier, events)) for index in range(6)]
+    for process in processes: process.start()
+    for process in processes: process.join(30)
+    assert [process.exitcode for process in processes] == [0] * 6
+    in_flight = peak = 0
+    for _, kind in sorted((moment, kind) for kind, moment in (events.get(timeout=5) for _ in range(12))):
+        in_flight += 1 if kind == "in" else -1; peak = max(peak, in_flight)
+    assert peak == 3 # (1000 - 100 reserve) // 300
@@ -0,0 +1,151 @@
+import re
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+# Upper bounds (seconds) shared by every histogram: API calls land in the low buckets, git transfers in the high ones.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900, 1800, 3600)
+
+API_REQUEST_METRIC = "gitlab_migration_api_request_seconds"
+GIT_COMMAND_METRIC = "gitlab_migration_git_command_seconds"
+ITEM_METRIC = "gitlab_migration_item_seconds"
+PROJECT_STAGE_METRIC = "gitlab_migration_project_stage_seconds"
+METRIC_HELP = {
+    API_REQUEST_METRIC: "GitLab API request latency by instance and endpoint.",
+    GIT_COMMAND_METRIC: "Duration of git subprocesses by operation.",
+    ITEM_METRIC: "Wall time to migrate one user, group or project (per attempt).",
+    PROJECT_STAGE_METRIC: "Time projects spend in each stage, including waits for API/git slots.",
+}
+# Per-project stages in the order reports show them.
+PROJECT_STAGES = ("api_wait", "api", "disk_wait", "clone_wait", "fetch", "lfs_fetch", "push_wait", "push", "lfs_push", "total")
+
+_ID_SEGMENT = re.compile(r"/(?:\d+|[^/]*%2F[^/]*)(?=/|$)", re.IGNORECASE)
+
+def api_endpoint_label(method, url):
+    """'GET /projects/:id/members' for 'https://host/api/v4/projects/42/members?page=2' (IDs and encoded paths collapsed)."""
+    path = urlsplit(url).path
+    path = path.split("/api/v4", 1)[1] if "/api/v4" in path else path
+    return f"{method.upper()} {_ID_SEGMENT.sub('/:id', path) or '/'}"
+
+def git_operation_label(cmd):
+    """'push' for ['git', '--git-dir', d, 'push', ...]; 'lfs fetch' for git-lfs subcommands."""
+    args = list(cmd[1:]); index = 0
+    while index < len(args) and args[index].startswith("-"):
+        index += 2 if args[index] in ("--git-dir", "-C", "-c") else 1
+    if index >= len(args): return "unknown"
+    return f"lfs {args[index + 1]}" if args[index] == "lfs" and index + 1 < len(args) else args[index]
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value; self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound: self.counts[index] += 1; break
+
+def _escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(labels):
+    """(name, value) pairs -> Prometheus label text, with backslashes, quotes and newlines in the values escaped."""
+    return ",".join(f'{key}="{_escape_label_value(value)}"' for key, value in labels)
+
+class TimingRegistry:
+    """Thread-safe latency histograms (Prometheus style) plus per-project stage totals.
+
+    A worker binds the project it is working on with bind_project(); stage() then adds to that project's
+    breakdown as well as to the stage histogram. Helper threads started for a project use wrap_project().
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {} # (metric, ((label, value), ...)) -> Histogram
+            self._projects = {} # project key -> {stage: seconds}
+
+    def observe(self, metric, seconds, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None: histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timed(self, metric, **labels):
+        started_at = time.monotonic()
+        try: yield
+        finally: self.observe(metric, time.monotonic() - started_at, **labels)
+
+    def current_project(self):
+        return getattr(self._local, "project", None)
+
+    @contextmanager
+    def bind_project(self, key):
+        previous = self.current_project(); self._local.project = key
+        try: yield
+        finally: self._local.project = previous
+
+    def wrap_project(self, fn):
+        """fn bound to the calling thread's current project, for use as a Thread target."""
+        key = self.current_project()
+        def bound(*args, **kwargs):
+            with self.bind_project(key): return fn(*args, **kwargs)
+        return bound
+
+    @contextmanager
+    def stage(self, name):
+        started_at = time.monotonic()
+        try: yield
+        finally:
+            elapsed = time.monotonic() - started_at
+            self.observe(PROJECT_STAGE_METRIC, elapsed, stage=name)
+            key = self.current_project()
+            if key is not None:
+                with self._lock:
+                    stages = self._projects.setdefault(key, {})
+                    stages[name] = stages.get(name, 0.0) + elapsed
+
+    def project_timings(self, key):
+        """{stage: seconds} for a project, summed over its attempts."""
+        with self._lock: return {stage: round(seconds, 2) for stage, seconds in self._projects.get(key, {}).items()}
+
+    def pop_project_timings(self, key):
+        """project_timings() and forget them, for long-lived processes (transfer workers) that report per job."""
+        with self._lock: return {stage: round(seconds, 2) for stage, seconds in self._projects.pop(key, {}).items()}
+
+    def add_stages(self, stages):
+        """Merges stage seconds measured elsewhere (a transfer worker) into the histograms and the current project."""
+        key = self.current_project()
+        for name, seconds in stages.items():
+            self.observe(PROJECT_STAGE_METRIC, seconds, stage=name)
+            if key is not None:
+                with self._lock:
+                    project_stages = self._projects.setdefault(key, {})
+                    project_stages[name] = project_stages.get(name, 0.0) + seconds
+
+    def render_prometheus(self):
+        with self._lock:
+            histograms = sorted(((metric, labels, (list(h.counts), h.sum, h.count)) for (metric, labels), h in self._histograms.items()), key=lambda item: item[:2])
+        lines = []; last_metric = None
+        for metric, labels, (counts, total, count) in histograms:
+            if metric != last_metric:
+                lines += [f"# HELP {metric} {METRIC_HELP.get(metric, metric)}", f"# TYPE {metric} histogram"]; last_metric = metric
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{metric}_bucket{{{format_labels(labels + (("le", bound),))}}} {cumulative}')
+            lines.append(f'{metric}_bucket{{{format_labels(labels + (("le", "+Inf"),))}}} {count}')
+            label_text = f"{{{format_labels(labels)}}}" if labels else ""
+            lines.append(f"{metric}_sum{label_text} {round(total, 6)}")
+            lines.append(f"{metric}_count{label_text} {count}")
+        return "\n".join(lines) + ("\n" if lines else "")
@@ -0,0 +1,88 @@
+import re
+import threading
+import time
+from collections import deque
+
+TRANSFER_KINDS = ("pack_download", "pack_upload", "lfs_download", "lfs_upload")
+# Progress phases printed by git / git-lfs on stderr, and which counter their byte totals feed.
+PROGRESS_PHASE_KINDS = {
+    "Receiving objects": "pack_download",
+    "Writing objects": "pack_upload",
+    "Downloading LFS objects": "lfs_download",
+    "Uploading LFS objects": "lfs_upload",
+}
+_SIZE_UNITS = {"bytes": 1, "B": 1, "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3, "TiB": 1024 ** 4,
+               "KB": 1000, "MB": 1000 ** 2, "GB": 1000 ** 3, "TB": 1000 ** 4}
+_PROGRESS_RE = re.compile(r'^(%s):.*?,\s*([\d.]+)\s*(%s)\b' % ("|".join(PROGRESS_PHASE_KINDS), "|".join(_SIZE_UNITS)))
+
+def parse_progress_bytes(line):
+    """(phase, cumulative_bytes) for a git / git-lfs progress line that carries a size, else None.
+    e.g. 'Writing objects:  45% (9/20), 1.20 MiB | 2.00 MiB/s' -> ('Writing objects', 1258291)."""
+    match = _PROGRESS_RE.match(line.strip())
+    if not match: return None
+    return match.group(1), int(float(match.group(2)) * _SIZE_UNITS[match.group(3)])
+
+def _mb_per_s(byte_count, seconds):
+    return round(byte_count / (1024 * 1024) / seconds, 2) if seconds > 0 else 0.0
+
+class TransferMeter:
+    """Thread-safe byte counters for repository transfers.
+
+    Keeps lifetime totals per kind (see TRANSFER_KINDS), one-second buckets for a sliding-window rate, and
+    counters for the projects currently transferring. finish_project() returns that project's summary.
+    """
+
+    def __init__(self, window_seconds=30):
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._started_at = time.time()
+            self._totals = dict.fromkeys(TRANSFER_KINDS, 0)
+            self._buckets = deque() # [int second, bytes]
+            self._active = {}
+
+    def start_project(self, key):
+        with self._lock: self._active[key] = {"started_at": time.time(), **dict.fromkeys(TRANSFER_KINDS, 0)}
+
+    def add(self, key, kind, byte_count):
+        if byte_count <= 0: return
+        now = int(time.time())
+        with self._lock:
+            self._totals[kind] += byte_count
+            if key in self._active: self._active[key][kind] += byte_count
+            if self._buckets and self._buckets[-1][0] == now: self._buckets[-1][1] += byte_count
+            else: self._buckets.append([now, byte_count])
+            self._prune(now)
+
+    def project_bytes(self, key, kind):
+        with self._lock: return self._active.get(key, {}).get(kind, 0)
+
+    def finish_project(self, key):
+        with self._lock: counters = self._active.pop(key, None)
+        if counters is None: return None
+        seconds = time.time() - counters.pop("started_at")
+        total = sum(counters.values())
+        return {**counters, "total_bytes": total, "seconds": round(seconds, 1), "mb_s": _mb_per_s(total, seconds)}
+
+    def _prune(self, now):
+        while self._buckets and self._buckets[0][0] <= now - self.window_seconds: self._buckets.popleft()
+
+    def snapshot(self):
+        """Aggregate figures merged into the status metrics."""
+        now = time.time()
+        with self._lock:
+            self._prune(int(now))
+            elapsed = now - self._started_at
+            window_bytes = sum(count for _, count in self._buckets)
+            total = sum(self._totals.values())
+            active = {key: {"bytes": sum(counters[kind] for kind in TRANSFER_KINDS),
+                            "mb_s": _mb_per_s(sum(counters[kind] for kind in TRANSFER_KINDS), now - counters["started_at"])}
+                      for key, counters in self._active.items()}
+            return {"data_flowing_bytes": total,
+                    "avg_speed_mb_s": _mb_per_s(total, elapsed),
+                    "window_speed_mb_s": _mb_per_s(window_bytes, min(self.window_seconds, max(elapsed, 1))),
+                    "transfer_bytes": dict(self._totals),
+                    "active_transfers": active}
@@ -0,0 +1,169 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+JOB_QUEUED = "queued"
+JOB_LEASED = "leased"
+JOB_DONE = "done"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    project_id INTEGER PRIMARY KEY, payload TEXT NOT NULL, state TEXT NOT NULL,
+    worker_id TEXT, lease_expires_at REAL, leases INTEGER NOT NULL DEFAULT 0,
+    progress TEXT, result TEXT, enqueued_at REAL, updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_state ON jobs (state, enqueued_at);
+CREATE TABLE IF NOT EXISTS workers (worker_id TEXT PRIMARY KEY, slots INTEGER, last_seen REAL, completed INTEGER NOT NULL DEFAULT 0);
+"""
+
+class LeaseQueue:
+    """Repository transfer jobs shared by the coordinator and any number of worker processes through one SQLite file.
+
+    The coordinator enqueues one job per project and waits for its result; workers claim() jobs under a lease,
+    extend it with heartbeat() (which also publishes byte progress) and complete() them. A job whose lease runs out
+    (worker killed, host lost) is handed to the next claimer, at most max_leases times.
+    """
+
+    def __init__(self, db_path, lease_seconds=60, max_leases=3):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_leases = max_leases
+        self._lock = threading.Lock()
+        # Autocommit mode: claims open their own BEGIN IMMEDIATE so two processes can't lease the same job.
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock: self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock: self._conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try: yield self._conn
+            except BaseException: self._conn.execute("ROLLBACK"); raise
+            else: self._conn.execute("COMMIT")
+
+    def reset(self):
+        """Drops all jobs and workers; called by the coordinator when a run starts."""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM jobs"); conn.execute("DELETE FROM workers")
+
+    # --- Coordinator side ---
+    def enqueue(self, project_id, payload):
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO jobs (project_id, payload, state, leases, enqueued_at, updated_at) VALUES (?, ?, ?, 0, ?, ?)",
+                         (project_id, json.dumps(payload), JOB_QUEUED, now, now))
+
+    def get(self, project_id):
+        """{state, worker_id, progress, result, leases, lease_expires_at} of a job, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT state, worker_id, progress, result, leases, lease_expires_at FROM jobs WHERE project_id = ?", (project_id,)).fetchone()
+        if row is None: return None
+        return {"state": row[0], "worker_id": row[1], "progress": json.loads(row[2]) if row[2] else {}, "result": json.loads(row[3]) if row[3] else None,
+                "leases": row[4], "lease_expires_at": row[5]}
+
+    def fail(self, project_id, detail):
+        """Completes a job that isn't done yet with a failure, for a coordinator that gave up waiting on it
+        (no live worker, lease expired for the last time). False if a worker finished it meanwhile."""
+        now = time.time()
+        with self._transaction() as conn:
+            return bool(conn.execute("UPDATE jobs SET state = ?, result = ?, updated_at = ? WHERE project_id = ? AND state != ?",
+                                     (JOB_DONE, json.dumps({"ok": False, "detail": detail}), now, project_id, JOB_DONE)).rowcount)
+
+    def live_workers(self, window=None):
+        """Number of workers that claimed or heartbeat within window seconds (default: one lease)."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM workers WHERE last_seen >= ?", (time.time() - (window or self.lease_seconds),)).fetchone()[0]
+
+    def remove(self, project_id):
+        with self._transaction() as conn: conn.execute("DELETE FROM jobs WHERE project_id = ?", (project_id,))
+
+    def stats(self, active_window=None):
+        """Job counts by state and the workers seen within active_window seconds (default: three leases)."""
+        cutoff = time.time() - (active_window or 3 * self.lease_seconds)
+        with self._lock:
+            jobs = dict(self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+            workers = self._conn.execute("SELECT worker_id, slots, completed FROM workers WHERE last_seen >= ? ORDER BY worker_id", (cutoff,)).fetchall()
+        return {"jobs": jobs, "workers": [{"worker_id": w, "slots": slots, "completed": completed} for w, slots, completed in workers],
+                "slots": sum(slots or 0 for _, slots, _ in workers)}
+
+    # --- Worker side ---
+    def _touch_worker(self, conn, worker_id, slots=None, completed=0):
+        conn.execute("INSERT INTO workers (worker_id, slots, last_seen, completed) VALUES (?, ?, ?, ?) ON CONFLICT(worker_id) DO UPDATE SET "
+                     "slots = COALESCE(excluded.slots, slots), last_seen = excluded.last_seen, completed = completed + excluded.completed",
+                     (worker_id, slots, time.time(), completed))
+
+    def claim(self, worker_id, limit=1, slots=None):
+        """Leases up to limit jobs to worker_id: [{project_id, payload}]. Jobs whose lease expired max_leases
+        times are completed with a failure instead, so the coordinator's retry policy takes over."""
+        now = time.time(); claimed = []
+        with self._transaction() as conn:
+            self._touch_worker(conn, worker_id, slots)
+            rows = conn.execute("SELECT project_id, payload, leases FROM jobs WHERE state = ? OR (state = ? AND lease_expires_at < ?) ORDER BY enqueued_at LIMIT ?",
+                                (JOB_QUEUED, JOB_LEASED, now, limit + self.max_leases)).fetchall()
+            for project_id, payload, leases in rows:
+                if leases >= self.max_leases:
+                    result = {"ok": False, "detail": f"Worker lease expired {leases} times (worker lost or stalled)"}
+                    conn.execute("UPDATE jobs SET state = ?, result = ?, updated_at = ? WHERE project_id = ?", (JOB_DONE, json.dumps(result), now, project_id))
+                    continue
+                if len(claimed) == limit: break
+                conn.execute("UPDATE jobs SET state = ?, worker_id = ?, lease_expires_at = ?, leases = leases + 1, progress = NULL, updated_at = ? WHERE project_id = ?",
+                             (JOB_LEASED, worker_id, now + self.lease_seconds, now, project_id))
+                claimed.append({"project_id": project_id, "payload": json.loads(payload)})
+        return claimed
+
+    def heartbeat(self, worker_id, progress):
+        """Extends the leases of worker_id's jobs in progress ({project_id: {kind: bytes so far}}).
+        Returns the project IDs the worker still holds; anything missing was re-leased elsewhere."""
+        now = time.time(); held = []
+        with self._transaction() as conn:
+            self._touch_worker(conn, worker_id)
+            for project_id, counters in progress.items():
+                updated = conn.execute("UPDATE jobs SET lease_expires_at = ?, progress = ?, updated_at = ? WHERE project_id = ? AND worker_id = ? AND state = ?",
+                                       (now + self.lease_seconds, json.dumps(counters), now, int(project_id), worker_id, JOB_LEASED)).rowcount
+                if updated: held.append(int(project_id))
+        return held
+
+    def complete(self, worker_id, project_id, result):
+        """Stores the result ({ok, detail, progress, stages}). False if the lease was lost and the result discarded."""
+        now = time.time()
+        with self._transaction() as conn:
+            updated = conn.execute("UPDATE jobs SET state = ?, result = ?, progress = COALESCE(?, progress), updated_at = ? WHERE project_id = ? AND worker_id = ? AND state = ?",
+                                   (JOB_DONE, json.dumps(result), json.dumps(result["progress"]) if result.get("progress") else None, now, project_id, worker_id, JOB_LEASED)).rowcount
+            self._touch_worker(conn, worker_id, completed=1 if updated else 0)
+        return bool(updated)
+
+class HttpLeaseQueue:
+    """Worker-side stand-in for LeaseQueue on another machine: the same claim/heartbeat/complete calls, sent to
+    the coordinator's /worker/* endpoints (which apply them to its LeaseQueue)."""
+
+    def __init__(self, coordinator_url, token, timeout=30):
+        self.base_url = coordinator_url.rstrip("/")
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {token}"
+        self.timeout = timeout
+        self.lease_seconds = 60 # replaced by the coordinator's value on the first claim
+
+    def _post(self, endpoint, body):
+        response = self.session.post(f"{self.base_url}/worker/{endpoint}", json=body, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def claim(self, worker_id, limit=1, slots=None):
+        reply = self._post("claim", {"worker_id": worker_id, "limit": limit, "slots": slots})
+        self.lease_seconds = reply.get("lease_seconds", self.lease_seconds)
+        return reply["jobs"]
+
+    def heartbeat(self, worker_id, progress):
+        return self._post("heartbeat", {"worker_id": worker_id, "progress": progress})["held"]
+
+    def complete(self, worker_id, project_id, result):
+        return self._post("complete", {"worker_id": worker_id, "project_id": project_id, "result": result})["accepted"]
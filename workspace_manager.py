@@ -0,0 +1,344 @@
+import fcntl
+import itertools
+import json
+import os
+import shutil
+import socket
+import subprocess
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+LEASE_DIR_NAME = ".leases"
+ADMISSION_LOCK_NAME = "admission.lock"
+EVICTING_DIR_NAME = ".evicting" # evicted mirrors moved aside under the admission lock, deleted after it (<id>.<pid>.<n>)
+ADMISSION_POLL_SECONDS = 2.0 # re-checks free space while waiting (other processes don't wake us)
+
+class WorkspaceFull(Exception):
+    """No scratch volume has room for a repository, with nothing in flight that would free any."""
+
+def _mb(byte_count):
+    return f"{byte_count / (1024 * 1024):.1f} MB"
+
+def _tree_size_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try: total += os.lstat(os.path.join(root, name)).st_size
+            except OSError: pass
+    return total
+
+def _pid_alive(pid):
+    try: os.kill(pid, 0)
+    except ProcessLookupError: return False
+    except PermissionError: return True
+    return True
+
+def _filesystem_type(path):
+    """'tmpfs', 'ext4', ... for the mount holding path, from /proc/mounts; None where that isn't available."""
+    path = os.path.realpath(path); mount_point, fs_type = "", None
+    try:
+        with open("/proc/mounts") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3: continue
+                if (path == fields[1] or path.startswith(fields[1].rstrip("/") + "/")) and len(fields[1]) >= len(mount_point): mount_point, fs_type = fields[1], fields[2]
+    except OSError: return None
+    return fs_type
+
+def missing_alternates(git_dir):
+    """Object directories git_dir borrows from (objects/info/alternates) that no longer exist."""
+    return [path for path in _alternates(git_dir) if not os.path.isdir(os.path.join(git_dir, 'objects', path))]
+
+def _alternates(git_dir):
+    try:
+        with open(os.path.join(git_dir, 'objects', 'info', 'alternates')) as f: return [line.strip() for line in f if line.strip()]
+    except OSError: return []
+
+def _remove_git_leftovers(git_dir):
+    """Deletes what a killed git process leaves in a repository: *.lock files and half-written packs. Returns bytes freed."""
+    freed = 0
+    candidates = [os.path.join(git_dir, name) for name in ('config.lock', 'HEAD.lock', 'packed-refs.lock', 'shallow.lock', 'FETCH_HEAD.lock')]
+    for root, _, files in os.walk(os.path.join(git_dir, 'refs')): candidates += [os.path.join(root, name) for name in files if name.endswith('.lock')]
+    pack_dir = os.path.join(git_dir, 'objects', 'pack')
+    if os.path.isdir(pack_dir): candidates += [os.path.join(pack_dir, name) for name in os.listdir(pack_dir) if name.startswith('tmp_') or name.startswith('.tmp-')]
+    for path in candidates:
+        try: size = os.lstat(path).st_size; os.remove(path); freed += size
+        except OSError: pass
+    return freed
+
+class ScratchVolume:
+    """A directory holding cached mirrors (<old project ID>.git). max_repo_bytes caps the repositories placed on it,
+    e.g. a tmpfs that should only take small ones."""
+
+    def __init__(self, path, max_repo_bytes=None):
+        self.path = path
+        self.max_repo_bytes = max_repo_bytes
+        self.fs_type = None # filled in by WorkspaceManager.prepare()
+
+    @property
+    def lease_dir(self):
+        return os.path.join(self.path, LEASE_DIR_NAME)
+
+    def accepts(self, expected_bytes):
+        return self.max_repo_bytes is None or expected_bytes <= self.max_repo_bytes
+
+    def mirror_path(self, project_id):
+        return os.path.join(self.path, f"{project_id}.git")
+
+    def mirror_ids(self):
+        try: names = os.listdir(self.path)
+        except OSError: return []
+        return [int(name[:-4]) for name in names if name.endswith(".git") and name[:-4].isdigit()]
+
+class WorkspaceLease:
+    """A project's claim on its mirror: reserved_bytes of expected growth until settle(), and protection from
+    eviction until released (use as a context manager)."""
+
+    def __init__(self, manager, volume, project_id, reserved_bytes, pins):
+        self.manager = manager
+        self.volume = volume
+        self.project_id = project_id
+        self.reserved_bytes = reserved_bytes
+        self.pins = pins
+        self.path = volume.mirror_path(project_id)
+
+    def settle(self):
+        """The mirror has stopped growing (clone/fetch done): what it uses now shows up in the volume's free space."""
+        self.manager._update_lease(self, 0)
+
+    def release(self):
+        self.manager._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+class WorkspaceManager:
+    """Places cached mirrors on scratch volumes and keeps the disk from filling up partway through a run.
+
+    acquire() reserves a project's expected size (project statistics plus overhead_percent, less what an existing
+    mirror already holds) on a volume with that much free above reserve_bytes. Size-capped volumes (a tmpfs for
+    small repositories) are tried first, then the volume with the most room. When none has room, it evicts the least
+    recently used cached mirrors that no transfer is using or borrowing objects from, or waits for running transfers
+    to settle. Reservations are also written to <volume>/.leases, so worker processes on one machine budget against
+    each other: each admission holds a flock on every volume's .leases/admission.lock from the headroom check through
+    the lease write. Eviction victims are chosen and renamed into <volume>/.evicting under that lock, and deleted once
+    it (and this process's condition) is released; the new lease already counts on their space. Leases left behind by a dead process mark the mirrors cleanup_orphans() repairs
+    or removes.
+    """
+
+    def __init__(self, volumes, reserve_bytes, overhead_percent=50, unknown_size_bytes=256 * 1024 * 1024, evict=True, log=print):
+        self.volumes = volumes
+        self.reserve_bytes = reserve_bytes
+        self.overhead_percent = overhead_percent
+        self.unknown_size_bytes = unknown_size_bytes
+        self.evict = evict
+        self.log = log
+        self._host = socket.gethostname()
+        self._condition = threading.Condition()
+        self._leases = {} # project ID -> WorkspaceLease held by this process
+        self._evict_seq = itertools.count()
+        self.waiting = 0
+        self.evicted = 0
+        self.evicted_bytes = 0
+        self.orphans_removed = 0
+        self.orphan_bytes_freed = 0
+
+    def prepare(self):
+        """Creates the volumes and cleans up after crashed runs; call before the first acquire()."""
+        for volume in self.volumes:
+            os.makedirs(volume.lease_dir, exist_ok=True)
+            volume.fs_type = _filesystem_type(volume.path)
+        self.cleanup_orphans()
+
+    def expected_bytes(self, size_bytes):
+        base = self.unknown_size_bytes if size_bytes is None else size_bytes
+        return base * (100 + self.overhead_percent) // 100
+
+    def find_mirror(self, project_id):
+        """Path of the project's cached mirror on whichever volume holds it, or None."""
+        for volume in self.volumes:
+            path = volume.mirror_path(project_id)
+            if os.path.isdir(path): return path
+        return None
+
+    # --- Leases (shared with other processes through <volume>/.leases) ---
+    def _lease_file(self, volume, project_id):
+        return os.path.join(volume.lease_dir, f"{project_id}.json")
+
+    def _write_lease(self, lease):
+        record = {"pid": os.getpid(), "host": self._host, "reserved_bytes": lease.reserved_bytes, "pins": list(lease.pins), "since": time.time()}
+        tmp_path = self._lease_file(lease.volume, lease.project_id) + ".tmp"
+        with open(tmp_path, "w") as f: json.dump(record, f)
+        os.replace(tmp_path, self._lease_file(lease.volume, lease.project_id))
+
+    def _read_leases(self, volume):
+        """{project ID: lease record} for volume, live or not."""
+        leases = {}
+        try: names = os.listdir(volume.lease_dir)
+        except OSError: return leases
+        for name in names:
+            if not name.endswith(".json") or not name[:-5].isdigit(): continue
+            try:
+                with open(os.path.join(volume.lease_dir, name)) as f: leases[int(name[:-5])] = json.load(f)
+            except (OSError, ValueError): pass
+        return leases
+
+    def _is_live(self, record):
+        return record.get("host") != self._host or _pid_alive(record.get("pid", -1))
+
+    def _live_leases(self, volume):
+        return {project_id: record for project_id, record in self._read_leases(volume).items() if self._is_live(record)}
+
+    @contextmanager
+    def _admission_lock(self):
+        """Exclusive flock on each volume's admission.lock (in path order, so processes can't deadlock): no other process
+        checks headroom, evicts or writes a lease until it is released."""
+        with ExitStack() as stack:
+            for lease_dir in sorted({os.path.realpath(volume.lease_dir) for volume in self.volumes}):
+                lock_file = stack.enter_context(open(os.path.join(lease_dir, ADMISSION_LOCK_NAME), "a"))
+                fcntl.flock(lock_file, fcntl.LOCK_EX) # released when the file is closed
+            yield
+
+    def _headroom(self, volume, live_leases):
+        free = shutil.disk_usage(volume.path).free
+        return free - self.reserve_bytes - sum(record.get("reserved_bytes", 0) for record in live_leases.values())
+
+    def acquire(self, project_id, size_bytes, pins=()):
+        """Blocks until the project's mirror has room somewhere; returns its WorkspaceLease. pins: project IDs whose
+        mirrors this one borrows objects from (kept from eviction). Raises WorkspaceFull if it can never fit."""
+        expected = self.expected_bytes(size_bytes); waiting_since = None
+        existing = next((volume for volume in self.volumes if os.path.isdir(volume.mirror_path(project_id))), None)
+        if existing is not None and not existing.accepts(expected):
+            self.log(f"Cached mirror of project {project_id} has outgrown '{existing.path}' (expected {_mb(expected)}). Moving it to another volume.")
+            shutil.rmtree(existing.mirror_path(project_id), ignore_errors=True); existing = None
+        if existing is not None: candidates = [existing]; needed = max(0, expected - _tree_size_bytes(existing.mirror_path(project_id)))
+        else: candidates = [volume for volume in self.volumes if volume.accepts(expected)]; needed = expected
+        if not candidates or all(needed > shutil.disk_usage(volume.path).total - self.reserve_bytes for volume in candidates):
+            raise WorkspaceFull(f"Repository needs about {_mb(expected)} and does not fit on any scratch volume")
+        evicted = []
+        with self._condition:
+            try:
+                while True:
+                    with self._admission_lock():
+                        live = {volume.path: self._live_leases(volume) for volume in candidates}
+                        volume = self._pick_volume(candidates, live, needed)
+                        if volume is None and self.evict: volume, evicted = self._evict_for(candidates, live, needed, project_id)
+                        if volume is not None:
+                            lease = WorkspaceLease(self, volume, project_id, needed, tuple(pins))
+                            self._write_lease(lease); self._leases[project_id] = lease
+                            break
+                    if not any(live.values()):
+                        raise WorkspaceFull(f"Not enough free disk space: repository needs about {_mb(needed)} on a scratch volume "
+                                            f"(keeping {_mb(self.reserve_bytes)} free on each) and no cached mirror can be evicted")
+                    if waiting_since is None:
+                        waiting_since = time.monotonic(); self.waiting += 1
+                        self.log(f"Waiting for disk space for project {project_id} (needs about {_mb(needed)}).")
+                    self._condition.wait(ADMISSION_POLL_SECONDS)
+            finally:
+                if waiting_since is not None: self.waiting -= 1
+        # Deleting can take a while for large mirrors; other admissions go ahead meanwhile (they see less free space
+        # than there will be, never more).
+        for mirror_id, trash_path, size in evicted:
+            shutil.rmtree(trash_path, ignore_errors=True)
+            self.log(f"Evicted cached mirror of project {mirror_id} from '{volume.path}' ({_mb(size)}) to make room.")
+        return lease
+
+    def _pick_volume(self, candidates, live, needed):
+        fitting = [(volume, self._headroom(volume, live[volume.path])) for volume in candidates]
+        fitting = [(volume, headroom) for volume, headroom in fitting if headroom >= needed]
+        if not fitting: return None
+        # Capped volumes (smallest cap first) take what they accept, so large disks keep room for large repositories.
+        return min(fitting, key=lambda item: (item[0].max_repo_bytes is None, item[0].max_repo_bytes or 0, -item[1]))[0]
+
+    def _pinned_ids(self):
+        """Mirrors that must stay: in use by any process, borrowed from by another mirror, or pinned by a lease."""
+        pinned = set()
+        for volume in self.volumes:
+            for project_id, record in self._live_leases(volume).items(): pinned.add(project_id); pinned.update(record.get("pins", ()))
+            for project_id in volume.mirror_ids():
+                for objects_dir in _alternates(volume.mirror_path(project_id)):
+                    name = os.path.basename(os.path.dirname(os.path.normpath(objects_dir)))
+                    if name.endswith(".git") and name[:-4].isdigit(): pinned.add(int(name[:-4]))
+        return pinned
+
+    def _evict_for(self, candidates, live, needed, project_id):
+        """Moves least recently used idle mirrors out of the cache on the first candidate volume where that makes room.
+        Returns (volume, [(mirror ID, path moved to, bytes)]) for the caller to delete, or (None, [])."""
+        pinned = self._pinned_ids() | {project_id}
+        for volume in candidates:
+            headroom = self._headroom(volume, live[volume.path])
+            idle = [(os.stat(volume.mirror_path(mirror_id)).st_mtime, mirror_id) for mirror_id in volume.mirror_ids() if mirror_id not in pinned]
+            sizes = {mirror_id: _tree_size_bytes(volume.mirror_path(mirror_id)) for _, mirror_id in idle}
+            if headroom + sum(sizes.values()) < needed: continue
+            evicting_dir = os.path.join(volume.path, EVICTING_DIR_NAME); os.makedirs(evicting_dir, exist_ok=True)
+            evicted = []
+            for _, mirror_id in sorted(idle):
+                if headroom >= needed: break
+                trash_path = os.path.join(evicting_dir, f"{mirror_id}.{os.getpid()}.{next(self._evict_seq)}")
+                try: os.rename(volume.mirror_path(mirror_id), trash_path) # same filesystem: instant, and no longer a mirror
+                except OSError: continue
+                evicted.append((mirror_id, trash_path, sizes[mirror_id]))
+                headroom += sizes[mirror_id]; self.evicted += 1; self.evicted_bytes += sizes[mirror_id]
+            return volume, evicted
+        return None, []
+
+    def _update_lease(self, lease, reserved_bytes):
+        with self._condition:
+            lease.reserved_bytes = reserved_bytes; self._write_lease(lease)
+            self._condition.notify_all()
+
+    def _release(self, lease):
+        with self._condition:
+            if self._leases.get(lease.project_id) is lease: del self._leases[lease.project_id]
+            try: os.remove(self._lease_file(lease.volume, lease.project_id))
+            except OSError: pass
+            if os.path.isdir(lease.path): os.utime(lease.path) # least recently used goes first when evicting
+            self._condition.notify_all()
+
+    # --- Cleanup and reporting ---
+    def cleanup_orphans(self):
+        """Repairs or removes mirrors left behind by crashed runs. A mirror whose lease belongs to a dead process loses
+        its lock files and half-written packs, and is deleted if that leaves it without refs; mirrors that borrow
+        objects from a mirror that is gone are deleted. Returns (mirrors removed, bytes freed)."""
+        removed = 0; freed = 0
+        with self._admission_lock(): # a mirror another process is admitting right now isn't an orphan
+            for volume in self.volumes:
+                leases = self._read_leases(volume)
+                for project_id in volume.mirror_ids():
+                    path = volume.mirror_path(project_id); record = leases.get(project_id)
+                    if record is not None and self._is_live(record): continue
+                    freed += _remove_git_leftovers(path)
+                    broken = bool(missing_alternates(path))
+                    if record is not None and not broken:
+                        refs = subprocess.run(['git', '--git-dir', path, 'for-each-ref', '--count=1'], capture_output=True, text=True)
+                        broken = refs.returncode != 0 or not refs.stdout.strip()
+                    if broken:
+                        size = _tree_size_bytes(path); shutil.rmtree(path, ignore_errors=True); removed += 1; freed += size
+                for project_id, record in leases.items():
+                    if not self._is_live(record):
+                        try: os.remove(self._lease_file(volume, project_id))
+                        except OSError: pass
+                evicting_dir = os.path.join(volume.path, EVICTING_DIR_NAME)
+                for name in os.listdir(evicting_dir) if os.path.isdir(evicting_dir) else []:
+                    pid = name.split(".")[1] if name.count(".") == 2 else ""
+                    if pid.isdigit() and _pid_alive(int(pid)): continue # still being deleted by the process that evicted it
+                    path = os.path.join(evicting_dir, name); size = _tree_size_bytes(path); shutil.rmtree(path, ignore_errors=True); freed += size
+        self.orphans_removed += removed; self.orphan_bytes_freed += freed
+        if removed or freed: self.log(f"Workspace cleanup: removed {removed} orphaned mirrors, freed {_mb(freed)}.")
+        return removed, freed
+
+    def usage(self):
+        """Per-volume disk figures plus admission/eviction counters, for the status API."""
+        volumes = []
+        for volume in self.volumes:
+            try: disk = shutil.disk_usage(volume.path)
+            except OSError: continue
+            live = self._live_leases(volume)
+            volumes.append({"path": volume.path, "fs_type": volume.fs_type, "max_repo_bytes": volume.max_repo_bytes, "total_bytes": disk.total, "used_bytes": disk.used,
+                            "free_bytes": disk.free, "reserved_bytes": sum(record.get("reserved_bytes", 0) for record in live.values()), "leases": len(live)})
+        return {"volumes": volumes, "reserve_bytes": self.reserve_bytes, "active": len(self._leases), "waiting": self.waiting,
+                "evicted": self.evicted, "evicted_bytes": self.evicted_bytes, "orphans_removed": self.orphans_removed, "orphan_bytes_freed": self.orphan_bytes_freed}